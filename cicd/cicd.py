@@ -24,12 +24,8 @@ with jci.Pipeline() as p:
     should = parse_commit(p.repo)
     jcienv = f"jcienv:{p.repo.sha}"
     with p.stage("build_and_test"):
-        p.job("JciEnv", f"docker build  --target jcienv -t jcienv:{p.repo.sha} .")
-        p.job(
-            "Jci",
-            f"docker build  --target jci -t jci:{p.repo.sha} .",
-            depends_on=["JciEnv"],
-        )
+        p.build("JciEnv", tag=jcienv, target="jcienv")
+        p.build("Jci", tag=f"jci:{p.repo.sha}", target="jci", depends_on=["JciEnv"])
         kwargs = dict(image=jcienv, depends_on=["JciEnv"])
         p.job("black", "python3 -m black --check .", **kwargs)
         p.job("pylint", "python3 -m pylint jaypore_ci/ tests/", **kwargs)
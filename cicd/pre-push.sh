@@ -5,6 +5,41 @@ set -o nounset
 set -o pipefail
 
 
+checkout() {
+    # Materialize only the tracked content of $SHA in /jaypore_ci/run instead
+    # of copying the whole working tree (build artifacts, large untracked
+    # files etc.) and deleting most of it again. /jaypore_ci/repo is part of
+    # the image while /jaypore_ci/run is a bind mount, so they are on
+    # different filesystems and the local clone copies the git objects
+    # instead of hardlinking them.
+    if [ -z "$(ls -A /jaypore_ci/run)" ]; then
+        git clone --quiet --local --no-checkout /jaypore_ci/repo /jaypore_ci/run
+    fi
+    cd /jaypore_ci/run/
+    git fetch --quiet /jaypore_ci/repo
+    # Keep the remotes of the original repo, Jaypore CI uses them to find
+    # where to publish the status.
+    cp /jaypore_ci/repo/.git/config /jaypore_ci/run/.git/config
+    BRANCH=$(git -C /jaypore_ci/repo rev-parse --abbrev-ref HEAD)
+    if [ "$BRANCH" = "HEAD" ]; then
+        # Pushed from a detached HEAD, there is no branch to recreate
+        GIT_LFS_SKIP_SMUDGE=1 git checkout --quiet --force --detach $SHA
+    else
+        GIT_LFS_SKIP_SMUDGE=1 git checkout --quiet --force -B "$BRANCH" $SHA
+    fi
+    git clean -fdxq
+    if [ -f .gitmodules ]; then
+        git submodule sync --quiet --recursive
+        git submodule update --quiet --init --recursive
+    fi
+    if grep -qs "filter=lfs" .gitattributes && git lfs version &> /dev/null; then
+        # Use the objects the original repo has already downloaded
+        git config lfs.storage /jaypore_ci/repo/.git/lfs
+        git lfs checkout
+    fi
+}
+
+
 run() {
     if [ -z ${ENV+x} ]; then
         echo "ENV : ? -> SKIP sourcing from secrets."
@@ -13,9 +48,7 @@ run() {
         echo "---"
         source /jaypore_ci/repo/secrets/bin/set_env.sh $ENV
     fi
-    cp -r /jaypore_ci/repo/. /jaypore_ci/run
-    cd /jaypore_ci/run/
-    git clean -fdx
+    checkout
     # Change the name of the file if this is not cicd.py
     echo "---- Container ID:"
     cat /jaypore_ci/cidfiles/$SHA
@@ -31,13 +64,13 @@ hook() {
     JAYPORE_CODE_DIR=$( cd -- "$( dirname -- "${BASH_SOURCE[0]}" )" &> /dev/null && pwd )
     JAYPORE_CODE_DIR=$(basename $JAYPORE_CODE_DIR)
     # We will mount the current dir into /jaypore_ci/repo
-    # Then we will copy things over to /jaypore_ci/run
-    # Then we will run git clean to remove anything that is not in git
+    # Then we will check out the tracked files of $SHA into /jaypore_ci/run
     # Then we call the actual cicd code
     #
     # We also pass docker.sock and the docker executable to the run so that
     # jaypore_ci can create docker containers
     mkdir -p /tmp/jayporeci__cidfiles &> /dev/null
+    mkdir -p /tmp/jayporeci__state &> /dev/null
     echo '----------------------------------------------'
     echo "Jaypore CI"
     echo "Building image    : "
@@ -52,9 +85,14 @@ hook() {
         --name jayporeci__pipe__$SHA \
         -e JAYPORE_CODE_DIR=$JAYPORE_CODE_DIR \
         -e SHA=$SHA \
+        -e JAYPORECI_PLAN \
+        -e JAYPORECI_PROFILE \
+        -e JAYPORECI_LOG_LEVEL \
+        -e JAYPORECI_LOG_FILE \
         -v /var/run/docker.sock:/var/run/docker.sock \
         -v /tmp/jayporeci__src__$SHA:/jaypore_ci/run \
         -v /tmp/jayporeci__cidfiles:/jaypore_ci/cidfiles:ro \
+        -v /tmp/jayporeci__state:/jaypore_ci/state \
         --cidfile /tmp/jayporeci__cidfiles/$SHA \
         --workdir /jaypore_ci/run \
         im_jayporeci__pipe__$SHA \
@@ -1,6 +1,6 @@
 from jaypore_ci import jci
 
-pipeline = jci.Pipeline(poll_interval=0)
+pipeline = jci.Pipeline(plan=True)
 with pipeline as p:
     for name in "pq":
         p.job(name, name)
@@ -10,5 +10,7 @@ with pipeline as p:
     for name in "ab":
         p.job(name, name)
 
-order = pipeline.executor.get_execution_order()
-# assert order["x"] < order["y"] < order["z"]
+plan = pipeline.get_plan()
+assert not plan.errors
+assert plan.start["x"] < plan.start["y"] < plan.start["z"]
+assert plan.critical_path == ["x", "y", "z"]
@@ -1,4 +1,5 @@
 from jaypore_ci import jci
+from jaypore_ci.interfaces import Probe
 
 # Services immediately return with a PASSED status
 # If they exit with a Non ZERO code they are marked as FAILED, otherwise
@@ -8,9 +9,16 @@ with jci.Pipeline() as p:
     # Since we define all jobs in this section as `is_service=True`, they will
     # keep running for as long as the pipeline runs.
     with p.stage("Services", is_service=True):
-        p.job("Mysql", None, image="mysql")
-        p.job("Redis", None, image="redis")
-        p.job("Api", "python3 -m src.run_api", image="python:3.11")
+        # Services with a probe are only PASSED once the probe succeeds, so
+        # the Testing stage starts as soon as they are actually ready.
+        p.job("Mysql", None, image="mysql", probe=Probe.tcp(3306))
+        p.job("Redis", None, image="redis", probe=Probe.command("redis-cli ping"))
+        p.job(
+            "Api",
+            "python3 -m src.run_api",
+            image="python:3.11",
+            probe=Probe.http(8000, "/health"),
+        )
 
     with p.stage("Testing"):
         p.job("Unit", "pytest -m unit_tests tests")
@@ -0,0 +1,30 @@
+"""
+Lazy imports for packages with many backends, so that the runner does not pay
+for importing the dependencies of backends it never uses.
+"""
+import sys
+import importlib
+from typing import Dict
+
+
+def module_getattr(package: str, name_to_module: Dict[str, str]):
+    """
+    Returns the `__getattr__` and `__dir__` functions of a package that
+    imports each name in `name_to_module` from it's submodule the first time
+    it is used. The submodules themselves can be used as attributes too.
+    """
+
+    def __getattr__(name):
+        module = name_to_module.get(name, name)
+        if module not in name_to_module.values():
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = importlib.import_module(f".{module}", package)
+        if module != name:
+            value = getattr(value, name)
+        setattr(sys.modules[package], name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[package])) | set(name_to_module))
+
+    return __getattr__, __dir__
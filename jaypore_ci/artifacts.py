@@ -0,0 +1,134 @@
+"""
+A content addressed store for passing files between jobs.
+
+Jobs declare `outputs` (paths relative to the repo checkout) and `inputs`
+(names of jobs whose outputs they need). Once a job passes, it's outputs are
+hashed and copied into the store. Identical files are only stored once, no
+matter which job or commit produced them.
+
+Before a job that declares inputs is run, a view is built for it out of hard
+links to the stored files. Executors expose this view to the job read-only, so
+parallel jobs can never overwrite each other's inputs.
+
+Stored files count towards the disk budget of
+:meth:`~jaypore_ci.executors.docker.Docker.collect_garbage` and are removed in
+least recently used order once no view links to them.
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+from jaypore_ci.logging import logger
+
+Manifest = Dict[str, str]
+
+
+class MissingOutput(Exception):
+    """
+    Raised when a job has passed but a declared output does not exist.
+    """
+
+
+class Store:
+    """
+    :param root:      Where the store lives as seen by the pipeline.
+    :param host_root: Where the store lives on the docker host. Executors that
+                      mount views into containers use this. Set it to `None`
+                      when the pipeline is not running inside a container.
+    """
+
+    def __init__(
+        self,
+        root: str = "/jaypore_ci/state/artifacts",
+        host_root: str = "/tmp/jayporeci__state/artifacts",
+    ):
+        self.root = Path(root)
+        self.host_root = Path(host_root if host_root is not None else root)
+
+    def logging(self):
+        return logger.bind(artifact_store=str(self.root))
+
+    def object_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / digest
+
+    def put(self, path: Path) -> str:
+        """
+        Add a file to the store and return it's digest. Files that are already
+        stored are not copied again.
+        """
+        sha = hashlib.sha256()
+        with open(path, "rb") as fl:
+            for chunk in iter(lambda: fl.read(1 << 20), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        target = self.object_path(digest)
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=target.parent)
+            os.close(fd)
+            shutil.copyfile(path, tmp)
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, target)
+        else:
+            # Marks it as recently used for :mod:`~jaypore_ci.cleanup`
+            os.utime(target)
+        return digest
+
+    def snapshot(self, base_dir: str, outputs: List[str]) -> Manifest:
+        """
+        Store all files matched by the `outputs` globs inside `base_dir` and
+        return a manifest mapping their relative paths to digests. Directories
+        are stored recursively.
+        """
+        base_dir = Path(base_dir)
+        manifest = {}
+        for pattern in outputs:
+            matches = list(base_dir.glob(pattern))
+            if not matches:
+                raise MissingOutput(f"Output not found: {pattern}")
+            for match in matches:
+                files = [match] if match.is_file() else match.rglob("*")
+                for path in files:
+                    if path.is_file():
+                        rel = str(path.relative_to(base_dir))
+                        manifest[rel] = self.put(path)
+        self.logging().info("Snapshot", files=len(manifest))
+        return manifest
+
+    def view(self, key: str, manifests: Dict[str, Manifest]) -> Path:
+        """
+        Build a directory at `views/<key>` that contains
+        `<job name>/<relative path>` for every file in the given manifests and
+        return it's path.
+
+        Files are hard linked from the store when possible and copied
+        otherwise.
+        """
+        view = self.root / "views" / key
+        shutil.rmtree(view, ignore_errors=True)
+        view.mkdir(parents=True)
+        for name, manifest in manifests.items():
+            for rel, digest in manifest.items():
+                target = view / name / rel
+                target.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(self.object_path(digest), target)
+                except OSError:
+                    shutil.copyfile(self.object_path(digest), target)
+        return view
+
+    def host_path(self, path: Path) -> Path:
+        """
+        Translate a path inside the store to the same path on the docker host.
+        """
+        return self.host_root / Path(path).relative_to(self.root)
+
+    def release(self, key: str):
+        """
+        Remove the view at `views/<key>` along with any views nested in it.
+        Stored files are kept so that they can be reused.
+        """
+        shutil.rmtree(self.root / "views" / key, ignore_errors=True)
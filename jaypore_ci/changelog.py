@@ -12,8 +12,134 @@ version_map = {
                 f"{NEW}: Old networks will also be removed automatically for "
                 "jobs that are older than a week."
             ),
+            (
+                f"{NEW}: Jobs can be run directly on the host without docker "
+                "using the `executors.Subprocess` executor."
+            ),
+            (
+                f"{NEW}: Jobs whose command is a python callable are now run "
+                "on a thread pool (configurable via `python_pool`) and their "
+                "output is shown in the job logs."
+            ),
+            (
+                f"{NEW}: `jci.AsyncPipeline` runs the pipeline on an asyncio "
+                "event loop, checking jobs and publishing reports concurrently. "
+                "Existing executors and remotes work with it as is."
+            ),
+            (
+                f"{NEW}: Service jobs accept a readiness `probe` (TCP, HTTP or "
+                "a command) and are only marked as passed once it succeeds."
+            ),
+            (
+                f"{BUGFIX}: Service jobs without a command are now started by "
+                "the executor."
+            ),
+            (
+                f"{NEW}: Service jobs with `reuse=...` are shared across "
+                "pipelines on the same host and removed once they have been "
+                "idle for a while."
+            ),
+            (
+                f"{NEW}: `p.build(...)` creates jobs that build docker images "
+                "through the docker API, reusing the previous build of the "
+                "branch as a cache and streaming progress into the job logs."
+            ),
+            (
+                f"{CHANGE}: `pre-push.sh` now checks out only the tracked "
+                "files of the commit being tested instead of copying the "
+                "entire repo folder for every push. Submodules and git LFS "
+                "files are checked out too and pushes from a detached HEAD "
+                "work."
+            ),
+            (
+                f"{NEW}: `executors.Docker(disk_budget=...)` removes the least "
+                "recently used source checkouts, runner images and stored job "
+                "outputs after a pipeline so that they fit in the given budget."
+            ),
+            (
+                f"{NEW}: Jobs can declare `outputs` and `inputs`. Outputs are "
+                "saved in a content addressed store and mounted read-only into "
+                "the jobs that need them."
+            ),
+            (
+                f"{NEW}: A Chrome trace of each run is saved at "
+                "`/jaypore_ci/run/jaypore_ci.trace.json` and can be opened in "
+                "Perfetto to find the critical path."
+            ),
+            (
+                f"{NEW}: Docker API, publish and render latencies, job counts, "
+                "queue depth and trigger lag are exported in Prometheus "
+                "textfile format at `/tmp/jayporeci__state/metrics`."
+            ),
+            (
+                f"{NEW}: Set `JAYPORECI_PROFILE=1` (or `report`) to profile the "
+                "pipeline runner and save / publish a summary of the slowest "
+                "functions."
+            ),
+            (
+                f"{CHANGE}: Executors, remotes and reporters are imported only "
+                "when used, which makes `import jaypore_ci.jci` much faster."
+            ),
+            (
+                f"{CHANGE}: Runner logs are written by a background thread and "
+                "debug logs are skipped unless `JAYPORECI_LOG_LEVEL=DEBUG` is "
+                "set. `JAYPORECI_LOG_FILE` also writes them to a file."
+            ),
+            (
+                f"{NEW}: Every pipeline run and it's jobs are recorded in a "
+                "SQLite database at `/tmp/jayporeci__state/history.sqlite`."
+            ),
+            (
+                f"{NEW}: `executors.Docker(resume=True)` reuses the job "
+                "containers of a pipeline for the same commit whose runner "
+                "died, instead of running every job again."
+            ),
+            (
+                f"{NEW}: Jobs can be retried when they fail using `retries=` "
+                "and `retry_on=` (exit codes, `jci.OOM_KILLED` or log "
+                "patterns), with exponential backoff between attempts."
+            ),
+            (
+                f"{NEW}: `fail_fast=True` on a pipeline or stage stops the "
+                "remaining jobs of a stage as soon as one fails and publishes "
+                "the final report right away."
+            ),
+            (
+                f"{NEW}: Starting a pipeline cancels running pipelines of "
+                "older commits on the same branch. Use "
+                "`executors.Docker(cancel_superseded=False)` to turn this off."
+            ),
+            (
+                f"{NEW}: An optional scheduler daemon (`python3 -m "
+                "jaypore_ci.daemon`) limits how many jobs run at once on a "
+                "host and shares slots fairly between branches and repos."
+            ),
+            (
+                f"{NEW}: `env_matrix` accepts `include`, `exclude`, "
+                '`mode="pairwise"`, `shard` and `sample` to keep large job '
+                "matrices small."
+            ),
+            (
+                f"{NEW}: `sharded_job` splits a pytest command between several "
+                "jobs of about the same duration, using the test durations of "
+                "the last passing run. The shards need `jaypore_ci` installed "
+                "in their image."
+            ),
+            (
+                f"{CHANGE}: Jobs use much less memory and pipelines with "
+                "thousands of jobs are built several times faster. `JAYPORE_` "
+                "environment variables are now read once per pipeline instead "
+                "of every time a job starts."
+            ),
+            (
+                f"{NEW}: `JAYPORECI_PLAN=1` checks the pipeline and prints when "
+                "each job is expected to run, the critical path and the total "
+                "time, without running anything."
+            ),
+        ],
+        "instructions": [
+            "Please run the Jaypore CI setup once again.",
         ],
-        "instructions": [],
     },
     V("0.2.30"): {
         "changes": [
@@ -0,0 +1,256 @@
+"""
+Keeps the disk used by Jaypore CI on a host within a budget.
+
+Every push leaves behind a source directory (`/tmp/jayporeci__src__<sha>`) and
+a runner image (`im_jayporeci__pipe__<sha>`), and the outputs of it's jobs are
+kept in the :mod:`artifact store <jaypore_ci.artifacts>`. These are evicted in
+least recently used order until their total size fits in the budget. The last
+use of a commit is the latest of it's source directory's modification time and
+it's image's creation time. The last use of a stored output is when a job last
+produced it. Stored outputs that are linked into a view of a running pipeline
+are never removed.
+
+This is usually run in a low priority container after a pipeline has finished
+by :meth:`~jaypore_ci.executors.docker.Docker.collect_garbage`, but it can also
+be run by hand:
+
+.. code-block:: console
+
+    python3 -m jaypore_ci.cleanup --root /tmp --budget 20G
+"""
+import os
+import shutil
+import argparse
+from pathlib import Path
+from typing import NamedTuple, List
+
+import docker
+import pendulum
+
+from jaypore_ci.logging import logger
+
+SRC_PREFIX = "jayporeci__src__"
+STORE_DIR = "jayporeci__state/artifacts"
+IMAGE_PREFIX = "im_jayporeci__pipe__"
+UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+class Artifact(NamedTuple):
+    sha: str
+    path: Path
+    image: str
+    src_size: int
+    image_size: int
+    last_used: float
+
+    @property
+    def size(self) -> int:
+        return self.src_size + self.image_size
+
+
+def parse_size(size: str) -> int:
+    """
+    Parse sizes like `500M` or `20G` into bytes.
+    """
+    size = str(size).strip().upper().rstrip("B")
+    unit = size[-1] if size and size[-1] in UNITS else ""
+    return int(float(size[: len(size) - len(unit)]) * UNITS[unit])
+
+
+def dir_size(path: Path) -> int:
+    """
+    Size of all files inside a directory without following symlinks.
+    """
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            else:
+                total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+def find_artifacts(root: Path, client=None) -> List[Artifact]:
+    """
+    Find all source directories inside `root` and, if a docker client is
+    given, all runner images.
+    """
+    found = {}
+    for path in Path(root).glob(f"{SRC_PREFIX}*"):
+        sha = path.name[len(SRC_PREFIX) :]
+        found[sha] = Artifact(
+            sha=sha,
+            path=path,
+            image=None,
+            src_size=dir_size(path),
+            image_size=0,
+            last_used=path.stat().st_mtime,
+        )
+    for image in client.images.list() if client is not None else []:
+        for tag in image.tags:
+            if not tag.startswith(IMAGE_PREFIX):
+                continue
+            sha = tag[len(IMAGE_PREFIX) :].split(":")[0]
+            created = pendulum.parse(image.attrs["Created"]).timestamp()
+            old = found.get(sha, Artifact(sha, None, None, 0, 0, 0))
+            found[sha] = old._replace(
+                image=tag,
+                image_size=image.attrs["Size"],
+                last_used=max(old.last_used, created),
+            )
+    return list(found.values())
+
+
+def find_stored_outputs(store: Path) -> List[Artifact]:
+    """
+    Files in the artifact store. They do not belong to a single commit so
+    their `sha` is `None`.
+    """
+    found = []
+    for path in Path(store).glob("objects/*/*"):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        found.append(
+            Artifact(
+                sha=None,
+                path=path,
+                image=None,
+                src_size=stat.st_size,
+                image_size=0,
+                last_used=stat.st_mtime,
+            )
+        )
+    return found
+
+
+def in_view(artifact: Artifact) -> bool:
+    """
+    Is this a stored output that is linked into the view of a running
+    pipeline?
+    """
+    if artifact.sha is not None:
+        return False
+    try:
+        return artifact.path.stat().st_nlink > 1
+    except OSError:
+        return False
+
+
+def remove_path(artifact: Artifact) -> int:
+    """
+    Remove a source directory or stored output and return how many bytes
+    were freed.
+    """
+    if artifact.path.is_dir():
+        shutil.rmtree(artifact.path, ignore_errors=True)
+        return artifact.src_size - dir_size(artifact.path)
+    try:
+        artifact.path.unlink()
+    except OSError as e:
+        logger.warning("Could not remove file", path=str(artifact.path), e=e)
+        return 0
+    return artifact.src_size
+
+
+def running_shas(client) -> List[str]:
+    """
+    Commits for which a pipeline is currently running.
+    """
+    return [
+        container.name[len("jayporeci__pipe__") :]
+        for container in client.containers.list(
+            filters={"name": "jayporeci__pipe__", "status": "running"}
+        )
+    ]
+
+
+def remove_image(client, artifact: Artifact) -> bool:
+    """
+    Remove the runner image of a commit, and the exited runner container that
+    still uses it. Returns `True` if the image was removed.
+    """
+    try:
+        runner = client.containers.get(f"jayporeci__pipe__{artifact.sha}")
+        if runner.status != "running":
+            runner.remove(v=True)
+    except docker.errors.NotFound:
+        pass
+    except docker.errors.APIError as e:
+        logger.warning("Could not remove runner", sha=artifact.sha, e=e)
+    try:
+        client.images.remove(artifact.image)
+    except docker.errors.APIError as e:
+        logger.warning("Could not remove image", image=artifact.image, e=e)
+        return False
+    return True
+
+
+def collect(  # pylint: disable=too-many-arguments
+    root: Path, budget: int, *, keep=(), client=None, store: Path = None
+) -> List[str]:
+    """
+    Remove the least recently used source directories, images and stored
+    outputs until the total size is within `budget` bytes. Commits in `keep`
+    and commits that have a running pipeline are never removed. The artifact
+    store is looked for at `<root>/jayporeci__state/artifacts` unless `store`
+    is given.
+
+    Returns the list of commits that were removed completely.
+    """
+    keep = set(keep) | set(running_shas(client) if client is not None else [])
+    for sha in keep:
+        path = Path(root) / f"{SRC_PREFIX}{sha}"
+        if path.exists():
+            os.utime(path)
+    store = Path(store if store is not None else Path(root) / STORE_DIR)
+    artifacts = sorted(
+        find_artifacts(root, client) + find_stored_outputs(store),
+        key=lambda a: a.last_used,
+    )
+    total = sum(a.size for a in artifacts)
+    evicted = []
+    for artifact in artifacts:
+        if total <= budget:
+            break
+        if artifact.sha in keep or in_view(artifact):
+            continue
+        logger.info("Evict", sha=artifact.sha, size=artifact.size)
+        freed = 0
+        if artifact.path is not None:
+            freed += remove_path(artifact)
+        if artifact.image is not None and remove_image(client, artifact):
+            freed += artifact.image_size
+        total -= freed
+        if freed == artifact.size and artifact.sha is not None:
+            evicted.append(artifact.sha)
+    return evicted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--root", default="/tmp", help="Where source dirs live")
+    parser.add_argument("--budget", required=True, help="Like 500M or 20G")
+    parser.add_argument("--keep", nargs="*", default=[], help="SHAs to keep")
+    parser.add_argument("--no-images", action="store_true", help="Skip images")
+    parser.add_argument("--store", default=None, help="The artifact store")
+    args = parser.parse_args()
+    client = None if args.no_images else docker.from_env()
+    collect(
+        args.root,
+        parse_size(args.budget),
+        keep=args.keep,
+        client=client,
+        store=args.store,
+    )
+
+
+if __name__ == "__main__":
+    main()
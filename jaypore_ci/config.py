@@ -3,6 +3,7 @@ import tomllib
 from typing import NamedTuple
 import importlib.metadata
 from pathlib import Path
+from functools import cached_property
 
 
 class Version(NamedTuple):
@@ -49,11 +50,19 @@ def get_version() -> Version:
             return None
 
 
-class Const(NamedTuple):
+class Const:
+    """
+    The installed version is only looked up when it is needed since that can
+    mean reading `pyproject.toml`.
+    """
+
     expected_version: Version = Version.parse(
         os.environ.get("EXPECTED_JAYPORECI_VERSION")
     )
-    version: Version = get_version()
+
+    @cached_property
+    def version(self) -> Version:
+        return get_version()
 
 
 const = Const()
@@ -0,0 +1,278 @@
+"""
+A host wide job scheduler for Jaypore CI.
+
+Every push starts it's own runner, so without coordination all pipelines on a
+host start their jobs at the same time and compete for the docker daemon. The
+scheduler daemon hands out a fixed number of slots to jobs of all pipelines on
+the host, across repos. Pending jobs are served with weighted fair queuing per
+branch so that one branch with many pushes cannot starve the others, and
+branches like `main` can be given a bigger share.
+
+Run it on the host, next to the state that runners share:
+
+.. code-block:: console
+
+    python3 -m jaypore_ci.daemon --socket /tmp/jayporeci__state/jayporeci.sock \\
+        --budget 8 --weight main=4
+
+and have pipelines use it:
+
+.. code-block:: python
+
+    from jaypore_ci import jci, daemon
+
+    with jci.Pipeline(daemon_client=daemon.Client()) as p:
+        ...
+
+A job holds it's slot for as long as the connection it asked for it on is
+open. Slots of runners that die are therefore freed automatically. If the
+daemon is not running, jobs are run without waiting for a slot.
+"""
+import os
+import json
+import heapq
+import select
+import socket
+import argparse
+import threading
+import socketserver
+from itertools import count
+
+from jaypore_ci.logging import logger
+
+SOCKET_PATH = "/jaypore_ci/state/jayporeci.sock"
+DEFAULT_WEIGHTS = {"main": 4, "master": 4}
+
+
+class Ticket:
+    """
+    A job waiting for, or holding, a slot.
+    """
+
+    def __init__(self, flow: tuple, finish: float, name: str):
+        self.flow = flow
+        self.finish = finish
+        self.name = name
+        self.granted = False
+        self.cancelled = False
+
+    def to_dict(self) -> dict:
+        repo, branch = self.flow
+        return {"repo": repo, "branch": branch, "job": self.name}
+
+
+class Scheduler:
+    """
+    Self clocked weighted fair queuing over `(repo, branch)` flows. Each job
+    costs `1 / weight` of virtual time for it's flow and the job with the
+    smallest virtual finish time is granted the next free slot.
+
+    :param budget:  How many jobs may run at the same time.
+    :param weights: Weight of each branch. Branches not listed have weight 1.
+    """
+
+    def __init__(self, budget: int, weights: dict = None):
+        self.budget = budget
+        self.weights = weights if weights is not None else dict(DEFAULT_WEIGHTS)
+        self.virtual_time = 0.0
+        self.last_finish = {}
+        self.queue = []
+        self.running = set()
+        self.__seq__ = count()
+
+    def submit(self, repo: str, branch: str, name: str) -> Ticket:
+        flow = (repo, branch)
+        start = max(self.virtual_time, self.last_finish.get(flow, 0.0))
+        finish = start + 1 / self.weights.get(branch, 1)
+        self.last_finish[flow] = finish
+        ticket = Ticket(flow, finish, name)
+        heapq.heappush(self.queue, (finish, next(self.__seq__), ticket))
+        self.dispatch()
+        return ticket
+
+    def dispatch(self):
+        while self.queue and len(self.running) < self.budget:
+            _, _, ticket = heapq.heappop(self.queue)
+            if ticket.cancelled:
+                continue
+            self.virtual_time = ticket.finish
+            ticket.granted = True
+            self.running.add(ticket)
+
+    def release(self, ticket: Ticket):
+        """
+        Free the slot of a granted ticket, or drop a ticket that is still
+        waiting.
+        """
+        ticket.cancelled = True
+        self.running.discard(ticket)
+        self.dispatch()
+
+    def status(self) -> dict:
+        return {
+            "budget": self.budget,
+            "running": [ticket.to_dict() for ticket in self.running],
+            "queued": [
+                ticket.to_dict()
+                for _, _, ticket in sorted(self.queue, key=lambda x: x[:2])
+                if not ticket.cancelled
+            ],
+        }
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """
+    Serves one request per connection. `acquire` requests keep the connection
+    open for as long as the slot is held.
+    """
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        request = json.loads(line)
+        if request.get("op") == "status":
+            with self.server.changed:
+                status = self.server.scheduler.status()
+            self.wfile.write(json.dumps(status).encode() + b"\n")
+            return
+        with self.server.changed:
+            ticket = self.server.scheduler.submit(
+                request.get("repo"), request.get("branch"), request.get("job")
+            )
+            while not ticket.granted and not self.hung_up():
+                self.server.changed.wait(timeout=1)
+            if not ticket.granted:
+                self.server.scheduler.release(ticket)
+                self.server.changed.notify_all()
+                return
+        try:
+            self.wfile.write(b'{"granted": true}\n')
+            while self.rfile.read(1024):
+                pass
+        except OSError:
+            pass
+        finally:
+            with self.server.changed:
+                self.server.scheduler.release(ticket)
+                self.server.changed.notify_all()
+
+    def hung_up(self) -> bool:
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+
+
+class Daemon(socketserver.ThreadingUnixStreamServer):
+    """
+    The scheduler daemon, listening on a unix socket.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str, scheduler: Scheduler):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, Handler)
+        os.chmod(path, 0o666)
+        self.scheduler = scheduler
+        self.changed = threading.Condition()
+
+
+class Client:
+    """
+    Used by a :class:`~jaypore_ci.jci.Pipeline` to ask the daemon for a slot
+    before each job is run.
+
+    :param path: The daemon's socket, as seen from inside the runner.
+    """
+
+    def __init__(self, path: str = SOCKET_PATH):
+        self.path = path
+        self.__held__ = {}
+
+    def acquire(self, job: "Job") -> bool:
+        """
+        Ask for a slot for the job without waiting. Returns `True` once the
+        slot has been granted; until then the job should stay pending.
+        """
+        slot = self.__held__.get(job.job_id)
+        if slot is None:
+            slot = self.__held__[job.job_id] = {"sock": None, "granted": False}
+            try:
+                slot["sock"] = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                slot["sock"].connect(self.path)
+                request = {
+                    "op": "acquire",
+                    "repo": job.pipeline.repo.remote,
+                    "branch": job.pipeline.repo.branch,
+                    "job": job.name,
+                }
+                slot["sock"].sendall(json.dumps(request).encode() + b"\n")
+                slot["sock"].setblocking(False)
+            except OSError as e:
+                logger.warning("Scheduler daemon not available", error=e)
+                slot["granted"] = True
+        if not slot["granted"]:
+            try:
+                reply = slot["sock"].recv(1024)
+                # The daemon went away, do not wait for it
+                slot["granted"] = not reply or b"granted" in reply
+            except BlockingIOError:
+                pass
+            except OSError:
+                slot["granted"] = True
+        return slot["granted"]
+
+    def release(self, job: "Job"):
+        """
+        Give up the slot of a job, or stop waiting for one.
+        """
+        slot = self.__held__.pop(job.job_id, None)
+        if slot is not None and slot["sock"] is not None:
+            slot["sock"].close()
+
+    def close(self):
+        for slot in self.__held__.values():
+            if slot["sock"] is not None:
+                slot["sock"].close()
+        self.__held__ = {}
+
+
+def status(path: str = SOCKET_PATH) -> dict:
+    """
+    The running and queued jobs of a daemon.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(b'{"op": "status"}\n')
+        return json.loads(sock.makefile().readline())
+
+
+def parse_weights(items) -> dict:
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in items:
+        branch, _, weight = item.rpartition("=")
+        weights[branch] = float(weight)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--socket", default="/tmp/jayporeci__state/jayporeci.sock")
+    parser.add_argument("--budget", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--weight", nargs="*", default=[], help="Like main=4, to favour a branch"
+    )
+    parser.add_argument("--status", action="store_true", help="Show the queue")
+    args = parser.parse_args()
+    if args.status:
+        print(json.dumps(status(args.socket), indent=2))
+        return
+    scheduler = Scheduler(args.budget, parse_weights(args.weight))
+    with Daemon(args.socket, scheduler) as server:
+        logger.info("Scheduler daemon started", socket=args.socket, budget=args.budget)
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
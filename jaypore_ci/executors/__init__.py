@@ -1 +1,9 @@
-from .docker import Docker
+"""
+Executors run the jobs of a pipeline. Each one is imported when first used.
+"""
+from jaypore_ci._lazy import module_getattr
+
+__all__ = ["Docker", "Subprocess"]
+__getattr__, __dir__ = module_getattr(
+    __name__, {"Docker": "docker", "Subprocess": "subprocess"}
+)
@@ -1,15 +1,23 @@
 """
 A docker executor for Jaypore CI.
 """
+import os
+import json
+import time
+import socket
+import hashlib
+import threading
 from copy import deepcopy
+from pathlib import Path
 
 import pendulum
 import docker
+import requests
 from rich import print as rprint
 from tqdm import tqdm
 
 from jaypore_ci import clean
-from jaypore_ci.interfaces import Executor, TriggerFailed, JobStatus
+from jaypore_ci.interfaces import Executor, TriggerFailed, JobStatus, Probe
 from jaypore_ci.logging import logger
 
 
@@ -22,15 +30,78 @@ class Docker(Executor):
         - Create a separate network for each run
         - Run jobs as part of the network
         - Clean up all jobs when the pipeline exits.
+
+    Jobs created with :meth:`~jaypore_ci.jci.Pipeline.build` are not run in a
+    container. The image is built using the docker build API instead and the
+    build output is added to the job logs as it arrives. Each build uses the
+    image previously built by the same job on the same branch as a cache
+    source.
+
+    Outputs of the jobs listed in a job's `inputs` are mounted read-only at
+    `/jaypore_ci/inputs`.
+
+    Service jobs that set `reuse` are shared across pipelines on the same
+    host. If a running container exists for the same image, environment and
+    `reuse` fingerprint it is connected to the new pipeline's network instead
+    of starting a new one. When no pipeline is using a shared service any more
+    it is kept around for `service_idle_timeout` seconds before being removed.
+    Shared services do not get the source of the commit mounted at
+    `/jaypore_ci/run` since they are used by pipelines of other commits too.
+
+    With `resume=True` a pipeline picks up where a previous pipeline for the
+    same commit left off if that pipeline's runner died before finishing. Job
+    containers left behind by it are reused instead of starting new ones:
+    running containers are connected to the new pipeline's network and the
+    results of exited containers are taken as is. Containers that were killed
+    by a signal (exit code above 128, like when the host restarts) and jobs
+    whose image, command or environment have changed are run again.
+
+    When a pipeline starts, pipelines that were started earlier for other
+    commits on the same branch and are still running are cancelled: their job
+    containers are stopped and they publish a final report saying that they
+    have been superseded. Pass `cancel_superseded=False` to let them finish.
+
+    :param service_idle_timeout: How long (in seconds) an unused shared service
+                                 is kept running.
+    :param disk_budget:          If given (like `"20G"`) old source directories,
+                                 runner images and stored job outputs are
+                                 removed after the pipeline finishes until they
+                                 fit in this budget. See
+                                 :mod:`jaypore_ci.cleanup`.
+    :param resume:               Reuse the job containers of a crashed
+                                 pipeline for the same commit.
+    :param cancel_superseded:    Cancel running pipelines of older commits on
+                                 the same branch.
+    :param superseded_dir:       Where pipelines tell each other that they
+                                 have been superseded. It must be shared by
+                                 all runners on the host.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        *,
+        service_idle_timeout: int = 15 * 60,
+        disk_budget=None,
+        resume: bool = False,
+        cancel_superseded: bool = True,
+        superseded_dir: str = "/jaypore_ci/state/superseded",
+    ):
         super().__init__()
         self.pipe_id = None
         self.pipeline = None
         self.docker = docker.from_env()
         self.client = docker.APIClient()
+        self.service_idle_timeout = service_idle_timeout
+        self.disk_budget = disk_budget
+        self.resume = resume
+        self.cancel_superseded = cancel_superseded
+        self.superseded_dir = superseded_dir
+        self.__resumable__ = {}
+        self.__resumed_from__ = set()
         self.__execution_order__ = []
+        self.__joined_network__ = False
+        self.__shared__ = set()
+        self.__builds__ = {}
 
     def logging(self):
         """
@@ -46,18 +117,174 @@ class Docker(Executor):
         This will clean up old networks and create new ones.
         """
         if self.pipe_id is not None:
-            self.delete_network()
+            self.release_shared_services()
             self.delete_all_jobs()
+            self.leave_network()
+            self.delete_network()
+            self.__shared__ = set()
         self.pipe_id = pipeline.pipe_id
         self.pipeline = pipeline
         self.create_network()
 
     def teardown(self):
-        self.delete_network()
+        # Networks can only be removed once nothing is connected to them
+        self.release_shared_services()
         self.delete_all_jobs()
+        for container in self.__resumable__.values():
+            # Left over from a crashed pipeline but not adopted
+            if container.status == "running":
+                container.stop(timeout=1)
+        self.leave_network()
+        try:
+            self.delete_network()
+            for pipe_id in self.__resumed_from__:
+                self.delete_network(pipe_id=pipe_id)
+        finally:
+            Path(self.superseded_dir, self.pipe_id).unlink(missing_ok=True)
+            if self.disk_budget is not None:
+                self.collect_garbage()
+
+    def get_run_dir(self, job) -> str:
+        # The checkout is mounted at the same path in the pipeline's container
+        return "/jaypore_ci/run"
 
     def setup(self):
+        if self.cancel_superseded:
+            self.cancel_superseded_pipelines()
+        if self.resume:
+            self.find_resumable_jobs()
         self.delete_old_containers()
+        self.delete_idle_services()
+
+    def cancel_superseded_pipelines(self):
+        """
+        Cancel running pipelines for other commits on the same branch that
+        were started before this one.
+
+        Each of them is told that it has been superseded via a file in
+        `superseded_dir` (see :meth:`superseded_by`), after which it's job
+        containers are stopped. It's network, shared services and runner are
+        left alone so that it can publish it's final report and clean up
+        after itself. Pipelines whose runner is no longer running are left
+        for :meth:`find_resumable_jobs`.
+        """
+        # Markers of pipelines that died before they could read them
+        for marker in Path(self.superseded_dir).glob("*"):
+            if not self.is_runner_alive(marker.name):
+                marker.unlink(missing_ok=True)
+        sha, branch = self.pipeline.remote.sha, self.pipeline.remote.branch
+        created = pendulum.parse(
+            self.docker.networks.get(self.get_net()).attrs["Created"]
+        )
+        for network in self.docker.networks.list(
+            filters={"label": f"jayporeci.branch={branch}"}
+        ):
+            labels = network.attrs.get("Labels") or {}
+            pipe_id = network.name[len("jayporeci__net__") :]
+            if (
+                network.name == self.get_net()
+                or labels.get("jayporeci.branch") != branch
+                or labels.get("jayporeci.sha") in (None, sha)
+                or pendulum.parse(network.attrs["Created"]) >= created
+                or not self.is_runner_alive(pipe_id)
+            ):
+                continue
+            self.logging().info("Cancel superseded pipeline", old_pipe_id=pipe_id)
+            marker = Path(self.superseded_dir, pipe_id)
+            marker.parent.mkdir(parents=True, exist_ok=True)
+            marker.write_text(sha, encoding="utf-8")
+            for container in self.docker.containers.list(
+                filters={"network": network.name}
+            ):
+                if "__job__" in container.name:
+                    container.stop(timeout=1)
+
+    def superseded_by(self) -> str:
+        """
+        Returns the sha of the pipeline that cancelled this one, if any.
+        """
+        try:
+            return Path(self.superseded_dir, self.pipe_id).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def is_runner_alive(self, pipe_id: str) -> bool:
+        """
+        Is the container running the pipeline with this pipe id still running?
+        The pipe id is the ID of that container.
+        """
+        try:
+            return self.docker.containers.get(pipe_id).status == "running"
+        except docker.errors.NotFound:
+            return False
+
+    def find_resumable_jobs(self):
+        """
+        Find job containers of earlier pipelines for the same commit that did
+        not finish. A pipeline removes it's network when it finishes, so the
+        ones whose network still exists and whose runner container is no longer
+        running are the ones whose runner died.
+        """
+        sha = self.pipeline.remote.sha
+        containers = self.docker.containers.list(
+            all=True, filters={"label": f"jayporeci.sha={sha}"}
+        )
+        for container in sorted(containers, key=lambda c: c.attrs.get("Created", "")):
+            if (
+                container.labels.get("jayporeci.sha") != sha
+                or "__job__" not in container.name
+            ):
+                continue
+            pipe_id = container.name.split("__job__")[1].split("__", 1)[0]
+            if (
+                pipe_id == self.pipe_id
+                or not self.docker.networks.list(names=[self.get_net(pipe_id=pipe_id)])
+                or self.is_runner_alive(pipe_id)
+            ):
+                continue
+            if (
+                container.status != "running"
+                and container.attrs["State"].get("ExitCode", 0) > 128
+            ):
+                continue
+            self.__resumable__[container.labels["jayporeci.job"]] = container
+            self.__resumed_from__.add(pipe_id)
+        self.logging().info("Resumable jobs", jobs=sorted(self.__resumable__))
+
+    def get_fingerprint(self, job, env) -> str:
+        """
+        Identifies what a job container runs so that a changed job is not
+        resumed.
+        """
+        key = json.dumps([job.image, job.command, sorted(env.items())], default=str)
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def adopt(self, job, fingerprint) -> str:
+        """
+        Return the container ID of a resumable container for this job, or
+        `None` if there isn't one.
+        """
+        container = self.__resumable__.pop(self.get_job_name(job, tail=True), None)
+        if container is None:
+            return None
+        if container.labels["jayporeci.fingerprint"] != fingerprint:
+            # The job changed and is run again, the old one is of no use
+            if container.status == "running":
+                container.stop(timeout=1)
+            return None
+        if container.status == "running":
+            try:
+                self.docker.networks.get(self.get_net()).connect(
+                    container,
+                    aliases=[self.get_job_name(job), self.get_job_name(job, tail=True)],
+                )
+            except docker.errors.APIError as e:
+                self.logging().warning("Could not connect resumed job", error=e)
+        self.logging().info("Resume job", name=job.name, run_id=container.id)
+        self.__execution_order__.append(
+            (self.get_job_name(job, tail=True), container.id, "Resume")
+        )
+        return container.id
 
     def delete_old_containers(self):
         a_week_back = pendulum.now().subtract(days=7)
@@ -75,6 +302,8 @@ class Docker(Executor):
             finished_at = pendulum.parse(container.attrs["State"]["FinishedAt"])
             if finished_at <= a_week_back:
                 container.remove(v=True)
+        # Networks of this pipeline and of the ones it resumes are still needed
+        pipe_ids_removed -= self.__resumed_from__ | {self.pipe_id}
         for network in tqdm(
             self.docker.networks.list(
                 names=[self.get_net(pipe_id=pipe_id) for pipe_id in pipe_ids_removed]
@@ -83,6 +312,41 @@ class Docker(Executor):
         ):
             network.remove()
 
+    def collect_garbage(self):
+        """
+        Start a low priority container that evicts the least recently used
+        source directories, runner images and stored job outputs from the host
+        until they fit in the disk budget. The current commit is always kept.
+
+        This does not wait for the cleanup to finish.
+        """
+        sha = self.pipeline.remote.sha
+        try:
+            self.docker.containers.run(
+                image=f"im_jayporeci__pipe__{sha}",
+                command=[
+                    "nice",
+                    "-n19",
+                    "python3",
+                    "-m",
+                    "jaypore_ci.cleanup",
+                    "--root=/jaypore_ci/tmp",
+                    f"--budget={self.disk_budget}",
+                    f"--keep={sha}",
+                    "--store=/jaypore_ci/store",
+                ],
+                volumes=[
+                    "/tmp:/jaypore_ci/tmp",
+                    f"{self.pipeline.artifact_store.host_root}:/jaypore_ci/store",
+                    "/var/run/docker.sock:/var/run/docker.sock",
+                ],
+                name=f"jayporeci__gc__{sha}",
+                detach=True,
+                remove=True,
+            )
+        except docker.errors.APIError as e:
+            self.logging().warning("Could not start cleanup", error=e)
+
     def get_net(self, *, pipe_id=None):
         """
         Return a network name based on what the curent pipeline is.
@@ -105,7 +369,12 @@ class Docker(Executor):
             self.logging().info(
                 "Create network",
                 subprocess=self.docker.networks.create(
-                    name=self.get_net(), driver="bridge"
+                    name=self.get_net(),
+                    driver="bridge",
+                    labels={
+                        "jayporeci.sha": self.pipeline.remote.sha,
+                        "jayporeci.branch": self.pipeline.remote.branch,
+                    },
                 ),
             )
         raise TriggerFailed("Cannot create network")
@@ -118,9 +387,15 @@ class Docker(Executor):
         It will stop any jobs that are still running.
         """
         assert self.pipe_id is not None, "Cannot delete jobs if pipe is not set"
+        for run_id in self.__builds__:
+            self.stop(run_id)
         job = None
         for job in self.pipeline.jobs.values():
-            if job.run_id is not None and not job.run_id.startswith("pyrun_"):
+            if (
+                job.run_id is not None
+                and not job.run_id.startswith(("pyrun_", "build_"))
+                and job.run_id not in self.__shared__
+            ):
                 container = self.docker.containers.get(job.run_id)
                 container.stop(timeout=1)
                 self.logging().info("Stop job:", run_id=job.run_id)
@@ -129,16 +404,31 @@ class Docker(Executor):
             job.check_job()
         self.logging().info("All jobs stopped")
 
-    def delete_network(self):
+    def delete_network(self, *, pipe_id=None, attempts: int = 3):
         """
-        Delete the network for this executor.
+        Delete the network for this executor, or for the given pipe id.
+
+        Docker refuses to remove a network while containers are still
+        connected to it, so removal is retried a few times to give stopped
+        containers time to go away before the error is raised.
         """
         assert self.pipe_id is not None, "Cannot delete network if pipe is not set"
-        try:
-            net = self.docker.networks.get(self.get_net())
-            net.remove()
-        except docker.errors.NotFound:
-            self.logging().error("Delete network: Not found", netid=self.get_net())
+        net_name = self.get_net(pipe_id=pipe_id)
+        for attempt in range(1, attempts + 1):
+            try:
+                self.docker.networks.get(net_name).remove()
+                self.logging().info("Network deleted", netid=net_name)
+                return
+            except docker.errors.NotFound:
+                self.logging().info("Delete network: Not found", netid=net_name)
+                return
+            except docker.errors.APIError as e:
+                if attempt == attempts:
+                    raise
+                self.logging().warning(
+                    "Could not delete network, retrying", netid=net_name, error=e
+                )
+                time.sleep(attempt)
 
     def get_job_name(self, job, tail=False):
         """
@@ -147,17 +437,186 @@ class Docker(Executor):
         name = clean.name(job.name)
         if tail:
             return name
+        if job.attempts:
+            # Earlier attempts are kept around with their original names
+            return f"jayporeci__job__{self.pipe_id}__{name}__attempt{job.attempt}"
         return f"jayporeci__job__{self.pipe_id}__{name}"
 
+    def get_shared_name(self, job, env) -> str:
+        """
+        Generates the container name for a shared service. It is the same for
+        all pipelines that define the same service.
+        """
+        key = json.dumps(
+            [job.image, job.command, sorted(env.items()), job.reuse], default=str
+        )
+        return f"jayporeci__svc__{hashlib.sha256(key.encode()).hexdigest()[:16]}"
+
+    def run_shared(self, job, trigger) -> str:
+        """
+        Connect an existing shared service to this pipeline's network, or start
+        a new one if none is running.
+        """
+        name = self.get_shared_name(job, trigger["environment"])
+        trigger = {**trigger, "name": name}
+        trigger.pop("network")
+        for _ in range(2):
+            running = [
+                container
+                for container in self.docker.containers.list(filters={"name": name})
+                if container.status == "running"
+            ]
+            if running:
+                container = running[0]
+                if container.name != name:  # It was idle
+                    container.rename(name)
+                self.logging().info("Reusing shared service", name=name)
+                break
+            try:
+                container = self.docker.containers.run(**trigger)
+                break
+            except docker.errors.APIError as e:
+                # Another pipeline might have started it at the same time.
+                self.logging().warning("Could not start shared service", error=e)
+        else:
+            raise TriggerFailed(f"Cannot start shared service {name}")
+        self.docker.networks.get(self.get_net()).connect(
+            container,
+            aliases=[self.get_job_name(job), self.get_job_name(job, tail=True)],
+        )
+        self.__shared__.add(container.id)
+        return container.id
+
+    def release_shared_services(self):
+        """
+        Disconnect shared services from this pipeline's network. Services that
+        are no longer connected to any pipeline are marked as idle so that
+        :meth:`delete_idle_services` can remove them later.
+        """
+        for run_id in self.__shared__:
+            container = self.docker.containers.get(run_id)
+            try:
+                self.docker.networks.get(self.get_net()).disconnect(container)
+            except docker.errors.APIError as e:
+                self.logging().warning("Could not release service", error=e)
+            container.reload()
+            networks = container.attrs["NetworkSettings"]["Networks"]
+            if not any(net.startswith("jayporeci__net__") for net in networks):
+                container.rename(f"{container.name}__idle__{int(time.time())}")
+
+    def delete_idle_services(self):
+        """
+        Remove shared services that have not been used by any pipeline for
+        longer than `service_idle_timeout` seconds.
+        """
+        for container in self.docker.containers.list(
+            all=True, filters={"name": "jayporeci__svc__"}
+        ):
+            if "__idle__" not in container.name:
+                continue
+            # Another pipeline might have picked it up since it was marked
+            container.reload()
+            networks = container.attrs["NetworkSettings"]["Networks"]
+            if any(net.startswith("jayporeci__net__") for net in networks):
+                continue
+            idle_since = int(container.name.split("__idle__")[1])
+            if time.time() - idle_since > self.service_idle_timeout:
+                self.logging().info("Remove idle service", name=container.name)
+                container.stop(timeout=1)
+                container.remove(v=True)
+
+    def get_cache_image(self, job) -> str:
+        """
+        The image that is used as a cache source for a build job. It is
+        updated after every successful build of that job on the current
+        branch.
+        """
+        branch = clean.name(self.pipeline.remote.branch)
+        return f"im_jayporeci__cache__{branch}__{clean.name(job.name)}".lower()
+
+    def run_build(self, job) -> str:
+        """
+        Start building the image for a build job in a background thread and
+        return a run ID for it.
+        """
+        run_id = f"build_{job.job_id}"
+        self.__builds__[run_id] = {
+            "logs": [],
+            "exit_code": None,
+            "started_at": pendulum.now(),
+            "finished_at": None,
+            "cancel": threading.Event(),
+        }
+        threading.Thread(
+            target=self.__build__, args=(job, self.__builds__[run_id]), daemon=True
+        ).start()
+        self.__execution_order__.append(
+            (self.get_job_name(job, tail=True), run_id, "Build")
+        )
+        return run_id
+
+    def __build__(self, job, state):
+        build, cache = job.build, self.get_cache_image(job)
+        exit_code = 0
+        try:
+            stream = self.client.build(
+                path=os.path.join("/jaypore_ci/run", build["context"]),
+                dockerfile=build["dockerfile"],
+                tag=build["tag"],
+                target=build["target"],
+                buildargs=build["buildargs"],
+                cache_from=[cache, build["tag"]],
+                rm=True,
+                decode=True,
+            )
+            for chunk in stream:
+                if state["cancel"].is_set():
+                    # Docker stops the build once we hang up on it
+                    stream.close()
+                    state["logs"].append("Build cancelled\n")
+                    exit_code = 1
+                    break
+                if "stream" in chunk:
+                    state["logs"].append(chunk["stream"])
+                elif "status" in chunk:
+                    state["logs"].append(f"{chunk['status']}\n")
+                elif "error" in chunk:
+                    state["logs"].append(f"{chunk['error']}\n")
+                    exit_code = 1
+            if exit_code == 0:
+                self.client.tag(build["tag"], cache)
+        except docker.errors.DockerException as e:
+            state["logs"].append(f"{e}\n")
+            exit_code = 1
+        state["finished_at"] = pendulum.now()
+        state["exit_code"] = exit_code
+
     def run(self, job: "Job") -> str:
         """
         Run the given job and return a docker container ID.
         In case something goes wrong it will raise TriggerFailed
         """
         assert self.pipe_id is not None, "Cannot run job if pipe id is not set"
-        ex_kwargs = deepcopy(job.executor_kwargs)
+        if job.build is not None:
+            return self.run_build(job)
+        ex_kwargs = deepcopy(dict(job.executor_kwargs))
         env = job.get_env()
         env.update(ex_kwargs.pop("environment", {}))
+        volumes = ex_kwargs.pop("volumes", [])
+        try:
+            inputs = job.get_inputs()
+        except OSError as e:
+            self.logging().exception(e)
+            raise TriggerFailed(e) from e
+        if inputs is not None:
+            host_inputs = self.pipeline.artifact_store.host_path(inputs)
+            volumes.append(f"{host_inputs}:/jaypore_ci/inputs:ro")
+            env["JAYPORE_INPUTS"] = "/jaypore_ci/inputs"
+        if not (job.is_service and job.reuse):
+            # Shared services outlive this commit's source directory
+            volumes.append(
+                f"/tmp/jayporeci__src__{self.pipeline.remote.sha}:/jaypore_ci/run"
+            )
         trigger = {
             "detach": True,
             "environment": env,
@@ -167,15 +626,19 @@ class Docker(Executor):
                         "/var/run/docker.sock:/var/run/docker.sock",
                         "/usr/bin/docker:/usr/bin/docker:ro",
                         "/tmp/jayporeci__cidfiles:/jaypore_ci/cidfiles:ro",
-                        f"/tmp/jayporeci__src__{self.pipeline.remote.sha}:/jaypore_ci/run",
                     ]
-                    + (ex_kwargs.pop("volumes", []))
+                    + volumes
                 )
             ),
             "name": self.get_job_name(job),
             "network": self.get_net(),
             "image": job.image,
             "command": job.command if not job.is_service else None,
+            "labels": {
+                "jayporeci.sha": self.pipeline.remote.sha,
+                "jayporeci.job": self.get_job_name(job, tail=True),
+                "jayporeci.fingerprint": self.get_fingerprint(job, env),
+            },
         }
         for key, value in ex_kwargs.items():
             if key in trigger:
@@ -190,8 +653,18 @@ class Docker(Executor):
         if not job.is_service:
             assert job.command
         rprint(trigger)
+        if job.is_service and job.reuse:
+            run_id = self.run_shared(job, trigger)
+            self.__execution_order__.append(
+                (self.get_job_name(job, tail=True), run_id, "Reuse")
+            )
+            return run_id
+        run_id = self.adopt(job, trigger["labels"]["jayporeci.fingerprint"])
+        if run_id is not None:
+            return run_id
         try:
-            container = self.docker.containers.run(**trigger)
+            with self.api_timer("run"):
+                container = self.docker.containers.run(**trigger)
             self.__execution_order__.append(
                 (self.get_job_name(job, tail=True), container.id, "Run")
             )
@@ -200,11 +673,31 @@ class Docker(Executor):
             self.logging().exception(e)
             raise TriggerFailed(e) from e
 
+    def api_timer(self, method: str):
+        """
+        Time a docker API call in the pipeline's metrics.
+        """
+        return self.pipeline.metrics.timer(
+            "jayporeci_docker_api_seconds",
+            failures="jayporeci_docker_api_failures_total",
+            method=method,
+        )
+
     def get_status(self, run_id: str) -> JobStatus:
         """
         Given a run_id, it will get the status for that run.
         """
-        inspect = self.client.inspect_container(run_id)
+        if run_id in self.__builds__:
+            build = self.__builds__[run_id]
+            return JobStatus(
+                is_running=build["exit_code"] is None,
+                exit_code=build["exit_code"] or 0,
+                logs="".join(build["logs"]),
+                started_at=build["started_at"],
+                finished_at=build["finished_at"],
+            )
+        with self.api_timer("inspect_container"):
+            inspect = self.client.inspect_container(run_id)
         status = JobStatus(
             is_running=inspect["State"]["Running"],
             exit_code=int(inspect["State"]["ExitCode"]),
@@ -213,11 +706,84 @@ class Docker(Executor):
             finished_at=pendulum.parse(inspect["State"]["FinishedAt"])
             if inspect["State"]["FinishedAt"] != "0001-01-01T00:00:00Z"
             else None,
+            oom_killed=inspect["State"].get("OOMKilled", False),
         )
         # --- logs
         self.logging().debug("Check status", status=status)
-        logs = self.docker.containers.get(run_id).logs().decode()
+        with self.api_timer("logs"):
+            logs = self.docker.containers.get(run_id).logs().decode()
         return status._replace(logs=logs)
 
+    def stop(self, run_id: str) -> None:
+        """
+        Stop a job's container. Running builds are cancelled when they next
+        report progress. Shared services are left alone.
+        """
+        if run_id in self.__builds__:
+            if self.__builds__[run_id]["exit_code"] is None:
+                self.__builds__[run_id]["cancel"].set()
+                self.logging().info("Cancel build:", run_id=run_id)
+            return
+        if run_id in self.__shared__:
+            return
+        try:
+            self.docker.containers.get(run_id).stop(timeout=1)
+            self.logging().info("Stop job:", run_id=run_id)
+        except docker.errors.APIError as e:
+            self.logging().warning("Could not stop job", run_id=run_id, error=e)
+
+    def join_network(self):
+        """
+        Connect the container running this pipeline to the pipeline's network
+        so that services can be reached by their container names.
+        """
+        if self.__joined_network__:
+            return
+        try:
+            self.docker.networks.get(self.get_net()).connect(self.pipe_id)
+        except docker.errors.APIError as e:
+            self.logging().warning("Could not join network", error=e)
+        self.__joined_network__ = True
+
+    def leave_network(self):
+        """
+        Disconnect the container running this pipeline from the pipeline's
+        network if :meth:`join_network` connected it.
+        """
+        if not self.__joined_network__:
+            return
+        try:
+            self.docker.networks.get(self.get_net()).disconnect(
+                self.pipe_id, force=True
+            )
+        except docker.errors.NotFound:
+            pass
+        except docker.errors.APIError as e:
+            self.logging().warning("Could not leave network", error=e)
+        self.__joined_network__ = False
+
+    def probe(self, run_id: str, probe: Probe) -> bool:
+        """
+        Check if a service is ready.
+
+        Command probes are run inside the service's container using `exec_run`.
+        For TCP / HTTP probes the pipeline's own container joins the network
+        and connects to the service using it's container name.
+        """
+        container = self.docker.containers.get(run_id)
+        if probe.kind == "cmd":
+            return container.exec_run(["sh", "-c", probe.cmd]).exit_code == 0
+        self.join_network()
+        try:
+            if probe.kind == "tcp":
+                with socket.create_connection((container.name, probe.port), timeout=1):
+                    return True
+            if probe.kind == "http":
+                url = f"http://{container.name}:{probe.port}{probe.path}"
+                return requests.get(url, timeout=1).status_code == 200
+        except (OSError, requests.exceptions.RequestException):
+            return False
+        raise ValueError(f"Unknown probe kind: {probe.kind}")
+
     def get_execution_order(self):
         return {name: i for i, (name, *_) in enumerate(self.__execution_order__)}
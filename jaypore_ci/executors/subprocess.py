@@ -0,0 +1,238 @@
+"""
+A subprocess executor for Jaypore CI.
+"""
+import os
+import signal
+import socket
+import subprocess
+from pathlib import Path
+
+import pendulum
+import requests
+
+from jaypore_ci import clean
+from jaypore_ci.interfaces import Executor, TriggerFailed, JobStatus, Probe
+from jaypore_ci.logging import logger
+
+
+class Subprocess(Executor):
+    """
+    Run jobs directly on the host as subprocesses. There is no container
+    involved, so jobs start instantly. This is useful for lightweight jobs and
+    for trying out a pipeline locally.
+
+    Using this executor will:
+        - Run each job in it's own process group via `bash -c`.
+        - Write the output of each job to a separate log file which is read
+          incrementally on every status check.
+        - Kill the whole process group once a job crosses it's timeout.
+        - Kill all jobs that are still running when the pipeline exits.
+
+    The `image` of a job is ignored. Jobs that do not have a command (for
+    example services that rely on an image) cannot be run with this executor.
+
+    :param working_dir: The directory in which jobs are run. Defaults to the
+                        current working directory.
+    :param log_dir:     The directory in which job logs are stored. Defaults
+                        to `/tmp/jayporeci__logs__<pipe_id>`.
+    :param kill_grace:  Seconds to wait after sending SIGTERM to a timed out
+                        job before sending SIGKILL.
+    """
+
+    def __init__(self, *, working_dir: str = None, log_dir: str = None, kill_grace=5):
+        super().__init__()
+        self.working_dir = working_dir if working_dir is not None else os.getcwd()
+        self.log_dir = log_dir
+        self.kill_grace = kill_grace
+        self.__runs__ = {}
+        self.__execution_order__ = []
+
+    def logging(self):
+        """
+        Returns a logging instance that has executor specific
+        information bound to it.
+        """
+        return logger.bind(pipe_id=self.pipe_id, working_dir=self.working_dir)
+
+    def set_pipeline(self, pipeline):
+        """
+        Set executor's pipeline to the given one.
+
+        Any jobs that are still running for an older pipeline are killed.
+        """
+        if self.pipe_id is not None:
+            self.delete_all_jobs()
+        super().set_pipeline(pipeline)
+        if self.log_dir is None:
+            self.log_dir = f"/tmp/jayporeci__logs__{self.pipe_id}"
+        Path(self.log_dir).mkdir(parents=True, exist_ok=True)
+
+    def teardown(self):
+        self.delete_all_jobs()
+
+    def get_run_dir(self, job) -> str:
+        return job.executor_kwargs.get("working_dir", self.working_dir)
+
+    def delete_all_jobs(self):
+        """
+        Kills all jobs started by this executor that are still running and
+        reaps them.
+        """
+        for run_id, run in self.__runs__.items():
+            if run["exit_code"] is None:
+                self.__signal__(run, signal.SIGKILL)
+                self.logging().info("Stop job:", run_id=run_id)
+            self.__reap__(run, block=True)
+            run["log"].close()
+        self.logging().info("All jobs stopped")
+
+    def run(self, job: "Job") -> str:
+        """
+        Run the given job and return a run ID.
+        In case something goes wrong it will raise TriggerFailed
+        """
+        assert self.pipe_id is not None, "Cannot run job if pipe id is not set"
+        if not isinstance(job.command, str) or not job.command:
+            raise TriggerFailed(f"Job {job.name} has no command to run")
+        env = dict(os.environ)
+        env.update(job.get_env())
+        env.update(job.executor_kwargs.get("environment", {}))
+        name = clean.name(job.name)
+        log_path = Path(self.log_dir) / (
+            f"{name}.attempt{job.attempt}.log" if job.attempts else f"{name}.log"
+        )
+        try:
+            inputs = job.get_inputs()
+            if inputs is not None:
+                env["JAYPORE_INPUTS"] = str(inputs)
+            with open(log_path, "wb") as out:
+                proc = subprocess.Popen(  # pylint: disable=consider-using-with
+                    ["bash", "-c", job.command],
+                    cwd=self.get_run_dir(job),
+                    env=env,
+                    stdin=subprocess.DEVNULL,
+                    stdout=out,
+                    stderr=subprocess.STDOUT,
+                    start_new_session=True,
+                )
+        except OSError as e:
+            self.logging().exception(e)
+            raise TriggerFailed(e) from e
+        run_id = f"proc_{proc.pid}"
+        self.__runs__[run_id] = {
+            # Keep a reference to the Popen object so that the subprocess
+            # module does not try to reap this child on it's own.
+            "proc": proc,
+            "pid": proc.pid,
+            "timeout": job.timeout,
+            "started_at": pendulum.now(),
+            "finished_at": None,
+            "exit_code": None,
+            "killed_at": None,
+            "log": open(log_path, "rb"),  # pylint: disable=consider-using-with
+            "logs": b"",
+        }
+        self.__execution_order__.append((name, run_id, "Run"))
+        return run_id
+
+    def __signal__(self, run, sig):
+        try:
+            os.killpg(run["pid"], sig)
+        except ProcessLookupError:
+            pass
+
+    def __reap__(self, run, block=False):
+        """
+        Collect the exit code of a finished job without polling the process
+        table repeatedly.
+        """
+        if run["exit_code"] is not None:
+            return
+        try:
+            pid, wait_status = os.waitpid(run["pid"], 0 if block else os.WNOHANG)
+        except ChildProcessError:
+            pid, wait_status = run["pid"], 255 << 8
+        if pid == 0:
+            return
+        run["exit_code"] = os.waitstatus_to_exitcode(wait_status)
+        run["finished_at"] = pendulum.now()
+
+    def __enforce_timeout__(self, run):
+        if run["exit_code"] is not None or run["timeout"] is None:
+            return
+        now = pendulum.now()
+        if run["killed_at"] is None:
+            if (now - run["started_at"]).in_seconds() > run["timeout"]:
+                self.logging().warning("Job timed out", pid=run["pid"])
+                self.__signal__(run, signal.SIGTERM)
+                run["killed_at"] = now
+        elif (now - run["killed_at"]).in_seconds() > self.kill_grace:
+            self.__signal__(run, signal.SIGKILL)
+
+    def stop(self, run_id: str) -> None:
+        """
+        Ask a job's process group to terminate. It is killed when the executor
+        is torn down if it's still running by then.
+        """
+        run = self.__runs__[run_id]
+        self.__reap__(run)
+        if run["exit_code"] is None:
+            self.__signal__(run, signal.SIGTERM)
+            run["killed_at"] = pendulum.now()
+            self.logging().info("Stop job:", run_id=run_id)
+
+    def get_status(self, run_id: str) -> JobStatus:
+        """
+        Given a run_id, it will get the status for that run.
+        """
+        run = self.__runs__[run_id]
+        self.__reap__(run)
+        self.__enforce_timeout__(run)
+        chunk = run["log"].read()
+        if chunk:
+            run["logs"] += chunk
+        status = JobStatus(
+            is_running=run["exit_code"] is None,
+            exit_code=run["exit_code"] if run["exit_code"] is not None else 0,
+            logs=run["logs"].decode(errors="replace"),
+            started_at=run["started_at"],
+            finished_at=run["finished_at"],
+        )
+        self.logging().debug("Check status", run_id=run_id, exit_code=status.exit_code)
+        return status
+
+    def probe(self, run_id: str, probe: Probe) -> bool:
+        """
+        Check if a service is ready. TCP / HTTP probes connect to localhost and
+        command probes are run in the working directory.
+        """
+        self.logging().debug("Probe", run_id=run_id, kind=probe.kind)
+        try:
+            if probe.kind == "cmd":
+                return (
+                    subprocess.call(
+                        ["bash", "-c", probe.cmd],
+                        cwd=self.working_dir,
+                        stdin=subprocess.DEVNULL,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL,
+                        timeout=probe.max_delay,
+                    )
+                    == 0
+                )
+            if probe.kind == "tcp":
+                with socket.create_connection(("localhost", probe.port), timeout=1):
+                    return True
+            if probe.kind == "http":
+                url = f"http://localhost:{probe.port}{probe.path}"
+                return requests.get(url, timeout=1).status_code == 200
+        except (
+            OSError,
+            subprocess.TimeoutExpired,
+            requests.exceptions.RequestException,
+        ):
+            return False
+        raise ValueError(f"Unknown probe kind: {probe.kind}")
+
+    def get_execution_order(self):
+        return {name: i for i, (name, *_) in enumerate(self.__execution_order__)}
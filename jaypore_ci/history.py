@@ -0,0 +1,219 @@
+"""
+A history of pipeline runs and their jobs, stored in SQLite.
+
+Every pipeline adds one row to `runs` and one row per job to `jobs` when it
+finishes. All rows of a run are written in a single transaction. The database
+lives at `/tmp/jayporeci__state/history.sqlite` on the host by default and is
+shared by all repos run on that host, so runs are recorded with the repo's
+remote. It can be queried with :meth:`History.jobs` and
+:meth:`History.durations`, or with any SQLite client.
+"""
+import time
+import socket
+import sqlite3
+import hashlib
+from datetime import datetime
+from pathlib import Path
+from typing import List, NamedTuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    repo TEXT,
+    sha TEXT NOT NULL,
+    branch TEXT,
+    pipe_id TEXT,
+    host TEXT,
+    status TEXT,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    name TEXT NOT NULL,
+    attempt INTEGER NOT NULL DEFAULT 1,
+    stage TEXT,
+    image TEXT,
+    command_hash TEXT,
+    status TEXT,
+    exit_code INTEGER,
+    started_at REAL,
+    finished_at REAL,
+    log_size INTEGER,
+    host TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_repo ON runs(repo);
+CREATE INDEX IF NOT EXISTS runs_branch ON runs(branch);
+CREATE INDEX IF NOT EXISTS jobs_name ON jobs(name);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+CREATE INDEX IF NOT EXISTS jobs_run_id ON jobs(run_id);
+"""
+
+
+class JobRecord(NamedTuple):
+    name: str
+    attempt: int
+    stage: str
+    image: str
+    command_hash: str
+    status: str
+    exit_code: int
+    started_at: float
+    finished_at: float
+    log_size: int
+    host: str
+    repo: str
+    sha: str
+    branch: str
+
+    @property
+    def duration(self) -> float:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+def command_hash(command) -> str:
+    """
+    A stable hash of a job's command. Callables are identified by their
+    qualified name.
+    """
+    if callable(command):
+        command = f"{command.__module__}.{command.__qualname__}"
+    return hashlib.sha256(str(command).encode()).hexdigest()[:16]
+
+
+def timestamp(at) -> float:
+    """
+    Convert a datetime to a unix timestamp, leaving numbers and `None` as is.
+    """
+    return at.timestamp() if isinstance(at, datetime) else at
+
+
+def job_rows(job: "Job", run_id: int, host: str) -> List[tuple]:
+    """
+    One row for every attempt at running the job.
+    """
+    attempts = [(state, "FAILED", None) for state in job.attempts]
+    attempts.append((job.run_state, job.status.name, job.completed_at))
+    return [
+        (
+            run_id,
+            job.name,
+            attempt,
+            job.stage,
+            job.image,
+            command_hash(job.command),
+            status,
+            state.exit_code if state else None,
+            timestamp((state.started_at if state else None) or job.run_start),
+            timestamp((state.finished_at if state else None) or completed_at),
+            len(state.logs or "") if state else 0,
+            host,
+        )
+        for attempt, (state, status, completed_at) in enumerate(attempts, 1)
+    ]
+
+
+class History:
+    """
+    :param path: Where the SQLite database is stored.
+    """
+
+    def __init__(self, path: str = "/jaypore_ci/state/history.sqlite"):
+        self.path = path
+        self.__db__ = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self.__db__ is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self.__db__ = sqlite3.connect(self.path, timeout=30)
+            self.__db__.executescript(SCHEMA)
+        return self.__db__
+
+    def record(self, pipeline: "Pipeline") -> int:
+        """
+        Save a finished pipeline and all of it's jobs. Returns the id of the
+        run.
+        """
+        host = socket.gethostname()
+        jobs = list(pipeline.jobs.values())
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO runs (repo, sha, branch, pipe_id, host, status, "
+                "started_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    pipeline.repo.remote,
+                    pipeline.repo.sha,
+                    pipeline.repo.branch,
+                    pipeline.pipe_id,
+                    host,
+                    pipeline.__summarize_status__().name,
+                    pipeline.tracer.started_at,
+                    max((job.completed_at or 0 for job in jobs), default=None)
+                    or time.time(),
+                ),
+            )
+            run_id = cursor.lastrowid
+            self.db.executemany(
+                "INSERT INTO jobs (run_id, name, attempt, stage, image, command_hash, "
+                "status, exit_code, started_at, finished_at, log_size, host) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row for job in jobs for row in job_rows(job, run_id, host)],
+            )
+        return run_id
+
+    def jobs(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        name: str = None,
+        repo: str = None,
+        branch: str = None,
+        status: str = None,
+        limit=100,
+    ) -> List[JobRecord]:
+        """
+        The most recent job runs, optionally filtered by job name, repo,
+        branch and status.
+        """
+        filters, params = [], []
+        for column, value in [
+            ("jobs.name", name),
+            ("runs.repo", repo),
+            ("runs.branch", branch),
+            ("jobs.status", status),
+        ]:
+            if value is not None:
+                filters.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        rows = self.db.execute(
+            "SELECT jobs.name, jobs.attempt, jobs.stage, jobs.image, jobs.command_hash, "
+            "jobs.status, jobs.exit_code, jobs.started_at, jobs.finished_at, "
+            "jobs.log_size, jobs.host, runs.repo, runs.sha, runs.branch "
+            f"FROM jobs JOIN runs ON jobs.run_id = runs.id {where} "
+            "ORDER BY jobs.id DESC LIMIT ?",
+            params + [limit],
+        )
+        return [JobRecord(*row) for row in rows]
+
+    def durations(
+        self, name: str, *, repo: str = None, branch: str = None, limit=20
+    ) -> List[float]:
+        """
+        Durations in seconds of the most recent passing runs of a job.
+        """
+        return [
+            record.duration
+            for record in self.jobs(
+                name=name, repo=repo, branch=branch, status="PASSED", limit=limit
+            )
+            if record.duration is not None
+        ]
+
+    def close(self):
+        if self.__db__ is not None:
+            self.__db__.close()
+            self.__db__ = None
@@ -4,11 +4,14 @@ Defines interfaces for remotes and executors.
 Currently only gitea and docker are supported as remote and executor
 respectively.
 """
+import os
 from enum import Enum
 from pathlib import Path
 from urllib.parse import urlparse
 from typing import NamedTuple, List
 
+from jaypore_ci.logging import logger
+
 
 class TriggerFailed(Exception):
     "Failure to trigger a job"
@@ -24,6 +27,44 @@ class JobStatus(NamedTuple):
     logs: str
     started_at: str
     finished_at: str
+    oom_killed: bool = False
+
+
+class Probe(NamedTuple):
+    """
+    Decides when a service job is ready to be used by other jobs.
+
+    Until the probe succeeds the service stays
+    :class:`~jaypore_ci.interfaces.Status.RUNNING`. Probes are retried with
+    exponential backoff starting at `initial_delay` seconds and going up to
+    `max_delay` seconds. If the service is not ready within `timeout` seconds
+    it is marked as :class:`~jaypore_ci.interfaces.Status.TIMEOUT`.
+
+    Use one of :meth:`tcp`, :meth:`http` or :meth:`command` to create a probe.
+    """
+
+    kind: str
+    port: int = None
+    path: str = "/"
+    cmd: str = None
+    initial_delay: float = 0.5
+    max_delay: float = 10
+    timeout: float = 5 * 60
+
+    @classmethod
+    def tcp(cls, port: int, **kwargs) -> "Probe":
+        "Ready once the given port accepts connections."
+        return cls(kind="tcp", port=port, **kwargs)
+
+    @classmethod
+    def http(cls, port: int, path: str = "/", **kwargs) -> "Probe":
+        "Ready once a GET request to the given port and path returns 200."
+        return cls(kind="http", port=port, path=path, **kwargs)
+
+    @classmethod
+    def command(cls, cmd: str, **kwargs) -> "Probe":
+        "Ready once the given command exits with 0 inside the service."
+        return cls(kind="cmd", cmd=cmd, **kwargs)
 
 
 class Status(Enum):
@@ -134,6 +175,13 @@ class Executor:
         self.pipe_id = id(pipeline)
         self.pipeline = pipeline
 
+    def get_run_dir(self, job: "Job") -> str:
+        """
+        The directory, as seen by the pipeline, in which the job was run. A
+        job's `outputs` are resolved against it.
+        """
+        return os.getcwd()
+
     def setup(self) -> None:
         """
         This function is meant to perform any work that should be done before
@@ -151,6 +199,104 @@ class Executor:
         """
         raise NotImplementedError()
 
+    def probe(self, run_id: str, probe: Probe) -> bool:
+        """
+        Runs the given readiness probe against a run and returns True if it
+        succeeded.
+        """
+        raise NotImplementedError()
+
+    def stop(self, run_id: str) -> None:
+        """
+        Stop a run that is no longer needed, like when the pipeline has
+        already failed.
+        """
+        raise NotImplementedError()
+
+    def superseded_by(self) -> str:
+        """
+        Returns the sha of a newer pipeline that has replaced this one, or
+        `None`.
+        """
+        return None
+
+
+class AsyncExecutor:
+    """
+    The asyncio version of :class:`~jaypore_ci.interfaces.Executor`. It is used
+    by :class:`~jaypore_ci.jci.AsyncPipeline` so that many jobs can be checked
+    concurrently.
+
+    Any :class:`~jaypore_ci.interfaces.Executor` can be used where an async
+    executor is needed by wrapping it in
+    :class:`~jaypore_ci.jci.ExecutorInThreads`.
+    """
+
+    def __init__(self):
+        self.pipe_id = None
+        self.pipeline = None
+
+    def set_pipeline(self, pipeline: "Pipeline") -> None:
+        """Set the current pipeline to the given one."""
+        self.pipe_id = id(pipeline)
+        self.pipeline = pipeline
+
+    def logging(self):
+        """
+        Returns a logging instance that has executor specific information
+        bound to it.
+        """
+        return logger.bind(pipe_id=self.pipe_id)
+
+    async def run(self, job: "Job") -> str:
+        "Run a job and return it's ID"
+        raise NotImplementedError()
+
+    def get_run_dir(self, job: "Job") -> str:
+        """
+        The directory, as seen by the pipeline, in which the job was run. A
+        job's `outputs` are resolved against it.
+        """
+        return os.getcwd()
+
+    async def setup(self) -> None:
+        """
+        This function is meant to perform any work that should be done before
+        running any jobs.
+        """
+
+    async def teardown(self) -> None:
+        """
+        On exit the executor must clean up any pending / stuck / zombie jobs that are still there.
+        """
+
+    async def get_status(self, run_id: str) -> JobStatus:
+        """
+        Returns the status of a given run.
+        """
+        raise NotImplementedError()
+
+    async def probe(self, run_id: str, probe: Probe) -> bool:
+        """
+        Runs the given readiness probe against a run and returns True if it
+        succeeded.
+        """
+        raise NotImplementedError()
+
+    async def stop(self, run_id: str) -> None:
+        """
+        Stop a run that is no longer needed, like when the pipeline has
+        already failed.
+        """
+        raise NotImplementedError()
+
+    async def superseded_by(self) -> str:
+        """
+        Returns the sha of a newer pipeline that has replaced this one, or
+        `None`.
+        """
+        return None
+
 
 class Remote:
     """
@@ -188,6 +334,43 @@ class Remote:
         raise NotImplementedError()
 
 
+class AsyncRemote:
+    """
+    The asyncio version of :class:`~jaypore_ci.interfaces.Remote`.
+
+    Any :class:`~jaypore_ci.interfaces.Remote` can be used where an async
+    remote is needed by wrapping it in :class:`~jaypore_ci.jci.RemoteInThreads`.
+    """
+
+    def __init__(self, *, sha, branch):
+        self.sha = sha
+        self.branch = branch
+
+    def logging(self):
+        """
+        Returns a logging instance that has remote specific information bound
+        to it.
+        """
+        return logger.bind(sha=self.sha, branch=self.branch)
+
+    async def publish(self, report: str, status: str):
+        """
+        Publish this report somewhere.
+        """
+        raise NotImplementedError()
+
+    async def setup(self) -> None:
+        """
+        This function is meant to perform any work that should be done before
+        running any jobs.
+        """
+
+    async def teardown(self) -> None:
+        """
+        This function will be called once the pipeline is finished.
+        """
+
+
 class Reporter:
     """
     Something that generates the status of a pipeline.
@@ -3,9 +3,13 @@ The code submodule for Jaypore CI.
 """
 import time
 import os
-from itertools import product
-from collections import defaultdict
-from typing import List, Union, Callable
+import re
+import sys
+import shlex
+import asyncio
+from concurrent.futures import Executor as PoolExecutor, ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Dict, List, Tuple, Union, Callable
 from contextlib import contextmanager
 
 import structlog
@@ -14,7 +18,7 @@ import pendulum
 from jaypore_ci.exceptions import BadConfig
 from jaypore_ci.config import const
 from jaypore_ci.changelog import version_map
-from jaypore_ci import remotes, executors, reporters, repos, clean
+from jaypore_ci import remotes, executors, reporters, repos, clean, pyrun
 from jaypore_ci.interfaces import (
     Remote,
     Executor,
@@ -22,17 +26,31 @@ from jaypore_ci.interfaces import (
     TriggerFailed,
     Status,
     Repo,
+    JobStatus,
+    Probe,
+    AsyncExecutor,
+    AsyncRemote,
 )
 from jaypore_ci.logging import logger
 
 TZ = "UTC"
 
-__all__ = ["Pipeline", "Job"]
+__all__ = ["Pipeline", "Job", "AsyncPipeline"]
 
 
 # All of these statuses are considered "finished" statuses
 FIN_STATUSES = (Status.FAILED, Status.PASSED, Status.TIMEOUT, Status.SKIPPED)
 PREFIX = "JAYPORE_"
+TRACE_PATH = "/jaypore_ci/run/jaypore_ci.trace.json"
+# Failed jobs are retried after RETRY_DELAY seconds, doubling for every attempt
+# up to RETRY_MAX_DELAY seconds.
+RETRY_DELAY = 5
+RETRY_MAX_DELAY = 5 * 60
+OOM_KILLED = "OOMKilled"
+# Shared, read-only defaults for jobs. Jobs replace them instead of changing
+# them so that pipelines with thousands of jobs do not keep a copy per job.
+NO_ITEMS = ()
+NO_ENV = NO_KWARGS = NO_LOGS = MappingProxyType({})
 
 # Check if we need to upgrade Jaypore CI
 def ensure_version_is_correct() -> None:
@@ -86,12 +104,56 @@ class Job:  # pylint: disable=too-many-instance-attributes
     :param name:            The name for the job. Names must be unique across
                             jobs and stages.
     :param command:         The command that we need to run for the job. It can
-                            be set to `None` when `is_service` is True.
+                            be set to `None` when `is_service` is True. It can
+                            also be a python callable which is then run inside
+                            the pipeline's `python_pool` instead of the
+                            executor. See :func:`~jaypore_ci.pyrun.call` for how
+                            it's result decides the job status.
     :param is_service:      Is this job a service or not? Service jobs are
                             assumed to be
                             :class:`~jaypore_ci.interfaces.Status.PASSED` as
-                            long as they start.  They are shut down when the
-                            entire pipeline has finished executing.
+                            long as they start, unless a `probe` is given.
+                            They are shut down when the entire pipeline has
+                            finished executing.
+    :param probe:           A :class:`~jaypore_ci.interfaces.Probe` for service
+                            jobs. The service is only marked as
+                            :class:`~jaypore_ci.interfaces.Status.PASSED` once
+                            the probe succeeds, so jobs depending on it start
+                            as soon as it is actually ready.
+    :param reuse:           Set this to `True` or a fingerprint string on a
+                            service job to share it with other pipelines on
+                            the same host. Services are shared when their
+                            image, command, environment and fingerprint match,
+                            so change the fingerprint (for example to a hash of
+                            your migrations) when the service should be
+                            rebuilt. Shared services do not have the
+                            repo's source mounted. Supported by the
+                            :class:`~jaypore_ci.executors.docker.Docker`
+                            executor.
+    :param build:           Set by :meth:`~jaypore_ci.jci.Pipeline.build` for
+                            jobs that build a docker image.
+    :param outputs:         Paths / globs relative to the repo that this job
+                            produces. Once the job passes they are saved in
+                            the pipeline's
+                            :class:`~jaypore_ci.artifacts.Store`. The job
+                            fails if any of them is missing.
+    :param inputs:          Names of jobs whose `outputs` this job needs. They
+                            can be in the same stage, in which case they are
+                            added to `depends_on`, or in an earlier stage.
+                            Their outputs are made available read-only at
+                            `$JAYPORE_INPUTS/<job name>/<path>`.
+    :param retries:         How many times to run this job again if it fails.
+                            Retries wait a few seconds, doubling the wait for
+                            every attempt. Earlier attempts are kept in
+                            `attempts`.
+    :param retry_on:        Only retry failures that match one of these. Each
+                            item is an exit code, :data:`OOM_KILLED` for jobs
+                            killed by running out of memory, or a regular
+                            expression that is searched for in the logs. All
+                            failures are retried if this is not given.
+    :param expected_duration: How many seconds the job is expected to take.
+                            Only used to :mod:`~jaypore_ci.planning` the
+                            pipeline when there is no run history for it.
     :param pipeline:        The pipeline this job is associated with.
     :param status:          The :class:`~jaypore_ci.interfaces.Status` of this job.
     :param image:           What docker image to use for this job.
@@ -116,6 +178,44 @@ class Job:  # pylint: disable=too-many-instance-attributes
                             .
     """
 
+    __slots__ = (
+        "name",
+        "command",
+        "image",
+        "status",
+        "run_state",
+        "timeout",
+        "pipeline",
+        "env",
+        "children",
+        "parents",
+        "is_service",
+        "probe",
+        "reuse",
+        "build",
+        "outputs",
+        "inputs",
+        "retries",
+        "retry_on",
+        "expected_duration",
+        "stage",
+        "executor_kwargs",
+        "logs",
+        "run_id",
+        "future",
+        "run_start",
+        "last_check",
+        "ready",
+        "next_probe_at",
+        "probe_delay",
+        "artifacts",
+        "seen_logs",
+        "completed_at",
+        "attempts",
+        "retry_at",
+        "cancelled",
+    )
+
     def __init__(
         self,
         name: str,
@@ -126,6 +226,14 @@ class Job:  # pylint: disable=too-many-instance-attributes
         children: List["Job"] = None,
         parents: List["Job"] = None,
         is_service: bool = False,
+        probe: Probe = None,
+        reuse: Union[bool, str] = None,
+        build: dict = None,
+        outputs: List[str] = None,
+        inputs: List[str] = None,
+        retries: int = 0,
+        retry_on: List[Union[int, str]] = None,
+        expected_duration: float = None,
         stage: str = None,
         # --- executor kwargs
         image: str = None,
@@ -140,18 +248,41 @@ class Job:  # pylint: disable=too-many-instance-attributes
         self.run_state = None
         self.timeout = timeout
         self.pipeline = pipeline
-        self.env = env
-        self.children = children if children is not None else []
+        self.env = env if env is not None else NO_ENV
+        self.children = children if children is not None else NO_ITEMS
         self.parents = parents if parents is not None else []
         self.is_service = is_service
-        self.stage = stage
-        self.executor_kwargs = executor_kwargs if executor_kwargs is not None else {}
+        self.probe = probe
+        self.reuse = reuse
+        self.build = build
+        self.outputs = outputs if outputs is not None else NO_ITEMS
+        self.inputs = inputs if inputs is not None else NO_ITEMS
+        self.retries = retries
+        self.retry_on = retry_on if retry_on is not None else NO_ITEMS
+        self.expected_duration = expected_duration
+        self.stage = sys.intern(stage) if stage is not None else None
+        self.executor_kwargs = (
+            executor_kwargs if executor_kwargs is not None else NO_KWARGS
+        )
         # --- run information
-        self.logs = defaultdict(list)
-        self.job_id = id(self)
+        self.logs = NO_LOGS
         self.run_id = None
+        self.future = None
         self.run_start = None
         self.last_check = None
+        self.ready = False
+        self.next_probe_at = None
+        self.probe_delay = None
+        self.artifacts = None
+        self.seen_logs = False
+        self.completed_at = None
+        self.attempts = NO_ITEMS
+        self.retry_at = None
+        self.cancelled = False
+
+    @property
+    def job_id(self) -> int:
+        return id(self)
 
     def logging(self):
         """
@@ -171,18 +302,8 @@ class Job:  # pylint: disable=too-many-instance-attributes
         changed.
         """
         self.logging().debug("Update report")
-        status = {
-            Status.PENDING: "pending",
-            Status.RUNNING: "pending",
-            Status.FAILED: "failure",
-            Status.PASSED: "success",
-            Status.TIMEOUT: "warning",
-            Status.SKIPPED: "warning",
-        }[self.pipeline.get_status()]
-        report = self.pipeline.reporter.render(self.pipeline)
-        with open("/jaypore_ci/run/jaypore_ci.status.txt", "w", encoding="utf-8") as fl:
-            fl.write(report)
-        self.pipeline.remote.publish(report, status)
+        report, status = self.pipeline.render_report()
+        self.pipeline.publish(report, status)
         return report
 
     def trigger(self):
@@ -193,49 +314,328 @@ class Job:  # pylint: disable=too-many-instance-attributes
         It is also idempotent. Calling this multiple times will only trigger
         the job once.
         """
+        if self.status == Status.PENDING and not self.pipeline.admit(self):
+            return
         if self.status == Status.PENDING:
-            self.run_start = pendulum.now(TZ)
-            self.logging().info("Trigger called")
-            self.status = Status.RUNNING
-            if isinstance(self.command, str):
+            self.__start__()
+            if callable(self.command):
+                self.__submit__()
+            else:
                 try:
-                    self.run_id = self.pipeline.executor.run(self)
+                    with self.pipeline.tracer.span("trigger", self.name):
+                        self.run_id = self.pipeline.executor.run(self)
                     self.logging().info("Trigger done")
                 except TriggerFailed as e:
-                    self.logging().error(
-                        "Trigger failed",
-                        error=e,
-                        job_name=self.name,
-                    )
-                    self.status = Status.FAILED
+                    self.__trigger_failed__(e)
         else:
             self.logging().info("Trigger called but job already running")
         self.check_job()
 
+    async def trigger_async(self, executor: AsyncExecutor):
+        """
+        Same as :meth:`~jaypore_ci.jci.Job.trigger` but uses an
+        :class:`~jaypore_ci.interfaces.AsyncExecutor`. It does not check the job
+        or publish a report after triggering.
+        """
+        if self.status != Status.PENDING or not self.pipeline.admit(self):
+            return
+        self.__start__()
+        if callable(self.command):
+            self.__submit__()
+        else:
+            try:
+                with self.pipeline.tracer.span("trigger", self.name):
+                    self.run_id = await executor.run(self)
+                self.logging().info("Trigger done")
+            except TriggerFailed as e:
+                self.__trigger_failed__(e)
+
+    def __start__(self):
+        self.run_start = pendulum.now(TZ)
+        self.logging().info("Trigger called")
+        self.status = Status.RUNNING
+        if self.attempts:
+            # Retries wait for their backoff, from when the last attempt was
+            # found to have failed.
+            self.pipeline.tracer.complete(
+                "backoff", self.name, self.completed_at, time.time()
+            )
+            self.completed_at = None
+            return
+        # Time spent waiting for parents to finish, or for the pipeline to
+        # start for jobs without parents.
+        waited_from = max(
+            (self.pipeline.jobs[name].completed_at or 0 for name in self.parents),
+            default=self.pipeline.tracer.started_at,
+        )
+        self.pipeline.tracer.complete("wait", self.name, waited_from, time.time())
+        if self.parents:
+            self.pipeline.metrics.observe(
+                "jayporeci_trigger_lag_seconds", time.time() - waited_from
+            )
+
+    def __trigger_failed__(self, error):
+        self.logging().error("Trigger failed", error=error, job_name=self.name)
+        self.status = Status.FAILED
+
+    def __submit__(self):
+        self.run_id = f"pyrun_{self.job_id}"
+        self.future = self.pipeline.python_pool.submit(pyrun.call, self.command)
+        self.logging().info("Trigger done")
+
+    @property
+    def attempt(self) -> int:
+        "The current attempt at running this job, starting from 1."
+        return len(self.attempts) + 1
+
     def check_job(self, *, with_update_report=True):
         """
         This will check the status of the job.
         If `with_update_report` is False, it will not push an update to the remote.
         """
-        if isinstance(self.command, str) and self.run_id is not None:
+        if self.cancelled or self.__waiting_to_retry__():
+            return
+        if self.run_id is not None:
             self.logging().debug("Checking job run")
-            self.run_state = self.pipeline.executor.get_status(self.run_id)
-            self.last_check = pendulum.now(TZ)
-            self.logging().debug(
-                "Job run status found",
-                is_running=self.run_state.is_running,
-                exit_code=self.run_state.exit_code,
-            )
-            if self.run_state.is_running:
-                self.status = Status.RUNNING if not self.is_service else Status.PASSED
+            if callable(self.command):
+                self.set_run_state(pyrun.get_status(self.future, self.run_start))
             else:
-                self.status = (
-                    Status.PASSED if self.run_state.exit_code == 0 else Status.FAILED
-                )
-            self.logs["stdout"] = reporters.clean_logs(self.run_state.logs)
+                executor = self.pipeline.executor
+                run_state = executor.get_status(self.run_id)
+                if self.__should_probe__(run_state):
+                    self.__probed__(executor.probe(self.run_id, self.probe))
+                self.set_run_state(run_state)
             if with_update_report:
                 self.update_report()
 
+    async def check_job_async(self, executor: AsyncExecutor):
+        """
+        Same as :meth:`~jaypore_ci.jci.Job.check_job` but uses an
+        :class:`~jaypore_ci.interfaces.AsyncExecutor`. It never publishes a
+        report.
+        """
+        if self.cancelled or self.__waiting_to_retry__():
+            return
+        if self.run_id is not None:
+            self.logging().debug("Checking job run")
+            if callable(self.command):
+                self.set_run_state(pyrun.get_status(self.future, self.run_start))
+            else:
+                run_state = await executor.get_status(self.run_id)
+                if self.__should_probe__(run_state):
+                    self.__probed__(await executor.probe(self.run_id, self.probe))
+                self.set_run_state(run_state)
+
+    def cancel(self):
+        """
+        Stop this job if it is running and mark it as
+        :class:`~jaypore_ci.interfaces.Status.SKIPPED`. Completed jobs are left
+        as they are.
+        """
+        if self.__cancel__():
+            try:
+                self.pipeline.executor.stop(self.run_id)
+            except NotImplementedError:
+                self.logging().warning("Executor cannot stop jobs")
+
+    async def cancel_async(self, executor: AsyncExecutor):
+        """
+        Same as :meth:`~jaypore_ci.jci.Job.cancel` but uses an
+        :class:`~jaypore_ci.interfaces.AsyncExecutor`.
+        """
+        if self.__cancel__():
+            try:
+                await executor.stop(self.run_id)
+            except NotImplementedError:
+                self.logging().warning("Executor cannot stop jobs")
+
+    def __cancel__(self) -> bool:
+        """
+        Mark the job as cancelled. Returns `True` if the executor has to stop
+        it.
+        """
+        if self.is_complete():
+            return False
+        self.logging().info("Cancel job", status=self.status)
+        needs_stop = (
+            self.status == Status.RUNNING
+            and self.run_id is not None
+            and self.retry_at is None
+        )
+        self.status = Status.SKIPPED
+        self.cancelled = True
+        self.retry_at = None
+        self.pipeline.release(self)
+        if callable(self.command):
+            if self.future is not None:
+                self.future.cancel()
+            return False
+        return needs_stop
+
+    def __probe_timed_out__(self) -> bool:
+        return (pendulum.now(TZ) - self.run_start).in_seconds() > self.probe.timeout
+
+    def __should_probe__(self, run_state: JobStatus) -> bool:
+        return (
+            self.is_service
+            and self.probe is not None
+            and not self.ready
+            and run_state.is_running
+            and not self.__probe_timed_out__()
+            and (self.next_probe_at is None or pendulum.now(TZ) >= self.next_probe_at)
+        )
+
+    def __probed__(self, ready: bool):
+        """
+        Record the result of a readiness probe and back off exponentially if
+        the service is not ready yet.
+        """
+        self.ready = ready
+        self.logging().debug("Readiness probe", ready=ready)
+        if not ready:
+            self.probe_delay = (
+                self.probe.initial_delay
+                if self.probe_delay is None
+                else min(self.probe_delay * 2, self.probe.max_delay)
+            )
+            self.next_probe_at = pendulum.now(TZ).add(seconds=self.probe_delay)
+
+    def set_run_state(self, run_state: JobStatus):
+        """
+        Update the job's status and logs based on the given run state.
+        """
+        self.run_state = run_state
+        self.last_check = pendulum.now(TZ)
+        self.logging().debug(
+            "Job run status found",
+            is_running=self.run_state.is_running,
+            exit_code=self.run_state.exit_code,
+        )
+        if self.run_state.is_running:
+            if not self.is_service:
+                self.status = Status.RUNNING
+            elif self.probe is None or self.ready:
+                self.status = Status.PASSED
+            elif self.__probe_timed_out__():
+                self.status = Status.TIMEOUT
+            else:
+                self.status = Status.RUNNING
+        else:
+            self.status = (
+                Status.PASSED if self.run_state.exit_code == 0 else Status.FAILED
+            )
+        self.logs = {"stdout": reporters.clean_logs(self.run_state.logs)}
+        if self.status == Status.FAILED and self.__should_retry__():
+            self.__schedule_retry__()
+        if self.status == Status.PASSED and self.outputs and self.artifacts is None:
+            self.save_outputs()
+        self.trace()
+
+    def __should_retry__(self) -> bool:
+        if self.is_service or len(self.attempts) >= self.retries:
+            return False
+        if not self.retry_on:
+            return True
+        state = self.run_state
+        for cause in self.retry_on:
+            if isinstance(cause, int):
+                if cause == state.exit_code:
+                    return True
+            elif cause == OOM_KILLED and state.oom_killed:
+                return True
+            elif re.search(cause, state.logs or ""):
+                return True
+        return False
+
+    def __schedule_retry__(self):
+        """
+        Keep the failed attempt and wait before running the job again. The job
+        stays :class:`~jaypore_ci.interfaces.Status.RUNNING` meanwhile so that
+        it's children are not skipped.
+        """
+        self.trace()
+        self.attempts += (self.run_state._replace(logs=self.logs["stdout"]),)
+        delay = min(RETRY_DELAY * 2 ** (len(self.attempts) - 1), RETRY_MAX_DELAY)
+        self.retry_at = pendulum.now(TZ).add(seconds=delay)
+        self.status = Status.RUNNING
+        self.logging().warning(
+            "Job failed, will retry",
+            attempt=len(self.attempts),
+            exit_code=self.run_state.exit_code,
+            delay=delay,
+        )
+
+    def __waiting_to_retry__(self) -> bool:
+        """
+        Returns `True` while waiting for a retry. Once it's time the job is
+        made :class:`~jaypore_ci.interfaces.Status.PENDING` again so that the
+        pipeline triggers it.
+        """
+        if self.retry_at is None:
+            return False
+        if pendulum.now(TZ) >= self.retry_at:
+            self.retry_at = None
+            self.status = Status.PENDING
+            self.run_id = None
+            self.future = None
+            self.seen_logs = False
+        return True
+
+    def trace(self):
+        """
+        Record the first log line and, once the job is complete, it's run and
+        how long it took to notice that it had finished.
+        """
+        tracer = self.pipeline.tracer
+        if self.run_state.logs and not self.seen_logs:
+            self.seen_logs = True
+            tracer.instant("first log", self.name)
+        if not self.is_complete() or self.completed_at is not None:
+            return
+        self.completed_at = time.time()
+        self.pipeline.release(self)
+        if self.run_state.is_running:
+            tracer.instant("ready", self.name, self.completed_at)
+            return
+        finished_at = self.run_state.finished_at
+        tracer.complete(
+            "run",
+            self.name,
+            self.run_state.started_at or self.run_start,
+            finished_at or self.completed_at,
+            exit_code=self.run_state.exit_code,
+        )
+        if finished_at is not None:
+            tracer.complete("detect", self.name, finished_at, self.completed_at)
+
+    def save_outputs(self):
+        """
+        Save this job's outputs in the pipeline's artifact store. The job is
+        marked as failed if they cannot be saved.
+        """
+        from jaypore_ci.artifacts import MissingOutput
+
+        try:
+            self.artifacts = self.pipeline.artifact_store.snapshot(
+                self.pipeline.executor.get_run_dir(self), self.outputs
+            )
+        except (MissingOutput, OSError) as e:
+            self.logging().error("Could not save outputs", error=e)
+            self.logs["stdout"].append(f"Could not save outputs: {e}")
+            self.status = Status.FAILED
+
+    def get_inputs(self):
+        """
+        Build a view of the outputs of all jobs listed in `inputs` and return
+        it's path. Returns `None` if the job has no inputs.
+        """
+        if not self.inputs:
+            return None
+        return self.pipeline.artifact_store.view(
+            f"{self.pipeline.pipe_id}/{self.name}",
+            {name: self.pipeline.jobs[name].artifacts for name in self.inputs},
+        )
+
     def is_complete(self) -> bool:
         """
         Is this job complete? It could have passed/ failed etc.
@@ -252,10 +652,7 @@ class Job:  # pylint: disable=too-many-instance-attributes
         2. Stage
         3. Job
         """
-        env = {
-            k[len(PREFIX) :]: v for k, v in os.environ.items() if k.startswith(PREFIX)
-        }
-        env.update(self.pipeline.pipe_kwargs.get("env", {}))
+        env = dict(self.pipeline.base_env)
         env.update(self.env)  # Includes env specified in stage kwargs AND job kwargs
         return env
 
@@ -270,13 +667,40 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
     :param executor:        Runs the specified jobs.
     :param poll_interval:   Defines how frequently (in seconds) to check the
                             pipeline status and publish a report.
-    """
+    :param python_pool:     A `concurrent.futures` executor used to run jobs
+                            whose command is a python callable. Defaults to a
+                            `ThreadPoolExecutor`. Use a `ProcessPoolExecutor`
+                            for CPU heavy callables; they must be picklable in
+                            that case.
+    :param artifact_store:  The :class:`~jaypore_ci.artifacts.Store` used to
+                            pass `outputs` of jobs to the jobs that list them
+                            as `inputs`.
+    :param metrics_dir:     Where the metrics of all pipelines run on this
+                            host are kept, in Prometheus textfile format. See
+                            :mod:`~jaypore_ci.metrics`. Set to `None` to
+                            disable.
+    :param history_path:    The SQLite database where every run and it's jobs
+                            are recorded. See :mod:`~jaypore_ci.history`. Set
+                            to `None` to disable.
+    :param fail_fast:       As soon as a job in a stage fails, stop the other
+                            jobs of the stage and publish the final report
+                            instead of waiting for them. Stages can override
+                            this with `fail_fast=`.
+    :param daemon_client:   A :class:`~jaypore_ci.daemon.Client` to wait for a
+                            slot from the host's scheduler daemon before each
+                            job is run.
+    :param plan:            Only build the pipeline and print it's plan instead
+                            of running it. The executor and remote are not
+                            used. See :mod:`~jaypore_ci.planning`. Defaults to
+                            `True` if `JAYPORECI_PLAN` is set.
 
-    # We need a way to avoid actually running the examples. Something like a
-    # "dry-run" option so that only the building of the config is done and it's
-    # never actually run. It might be a good idea to make this an actual config
-    # variable but I'm not sure if we should do that or not.
-    __run_on_exit__ = True
+    Set `JAYPORECI_PROFILE` to profile the pipeline runner itself, see
+    :mod:`~jaypore_ci.profiling`.
+
+    A trace of the pipeline run is saved at
+    `/jaypore_ci/run/jaypore_ci.trace.json` once it finishes. See
+    :mod:`~jaypore_ci.tracing`.
+    """
 
     def __init__(  # pylint: disable=too-many-arguments
         self,
@@ -286,12 +710,34 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
         executor: Executor = None,
         reporter: Reporter = None,
         poll_interval: int = 10,
+        python_pool: PoolExecutor = None,
+        artifact_store: "artifacts.Store" = None,
+        metrics_dir: str = "/jaypore_ci/state/metrics",
+        history_path: str = "/jaypore_ci/state/history.sqlite",
+        fail_fast: bool = False,
+        daemon_client: "daemon.Client" = None,
+        plan: bool = None,
         **kwargs,
     ) -> "Pipeline":
+        # These are only needed once a pipeline is made, keeping the import of
+        # this module fast.
+        from jaypore_ci import artifacts, metrics, profiling, tracing
+
+        self.profiler = profiling.Profiler.from_env()
+        if self.profiler is not None:
+            self.profiler.start()
         self.jobs = {}
         self.services = []
         self.should_pass_called = set()
         self.repo = repo if repo is not None else repos.Git.from_env()
+        self.planning = (
+            plan if plan is not None else bool(os.environ.get("JAYPORECI_PLAN"))
+        )
+        if self.planning:
+            from jaypore_ci import planning
+
+            remote = remotes.Mock.from_env(repo=self.repo)
+            executor = planning.DryRun()
         self.remote = (
             remote
             if remote is not None
@@ -300,6 +746,24 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
         self.executor = executor if executor is not None else executors.docker.Docker()
         self.reporter = reporter if reporter is not None else reporters.text.Text()
         self.poll_interval = poll_interval
+        self.python_pool = (
+            python_pool if python_pool is not None else ThreadPoolExecutor()
+        )
+        self.artifact_store = (
+            artifact_store if artifact_store is not None else artifacts.Store()
+        )
+        self.tracer = tracing.Tracer()
+        self.metrics = metrics.Metrics()
+        self.metrics_dir = metrics_dir
+        self.history = None
+        if history_path is not None:
+            from jaypore_ci import history
+
+            self.history = history.History(history_path)
+        self.fail_fast = fail_fast
+        self.stage_fail_fast = {}
+        self.superseded_by = None
+        self.daemon_client = daemon_client
         self.stages = ["Pipeline"]
         self.__pipe_id__ = None
         self.executor.set_pipeline(self)
@@ -310,6 +774,8 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
         kwargs["stage"] = "Pipeline"
         self.pipe_kwargs = kwargs
         self.stage_kwargs = None
+        self.job_defaults = kwargs
+        self.__base_env__ = None
 
     @property
     def pipe_id(self):
@@ -317,6 +783,22 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
             self.__pipe_id__ = self.__get_pipe_id__()
         return self.__pipe_id__
 
+    @property
+    def base_env(self) -> dict:
+        """
+        The `JAYPORE_` variables of the runner, without the prefix, along with
+        the pipeline's `env`. This is read once and shared by all jobs.
+        """
+        if self.__base_env__ is None:
+            env = {
+                k[len(PREFIX) :]: v
+                for k, v in os.environ.items()
+                if k.startswith(PREFIX)
+            }
+            env.update(self.pipe_kwargs.get("env", {}))
+            self.__base_env__ = MappingProxyType(env)
+        return self.__base_env__
+
     def __get_pipe_id__(self):
         """
         This is mainly here so that during testing we can override this and
@@ -345,12 +827,67 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if Pipeline.__run_on_exit__:
+        if self.planning:
+            if exc_type is None:
+                self.print_plan()
+        else:
             self.run()
             self.executor.teardown()
             self.remote.teardown()
+            if self.daemon_client is not None:
+                self.daemon_client.close()
+            self.artifact_store.release(self.pipe_id)
+            self.save_stats()
+            self.python_pool.shutdown(wait=False, cancel_futures=True)
         return False
 
+    def get_plan(self) -> "planning.Plan":
+        """
+        Check the pipeline for mistakes and estimate when each of it's jobs
+        will run. See :mod:`~jaypore_ci.planning`.
+        """
+        from jaypore_ci import planning
+
+        return planning.make_plan(self)
+
+    def print_plan(self) -> "planning.Plan":
+        """
+        Print the plan of this pipeline. Raises
+        :class:`~jaypore_ci.exceptions.BadConfig` if the pipeline has mistakes
+        in it.
+        """
+        from jaypore_ci import planning
+
+        plan = self.get_plan()
+        print(planning.render(self, plan))
+        if plan.errors:
+            raise BadConfig("\n".join(plan.errors))
+        return plan
+
+    def save_stats(self):
+        """
+        Save the trace and profile of this run, record it in the run history
+        and add it's metrics to the totals in `metrics_dir`.
+        """
+        self.tracer.save(TRACE_PATH)
+        if self.profiler is not None:
+            self.profiler.save()
+        if self.history is not None:
+            import sqlite3
+
+            try:
+                self.history.record(self)
+            except (sqlite3.Error, OSError) as e:
+                self.logging().warning("Could not save run history", error=e)
+        if self.metrics_dir is None:
+            return
+        for job in self.jobs.values():
+            self.metrics.inc("jayporeci_jobs_total", status=job.status.name)
+        try:
+            self.metrics.save(self.metrics_dir)
+        except OSError as e:
+            self.logging().warning("Could not save metrics", error=e)
+
     def get_status(self) -> Status:
         """
         Calculates a pipeline's status based on the status of it's jobs.
@@ -363,9 +900,15 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
             service.check_job(with_update_report=False)
         if service is not None:
             service.check_job(with_update_report=False)
-        has_pending = False
         for job in self.jobs.values():
             job.check_job(with_update_report=False)
+        return self.__summarize_status__()
+
+    def __summarize_status__(self) -> Status:
+        if self.superseded_by is not None:
+            return Status.SKIPPED
+        has_pending = False
+        for job in self.jobs.values():
             if not job.is_complete():
                 has_pending = True
             else:
@@ -373,6 +916,46 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
                     return Status.FAILED
         return Status.PENDING if has_pending else Status.PASSED
 
+    def render_report(self):
+        """
+        Render the report for this pipeline and save it to
+        `/jaypore_ci/run/jaypore_ci.status.txt`.
+
+        Returns the report along with the status that should be published to
+        the remote.
+        """
+        status = {
+            Status.PENDING: "pending",
+            Status.RUNNING: "pending",
+            Status.FAILED: "failure",
+            Status.PASSED: "success",
+            Status.TIMEOUT: "warning",
+            Status.SKIPPED: "warning",
+        }[self.get_status()]
+        with self.tracer.span("render", "Pipeline"), self.metrics.timer(
+            "jayporeci_render_seconds", reporter=type(self.reporter).__name__
+        ):
+            report = self.reporter.render(self)
+        profiler = self.profiler
+        if profiler is not None and profiler.in_report and profiler.summary:
+            report += f"\n\n```\n{profiler.summary}\n```\n"
+        if self.superseded_by is not None:
+            report += f"\n\nSuperseded by {self.superseded_by[:10]}\n"
+        with open("/jaypore_ci/run/jaypore_ci.status.txt", "w", encoding="utf-8") as fl:
+            fl.write(report)
+        return report, status
+
+    def publish(self, report: str, status: str):
+        """
+        Publish a report using the pipeline's remote.
+        """
+        with self.tracer.span("publish", "Pipeline"), self.metrics.timer(
+            "jayporeci_publish_seconds",
+            failures="jayporeci_publish_failures_total",
+            remote=type(self.remote).__name__,
+        ):
+            self.remote.publish(report, status)
+
     def get_status_dot(self) -> str:
         """
         Get's the status dot for the pipeline.
@@ -388,7 +971,7 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
     def job(
         self,
         name: str,
-        command: str,
+        command: Union[str, Callable],
         *,
         depends_on: List[str] = None,
         **kwargs,
@@ -401,13 +984,31 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
         """
         depends_on = [] if depends_on is None else depends_on
         depends_on = [depends_on] if isinstance(depends_on, str) else depends_on
-        name = clean.name(name)
+        inputs = kwargs.get("inputs") or []
+        stage = kwargs.get("stage", self.job_defaults["stage"])
+        for input_name in inputs:
+            assert (
+                input_name in self.jobs
+            ), f"Input job has to be defined before a child. Cannot find {input_name}"
+            source = self.jobs[input_name]
+            assert (
+                source.outputs
+            ), f"Input job {input_name} does not declare any outputs"
+            assert self.stages.index(source.stage) <= self.stages.index(
+                stage
+            ), f"Input job {input_name} runs in a later stage"
+        # Earlier stages have finished by the time this job runs, so only
+        # inputs from the same stage have to be waited for.
+        depends_on = [
+            sys.intern(parent_name)
+            for parent_name in list(depends_on)
+            + [i for i in inputs if i not in depends_on and self.jobs[i].stage == stage]
+        ]
+        name = sys.intern(clean.name(name))
         assert name, "Name should have some value after it is cleaned"
         assert name not in self.jobs, f"{name} already defined"
         assert name not in self.stages, "Stage name cannot match a job's name"
-        kwargs, job_kwargs = dict(self.pipe_kwargs), kwargs
-        kwargs.update(self.stage_kwargs if self.stage_kwargs is not None else {})
-        kwargs.update(job_kwargs)
+        kwargs = {**self.job_defaults, **kwargs} if kwargs else self.job_defaults
         if not kwargs.get("is_service"):
             assert command, f"Command: {command}"
         job = Job(
@@ -415,7 +1016,6 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
             command=command,
             status=Status.PENDING,
             pipeline=self,
-            children=[],
             parents=depends_on,
             **kwargs,
         )
@@ -430,14 +1030,208 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
             self.services.append(job)
         return job
 
+    def build(  # pylint: disable=too-many-arguments
+        self,
+        name: str,
+        *,
+        tag: str,
+        context: str = ".",
+        dockerfile: str = "Dockerfile",
+        target: str = None,
+        buildargs: dict = None,
+        depends_on: List[str] = None,
+        **kwargs,
+    ) -> Job:
+        """
+        Creates a job that builds a docker image. With the
+        :class:`~jaypore_ci.executors.docker.Docker` executor the image is built
+        through the docker API, using the image last built by this job on the
+        same branch as a cache source. Other executors run the equivalent
+        `docker build` command.
+
+        :param tag:        Tag for the built image.
+        :param context:    Build context, relative to the repo root.
+        :param dockerfile: Path to the Dockerfile within the context.
+        :param target:     The build stage to build.
+        :param buildargs:  A dictionary of build arguments.
+        """
+        buildargs = buildargs if buildargs is not None else {}
+        # `-f` is relative to the current directory, not to the context
+        command = [
+            "docker",
+            "build",
+            "-t",
+            tag,
+            "-f",
+            os.path.join(context, dockerfile),
+        ]
+        if target is not None:
+            command += ["--target", target]
+        for key, value in buildargs.items():
+            command += ["--build-arg", f"{key}={value}"]
+        command.append(context)
+        return self.job(
+            name,
+            " ".join(shlex.quote(part) for part in command),
+            depends_on=depends_on,
+            build={
+                "tag": tag,
+                "context": context,
+                "dockerfile": dockerfile,
+                "target": target,
+                "buildargs": buildargs,
+            },
+            **kwargs,
+        )
+
+    def sharded_job(  # pylint: disable=too-many-arguments
+        self,
+        name: str,
+        command: str,
+        *,
+        shards: int,
+        junit_dir: str = None,
+        depends_on: List[str] = None,
+        **kwargs,
+    ) -> Job:
+        """
+        Run a pytest command split over `shards` jobs of about the same
+        duration. This adds the following jobs:
+
+        - `<name>-collect` runs `<command> --collect-only -q` to find the test
+          ids.
+        - `<name>-plan` splits them between the shards using the durations
+          of the last passing run. It fails if no test ids were collected,
+          for example when `-q` is already in the pytest `addopts`.
+        - `<name>-1` to `<name>-<shards>` run `<command>` with only their
+          own tests selected by the :mod:`~jaypore_ci.pytest_shard` plugin,
+          so `jaypore_ci` must be installed in the job's image.
+        - `<name>` merges the junit XML of the shards and is the job to
+          depend on.
+
+        Any other kwargs are passed on to the collect and shard jobs.
+
+        :param command:   The pytest command, like `python -m pytest tests/`.
+        :param shards:    How many jobs to split the tests between.
+        :param junit_dir: Where the merged junit XML of each passing run is
+                          kept for the durations of the next run. Defaults
+                          to `/jaypore_ci/state/junit`.
+        """
+        from jaypore_ci import sharding
+
+        assert shards >= 1, "Need at least one shard"
+        junit_dir = junit_dir if junit_dir is not None else sharding.JUNIT_DIR
+        name = clean.name(name)
+        collect = self.job(
+            f"{name}-collect",
+            f"{command} --collect-only -q",
+            depends_on=depends_on,
+            **kwargs,
+        )
+        junit = os.path.join(junit_dir, f"{name}.xml")
+        paths = sharding.shard_paths(name, shards)
+        shard_jobs = []
+
+        def plan():
+            ids = sharding.collected_ids(collect.run_state.logs or "")
+            if not ids:
+                print(f"No test ids found in the logs of {collect.name}")
+                return False
+            known = sharding.durations(junit)
+            packed = sharding.pack(ids, known, shards)
+            for job, path, share in zip(shard_jobs, paths, packed):
+                job.command = sharding.shard_command(
+                    command,
+                    share,
+                    os.path.splitext(path)[0] + ".txt",
+                    path,
+                    run_dir=self.executor.get_run_dir(job),
+                )
+                print(f"{job.name}: {len(share)} tests")
+            print(f"{len(ids)} tests, {len(known)} with known durations")
+            return True
+
+        def merge():
+            reports = [
+                os.path.join(self.executor.get_run_dir(job), path)
+                for job, path in zip(shard_jobs, paths)
+            ]
+            totals = sharding.merge([p for p in reports if os.path.exists(p)], junit)
+            print(", ".join(f"{key}: {value}" for key, value in totals.items()))
+            return totals["failures"] == 0 and totals["errors"] == 0
+
+        self.job(f"{name}-plan", plan, depends_on=[collect.name])
+        for i in range(1, shards + 1):
+            shard_jobs.append(
+                self.job(f"{name}-{i}", command, depends_on=[f"{name}-plan"], **kwargs)
+            )
+        return self.job(name, merge, depends_on=[job.name for job in shard_jobs])
+
     @classmethod
-    def env_matrix(cls, **kwargs):
+    def env_matrix(  # pylint: disable=too-many-arguments
+        cls,
+        axes: Dict[str, list] = None,
+        /,
+        *,
+        include: List[dict] = None,
+        exclude: List[dict] = None,
+        mode: str = "product",
+        shard: Tuple[int, int] = None,
+        sample: int = None,
+        seed=None,
+        **kwargs,
+    ):
         """
-        Return a cartesian product of all the provided kwargs.
+        Return a cartesian product of all the provided kwargs. Combinations
+        are generated one at a time.
+
+        The kwargs can also be given as a dict, which is needed for keys that
+        have the same name as one of the options below, like
+        `env_matrix({"mode": ["fast", "safe"]}, mode="pairwise")`. Options
+        that look like a list of values for a key raise
+        :class:`~jaypore_ci.exceptions.BadConfig`.
+
+        :param include: Extra combinations to add at the end.
+        :param exclude: Combinations to leave out. A combination is left out
+                        if it matches all the keys of any of these, so
+                        `{"OS": "windows", "PY": "3.8"}` only leaves out that
+                        pair.
+        :param mode:    `"product"` for every combination, or `"pairwise"`
+                        for a much smaller set in which every pair of values
+                        from any two keys still appears at least once.
+        :param shard:   `(index, count)` to only return every `count`-th
+                        combination starting at `index`.
+        :param sample:  Only return this many combinations, picked at random.
+                        Pass a `seed` to pick the same ones every time.
         """
-        keys = list(sorted(kwargs.keys()))
-        for values in product(*[kwargs[key] for key in keys]):
-            yield dict(list(zip(keys, values)))
+        from jaypore_ci import matrix
+
+        # Options given a list of values were meant as keys
+        misused = {
+            "include": include is not None
+            and not all(isinstance(combo, dict) for combo in include),
+            "exclude": exclude is not None
+            and not all(isinstance(combo, dict) for combo in exclude),
+            "mode": not isinstance(mode, str),
+            "shard": shard is not None and not isinstance(shard, tuple),
+            "sample": sample is not None and not isinstance(sample, int),
+            "seed": isinstance(seed, (list, set)),
+        }
+        for name, is_misused in misused.items():
+            if is_misused:
+                raise BadConfig(
+                    f"`{name}` is an option of env_matrix. Pass the keys as a "
+                    f"dict to use it as a key: env_matrix({{{name!r}: [...]}})"
+                )
+        yield from matrix.expand(
+            {**(axes or {}), **kwargs},
+            include=include,
+            exclude=exclude,
+            mode=mode,
+            shard_of=shard,
+            sample_size=sample,
+            seed=seed,
+        )
 
     def __ensure_duplex__(self):
         for name, job in self.jobs.items():
@@ -461,6 +1255,13 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
                 jobs[name].trigger()
             # --- monitor and ensure all jobs run
             while not all(job.is_complete() for job in jobs.values()):
+                newer = self.executor.superseded_by()
+                if newer is not None:
+                    self.supersede(newer)
+                    for job in self.jobs.values():
+                        job.cancel()
+                    break
+                self.observe_queue(jobs)
                 for job in jobs.values():
                     job.check_job(with_update_report=False)
                     if not job.is_complete():
@@ -477,6 +1278,11 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
                             for parent_name in job.parents
                         ):
                             job.status = Status.SKIPPED
+                if self.should_fail_fast(stage, jobs):
+                    self.logging().error("Job failed, cancelling stage", stage=stage)
+                    for job in jobs.values():
+                        job.cancel()
+                    break
                 job.check_job()
                 time.sleep(self.poll_interval)
             # --- has this stage passed?
@@ -488,24 +1294,368 @@ class Pipeline:  # pylint: disable=too-many-instance-attributes
                 job.update_report()
                 break
         self.logging().error("Pipeline passed")
+        if self.profiler is not None and self.profiler.in_report:
+            self.profiler.summarize()
         if job is not None:
             report = job.update_report()
             self.logging().info("Report:", report=report)
 
+    def admit(self, job: Job) -> bool:
+        """
+        Can this job be run now? Jobs wait for a slot from the scheduler
+        daemon, if there is one. Services are not counted.
+        """
+        if self.daemon_client is None or job.is_service:
+            return True
+        return self.daemon_client.acquire(job)
+
+    def release(self, job: Job):
+        """
+        Give back the scheduler daemon's slot once a job is done with it.
+        """
+        if self.daemon_client is not None:
+            self.daemon_client.release(job)
+
+    def supersede(self, sha: str):
+        """
+        Record that a newer pipeline has replaced this one.
+        """
+        self.superseded_by = sha
+        self.logging().warning("Pipeline superseded, cancelling jobs", by=sha)
+
+    def should_fail_fast(self, stage: str, jobs: dict) -> bool:
+        """
+        Should the remaining jobs of this stage be cancelled? True once a job
+        has failed in a stage that fails fast.
+        """
+        return self.stage_fail_fast.get(stage, self.fail_fast) and any(
+            job.status in (Status.FAILED, Status.TIMEOUT) for job in jobs.values()
+        )
+
+    def observe_queue(self, jobs):
+        """
+        Record how many of the given jobs are still waiting to be triggered.
+        """
+        from jaypore_ci.metrics import COUNTS
+
+        self.metrics.observe(
+            "jayporeci_queue_depth",
+            sum(job.status == Status.PENDING for job in jobs.values()),
+            buckets=COUNTS,
+        )
+
     @contextmanager
     def stage(self, name, **kwargs):
         """
         A stage in a pipeline.
 
         Any kwargs passed to this stage are supplied to jobs created within
-        this stage.
+        this stage, except for `fail_fast` which overrides the pipeline's
+        `fail_fast` for this stage.
         """
         name = clean.name(name)
         assert name, "Name should have some value after it is cleaned"
         assert name not in self.jobs, "Stage name cannot match a job's name"
         assert name not in self.stages, "Stage names cannot be re-used"
         self.stages.append(name)
+        if "fail_fast" in kwargs:
+            self.stage_fail_fast[name] = kwargs.pop("fail_fast")
         kwargs["stage"] = name
         self.stage_kwargs = kwargs
+        self.job_defaults = {**self.pipe_kwargs, **kwargs}
         yield  # -------------------------
         self.stage_kwargs = None
+        self.job_defaults = self.pipe_kwargs
+
+
+class ExecutorInThreads(AsyncExecutor):
+    """
+    Makes a normal :class:`~jaypore_ci.interfaces.Executor` usable as an
+    :class:`~jaypore_ci.interfaces.AsyncExecutor` by running each of it's
+    calls in a thread pool.
+
+    :param executor: The executor to wrap.
+    :param pool:     The thread pool to use. Defaults to the event loop's
+                     default executor.
+    """
+
+    def __init__(self, executor: Executor, pool: PoolExecutor = None):
+        super().__init__()
+        self.executor = executor
+        self.pool = pool
+
+    def logging(self):
+        return self.executor.logging()
+
+    def set_pipeline(self, pipeline: "Pipeline") -> None:
+        self.executor.set_pipeline(pipeline)
+        self.pipe_id = self.executor.pipe_id
+        self.pipeline = pipeline
+
+    def get_run_dir(self, job: Job) -> str:
+        return self.executor.get_run_dir(job)
+
+    async def __call_in_thread__(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    async def run(self, job: Job) -> str:
+        return await self.__call_in_thread__(self.executor.run, job)
+
+    async def setup(self) -> None:
+        await self.__call_in_thread__(self.executor.setup)
+
+    async def teardown(self) -> None:
+        await self.__call_in_thread__(self.executor.teardown)
+
+    async def get_status(self, run_id: str) -> JobStatus:
+        return await self.__call_in_thread__(self.executor.get_status, run_id)
+
+    async def probe(self, run_id: str, probe: Probe) -> bool:
+        return await self.__call_in_thread__(self.executor.probe, run_id, probe)
+
+    async def stop(self, run_id: str) -> None:
+        return await self.__call_in_thread__(self.executor.stop, run_id)
+
+    async def superseded_by(self) -> str:
+        return await self.__call_in_thread__(self.executor.superseded_by)
+
+
+class RemoteInThreads(AsyncRemote):
+    """
+    Makes a normal :class:`~jaypore_ci.interfaces.Remote` usable as an
+    :class:`~jaypore_ci.interfaces.AsyncRemote` by running each of it's calls
+    in a thread pool.
+
+    :param remote: The remote to wrap.
+    :param pool:   The thread pool to use. Defaults to the event loop's default
+                   executor.
+    """
+
+    def __init__(self, remote: Remote, pool: PoolExecutor = None):
+        super().__init__(sha=remote.sha, branch=remote.branch)
+        self.remote = remote
+        self.pool = pool
+
+    def logging(self):
+        return self.remote.logging()
+
+    async def __call_in_thread__(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    async def publish(self, report: str, status: str):
+        return await self.__call_in_thread__(self.remote.publish, report, status)
+
+    async def setup(self) -> None:
+        await self.__call_in_thread__(self.remote.setup)
+
+    async def teardown(self) -> None:
+        await self.__call_in_thread__(self.remote.teardown)
+
+
+class AsyncPipeline(Pipeline):
+    """
+    A pipeline that runs on an asyncio event loop. On every poll it checks all
+    running jobs concurrently, triggers all jobs that are ready concurrently
+    and then publishes a single report. It can be used exactly like a normal
+    pipeline:
+
+    .. code-block:: python
+
+        with jci.AsyncPipeline() as p:
+            p.job("Black", "black --check .")
+
+    or from within an already running event loop:
+
+    .. code-block:: python
+
+        async with jci.AsyncPipeline() as p:
+            p.job("Black", "black --check .")
+
+    The `executor` and `remote` can be either async implementations
+    (:class:`~jaypore_ci.interfaces.AsyncExecutor`,
+    :class:`~jaypore_ci.interfaces.AsyncRemote`) or normal ones, in which case
+    they are wrapped in :class:`~jaypore_ci.jci.ExecutorInThreads` and
+    :class:`~jaypore_ci.jci.RemoteInThreads`.
+
+    Accepts the same arguments as :class:`~jaypore_ci.jci.Pipeline`.
+    """
+
+    def __init__(self, **kwargs) -> "AsyncPipeline":
+        super().__init__(**kwargs)
+        self.async_executor = (
+            self.executor
+            if isinstance(self.executor, AsyncExecutor)
+            else ExecutorInThreads(self.executor)
+        )
+        self.async_remote = (
+            self.remote
+            if isinstance(self.remote, AsyncRemote)
+            else RemoteInThreads(self.remote)
+        )
+        self.__loop__ = None
+        self.__publishing__ = set()
+
+    def __enter__(self):
+        ensure_version_is_correct()
+        # Setup, run and teardown share one loop so that anything the async
+        # executor or remote bind to the loop in setup is still usable later.
+        self.__loop__ = asyncio.new_event_loop()
+        try:
+            self.__loop__.run_until_complete(self.__setup_async__())
+        except BaseException:
+            self.__loop__.close()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        loop = self.__loop__
+        try:
+            if self.planning:
+                if exc_type is None:
+                    self.print_plan()
+            else:
+                loop.run_until_complete(self.__finish_async__())
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+        return False
+
+    async def __aenter__(self):
+        ensure_version_is_correct()
+        await self.__setup_async__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self.planning:
+            if exc_type is None:
+                self.print_plan()
+        else:
+            await self.__finish_async__()
+        return False
+
+    async def __setup_async__(self):
+        await asyncio.gather(self.async_executor.setup(), self.async_remote.setup())
+
+    async def __finish_async__(self):
+        await self.run_async()
+        await asyncio.gather(
+            self.async_executor.teardown(), self.async_remote.teardown()
+        )
+        while self.__publishing__:
+            await asyncio.gather(*self.__publishing__)
+        if self.daemon_client is not None:
+            self.daemon_client.close()
+        self.artifact_store.release(self.pipe_id)
+        self.save_stats()
+        self.python_pool.shutdown(wait=False, cancel_futures=True)
+
+    def get_status(self) -> Status:
+        """
+        Calculates a pipeline's status based on the status of it's jobs.
+
+        Unlike :meth:`~jaypore_ci.jci.Pipeline.get_status` this does not check
+        the jobs since that is already done concurrently on every poll by
+        :meth:`~jaypore_ci.jci.AsyncPipeline.run_async`.
+        """
+        for job in self.jobs.values():
+            if job.status == Status.RUNNING:
+                return Status.RUNNING
+        return self.__summarize_status__()
+
+    def publish(self, report: str, status: str):
+        """
+        Publish a report using the pipeline's remote. This is used by code
+        that is not async, for example when a normal executor checks jobs
+        during teardown.
+        """
+        if not isinstance(self.remote, AsyncRemote):
+            super().publish(report, status)
+            return
+        coro = self.async_remote.publish(report, status)
+        try:
+            task = asyncio.get_running_loop().create_task(coro)
+        except RuntimeError:
+            asyncio.run_coroutine_threadsafe(coro, self.__loop__).result()
+            return
+        # Keep a reference till it is done, the loop only keeps a weak one
+        self.__publishing__.add(task)
+        task.add_done_callback(self.__publishing__.discard)
+
+    async def publish_async(self) -> str:
+        """
+        Render the report and publish it via the async remote.
+        """
+        report, status = self.render_report()
+        with self.tracer.span("publish", "Pipeline"), self.metrics.timer(
+            "jayporeci_publish_seconds",
+            failures="jayporeci_publish_failures_total",
+            remote=type(self.remote).__name__,
+        ):
+            await self.async_remote.publish(report, status)
+        return report
+
+    async def run_async(self):
+        """
+        Run the pipeline on the current event loop. This is called
+        automatically when the context of the pipeline declaration finishes.
+        """
+        self.__loop__ = asyncio.get_running_loop()
+        self.__ensure_duplex__()
+        executor = self.async_executor
+        for stage in self.stages:
+            jobs = {name: job for name, job in self.jobs.items() if job.stage == stage}
+            await asyncio.gather(
+                *[
+                    job.trigger_async(executor)
+                    for job in jobs.values()
+                    if not job.parents
+                ]
+            )
+            while not all(job.is_complete() for job in jobs.values()):
+                newer = await executor.superseded_by()
+                if newer is not None:
+                    self.supersede(newer)
+                    await asyncio.gather(
+                        *[job.cancel_async(executor) for job in self.jobs.values()]
+                    )
+                    break
+                self.observe_queue(jobs)
+                # Services are complete as soon as they start, but we still
+                # want to know if they die.
+                await asyncio.gather(
+                    *[
+                        job.check_job_async(executor)
+                        for job in self.jobs.values()
+                        if not job.is_complete() or job.is_service
+                    ]
+                )
+                ready = []
+                for job in jobs.values():
+                    if job.status != Status.PENDING:
+                        continue
+                    parents = [jobs[parent_name] for parent_name in job.parents]
+                    if all(p.status == Status.PASSED for p in parents):
+                        ready.append(job)
+                    elif any(
+                        p.is_complete() and p.status != Status.PASSED for p in parents
+                    ):
+                        job.status = Status.SKIPPED
+                if self.should_fail_fast(stage, jobs):
+                    self.logging().error("Job failed, cancelling stage", stage=stage)
+                    await asyncio.gather(
+                        *[job.cancel_async(executor) for job in jobs.values()]
+                    )
+                    break
+                await asyncio.gather(*[job.trigger_async(executor) for job in ready])
+                await self.publish_async()
+                await asyncio.sleep(self.poll_interval)
+            if not all(
+                job.is_complete() and job.status == Status.PASSED
+                for job in jobs.values()
+            ):
+                self.logging().error("Stage failed")
+                break
+        if self.profiler is not None and self.profiler.in_report:
+            self.profiler.summarize()
+        report = await self.publish_async()
+        self.logging().info("Pipeline finished", report=report)
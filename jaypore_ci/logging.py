@@ -1,14 +1,114 @@
 """
 The basic logging module.
+
+Log events are rendered and written to stdout by a background thread so that
+the pipeline's polling loop never waits on the terminal. Events below
+`JAYPORECI_LOG_LEVEL` (`INFO` by default) are dropped before they are rendered.
+Set `JAYPORECI_LOG_FILE` to also append the logs to a file.
+
+If events are logged faster than they can be written, the ones that do not fit
+in the queue are dropped and counted instead of using up memory.
 """
+import os
+import sys
+import queue
+import atexit
 import logging
+import threading
+from collections import deque
 from typing import Any
 
 import structlog
 
 # This is used to accumulate logs and is later sent over to the CI status as a
 # separate log list
-jaypore_logs = []
+jaypore_logs = deque(maxlen=1000)
+
+
+class LogSink:
+    """
+    Renders log events and writes them out on a background thread. The last
+    `maxlen` rendered lines are kept in :data:`jaypore_logs`. At most
+    `maxsize` events wait to be written, any more are counted in `dropped`.
+    """
+
+    def __init__(self, logs: deque, path: str = None, maxsize: int = 10_000):
+        self.logs = logs
+        self.path = path
+        self.maxsize = maxsize
+        self.renderer = structlog.dev.ConsoleRenderer(colors=False)
+        self.queue = queue.Queue(maxsize)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+        os.register_at_fork(after_in_child=self.__after_fork__)
+
+    def __after_fork__(self):
+        self.queue = queue.Queue(self.maxsize)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, event) -> None:
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(
+                        target=self.run, name="jaypore-logs", daemon=True
+                    )
+                    self.thread.start()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def render(self, event) -> str:
+        if isinstance(event, dict):
+            return self.renderer(None, event.get("level", "info"), event)
+        return str(event)
+
+    def run(self) -> None:
+        out = None
+        while True:
+            event = self.queue.get()
+            try:
+                try:
+                    lines = [self.render(event)]
+                except Exception:  # pylint: disable=broad-except
+                    lines = [repr(event)]
+                if self.dropped:
+                    with self.lock:
+                        dropped, self.dropped = self.dropped, 0
+                    lines.insert(0, f"{dropped} log events dropped, queue was full")
+                for line in lines:
+                    self.logs.append(line)
+                    sys.stdout.write(line + "\n")
+                    if self.path is not None:
+                        if out is None:
+                            out = open(  # pylint: disable=consider-using-with
+                                self.path, "a", encoding="utf-8"
+                            )
+                        out.write(line + "\n")
+                if self.queue.empty():
+                    sys.stdout.flush()
+                    if out is not None:
+                        out.flush()
+            except OSError:
+                pass
+            finally:
+                self.queue.task_done()
+
+    def flush(self) -> None:
+        """
+        Wait till all pending events have been written.
+        """
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.join()
+
+
+sink = LogSink(jaypore_logs, os.environ.get("JAYPORECI_LOG_FILE"))
+atexit.register(sink.flush)
 
 
 class JayporeLogger:
@@ -27,12 +127,8 @@ class JayporeLogger:
     def __deepcopy__(self, memodict: dict[Any, Any] = None) -> "JayporeLogger":
         return self.__class__()
 
-    def msg(self, message: str) -> None:
-        global jaypore_logs  # pylint: disable=global-statement
-        jaypore_logs.append(message)
-        if len(jaypore_logs) > 1500:
-            jaypore_logs = jaypore_logs[-1000:]
-        print(message)
+    def msg(self, message: str = None, **event) -> None:
+        sink.put(message if message is not None else event)
 
     log = debug = info = warn = warning = msg
     fatal = failure = err = error = critical = exception = msg
@@ -46,6 +142,8 @@ class JayporeLoggerFactory:
         return JayporeLogger()
 
 
+LOG_LEVEL = os.environ.get("JAYPORECI_LOG_LEVEL", "INFO").upper()
+level = logging.getLevelName(LOG_LEVEL)
 structlog.configure(
     processors=[
         structlog.contextvars.merge_contextvars,
@@ -53,11 +151,17 @@ structlog.configure(
         # structlog.processors.StackInfoRenderer(),
         # structlog.dev.set_exc_info,
         structlog.processors.TimeStamper(fmt="iso"),
-        structlog.dev.ConsoleRenderer(colors=False),
+        # Tracebacks have to be formatted in the thread where they happened,
+        # everything else is rendered in the sink's thread.
+        structlog.processors.format_exc_info,
     ],
-    wrapper_class=structlog.make_filtering_bound_logger(logging.NOTSET),
+    wrapper_class=structlog.make_filtering_bound_logger(
+        level if isinstance(level, int) else logging.INFO
+    ),
     context_class=dict,
     logger_factory=JayporeLoggerFactory(),
     cache_logger_on_first_use=False,
 )
 logger = structlog.get_logger()
+if not isinstance(level, int):
+    logger.warning("Unknown JAYPORECI_LOG_LEVEL, using INFO", value=LOG_LEVEL)
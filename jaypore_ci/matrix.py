@@ -0,0 +1,148 @@
+"""
+Expansion of job matrices, used by :meth:`~jaypore_ci.jci.Pipeline.env_matrix`.
+
+Combinations are generated lazily, one at a time. `exclude` rules are checked
+while the combinations are being built so that excluded branches of the
+product are never visited.
+"""
+import random
+from itertools import chain, combinations
+from typing import Dict, Iterator, List, Tuple
+
+Combo = Dict[str, object]
+
+
+def is_excluded(combo: Combo, exclude: List[Combo]) -> bool:
+    """
+    Does the (possibly partial) combination match any of the exclude rules?
+    Rules only match once all of their keys have been assigned.
+    """
+    return any(
+        all(key in combo and combo[key] == value for key, value in rule.items())
+        for rule in exclude
+    )
+
+
+def product(axes: Dict[str, list], exclude: List[Combo]) -> Iterator[Combo]:
+    """
+    The cartesian product of all axes, skipping excluded combinations.
+    """
+    keys = sorted(axes)
+
+    def expand(combo, i):
+        if i == len(keys):
+            yield dict(combo)
+            return
+        for value in axes[keys[i]]:
+            combo[keys[i]] = value
+            if not is_excluded(combo, exclude):
+                yield from expand(combo, i + 1)
+            del combo[keys[i]]
+
+    yield from expand({}, 0)
+
+
+def pairwise(axes: Dict[str, list], exclude: List[Combo]) -> Iterator[Combo]:
+    """
+    A small set of combinations in which every pair of values of any two axes
+    appears at least once. Rows are built greedily, picking for each axis the
+    value that covers the most pairs that have not been covered yet. If the
+    greedy choices leave no allowed value for some axis, the row is searched
+    for exhaustively instead.
+    """
+    keys = sorted(axes)
+    if len(keys) < 2:
+        yield from product(axes, exclude)
+        return
+    uncovered = {
+        ((a, va), (b, vb))
+        for a, b in combinations(keys, 2)
+        for va in axes[a]
+        for vb in axes[b]
+        if not is_excluded({a: va, b: vb}, exclude)
+    }
+
+    def gain(combo, key, value):
+        return sum(
+            ((other, combo[other]), (key, value)) in uncovered
+            if other < key
+            else ((key, value), (other, combo[other])) in uncovered
+            for other in combo
+        )
+
+    while uncovered:
+        (a, va), (b, vb) = min(uncovered, key=repr)
+        combo = {a: va, b: vb}
+        for key in keys:
+            if key in combo:
+                continue
+            options = [
+                value
+                for value in axes[key]
+                if not is_excluded({**combo, key: value}, exclude)
+            ]
+            if not options:
+                break
+            combo[key] = max(options, key=lambda v: gain(combo, key, v))
+        if len(combo) < len(keys):
+            # The greedy choices ran into a dead end, search for any allowed
+            # combination that contains this pair instead.
+            combo = next(product({**axes, a: [va], b: [vb]}, exclude), None)
+        if combo is None:
+            # No allowed combination contains this pair
+            uncovered.discard(((a, va), (b, vb)))
+            continue
+        uncovered -= {((x, combo[x]), (y, combo[y])) for x, y in combinations(keys, 2)}
+        yield combo
+
+
+def shard(combos: Iterator[Combo], index: int, count: int) -> Iterator[Combo]:
+    for i, combo in enumerate(combos):
+        if i % count == index:
+            yield combo
+
+
+def sample(combos: Iterator[Combo], k: int, seed) -> List[Combo]:
+    """
+    Pick `k` combinations uniformly at random without holding all of them in
+    memory (reservoir sampling). The same seed always picks the same ones.
+    """
+    rng = random.Random(seed)
+    picked = []
+    for i, combo in enumerate(combos):
+        if i < k:
+            picked.append(combo)
+        else:
+            j = rng.randint(0, i)
+            if j < k:
+                picked[j] = combo
+    return picked
+
+
+def expand(
+    axes: Dict[str, list],
+    *,
+    include: List[Combo] = None,
+    exclude: List[Combo] = None,
+    mode: str = "product",
+    shard_of: Tuple[int, int] = None,
+    sample_size: int = None,
+    seed=None,
+) -> Iterator[Combo]:
+    """
+    Generate the combinations of a matrix. See
+    :meth:`~jaypore_ci.jci.Pipeline.env_matrix`.
+    """
+    exclude = exclude if exclude is not None else []
+    if mode == "product":
+        combos = product(axes, exclude)
+    elif mode == "pairwise":
+        combos = pairwise(axes, exclude)
+    else:
+        raise ValueError(f"Unknown matrix mode: {mode}")
+    combos = chain(combos, (dict(combo) for combo in include or []))
+    if shard_of is not None:
+        combos = shard(combos, *shard_of)
+    if sample_size is not None:
+        combos = iter(sample(combos, sample_size, seed))
+    return combos
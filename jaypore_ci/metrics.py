@@ -0,0 +1,174 @@
+"""
+Counters and histograms for the hot paths of a runner.
+
+Metrics are collected in memory while a pipeline runs. Once it finishes they
+are added to the totals stored in `metrics_dir` and written out in the
+`Prometheus textfile format
+<https://prometheus.io/docs/instrumenting/exposition_formats/>`_ as
+`jayporeci.prom`. Point the `node_exporter` textfile collector at
+`/tmp/jayporeci__state/metrics` on the host to scrape them.
+"""
+import os
+import json
+import time
+import fcntl
+import threading
+from copy import deepcopy
+from pathlib import Path
+from contextlib import contextmanager
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+COUNTS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+HELP = {
+    "jayporeci_docker_api_seconds": "Latency of docker API calls by method.",
+    "jayporeci_docker_api_failures_total": "Failed docker API calls by method.",
+    "jayporeci_publish_seconds": "Latency of publishing a report by remote.",
+    "jayporeci_publish_failures_total": "Failed report publishes by remote.",
+    "jayporeci_render_seconds": "Time taken to render a report by reporter.",
+    "jayporeci_jobs_total": "Finished jobs by status.",
+    "jayporeci_queue_depth": "Pending jobs seen on each poll of the pipeline.",
+    "jayporeci_trigger_lag_seconds": "Time from the last parent finishing to a "
+    "job being triggered.",
+}
+
+
+def label_key(labels: dict) -> str:
+    return json.dumps(sorted(labels.items()))
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def label_str(key: str, **extra) -> str:
+    pairs = json.loads(key) + sorted(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metrics:
+    """
+    An in memory collection of counters and histograms.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        # Executors may be called from a thread pool by the async pipeline
+        self.lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Increment a counter.
+        """
+        key = label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets=SECONDS, **labels):
+        """
+        Record a value in a histogram.
+        """
+        key = label_key(labels)
+        with self.lock:
+            hist = self.histograms.setdefault(name, {}).setdefault(
+                key,
+                {
+                    "buckets": list(buckets),
+                    "counts": [0] * len(buckets),
+                    "sum": 0,
+                    "count": 0,
+                },
+            )
+            for i, bound in enumerate(hist["buckets"]):
+                if value <= bound:
+                    hist["counts"][i] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    @contextmanager
+    def timer(self, name: str, *, failures: str = None, **labels):
+        """
+        Observe the time spent inside this context in the `name` histogram. If
+        an exception is raised and `failures` is given, that counter is
+        incremented as well.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            if failures is not None:
+                self.inc(failures, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def merge(self, other: dict):
+        """
+        Add the values from a dictionary created by :meth:`to_dict`.
+        """
+        for name, series in other.get("counters", {}).items():
+            for key, value in series.items():
+                mine = self.counters.setdefault(name, {})
+                mine[key] = mine.get(key, 0) + value
+        for name, series in other.get("histograms", {}).items():
+            for key, hist in series.items():
+                mine = self.histograms.setdefault(name, {})
+                if key not in mine:
+                    mine[key] = hist
+                    continue
+                for i, count in enumerate(hist["counts"]):
+                    mine[key]["counts"][i] += count
+                mine[key]["sum"] += hist["sum"]
+                mine[key]["count"] += hist["count"]
+
+    def to_dict(self) -> dict:
+        return {"counters": self.counters, "histograms": self.histograms}
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text format.
+        """
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{label_str(key)} {value}")
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, hist in sorted(series.items()):
+                for bound, count in zip(hist["buckets"], hist["counts"]):
+                    lines.append(f"{name}_bucket{label_str(key, le=bound)} {count}")
+                inf = label_str(key, le="+Inf")
+                lines.append(f"{name}_bucket{inf} {hist['count']}")
+                lines.append(f"{name}_sum{label_str(key)} {hist['sum']}")
+                lines.append(f"{name}_count{label_str(key)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, metrics_dir: str):
+        """
+        Add these metrics to the totals in `metrics_dir` and rewrite
+        `jayporeci.prom` there. Pipelines that finish at the same time take
+        turns using a lock file.
+        """
+        metrics_dir = Path(metrics_dir)
+        metrics_dir.mkdir(parents=True, exist_ok=True)
+        with open(metrics_dir / "jayporeci.lock", "w", encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            totals = Metrics()
+            state = metrics_dir / "jayporeci.json"
+            if state.exists():
+                totals.merge(json.loads(state.read_text(encoding="utf-8")))
+            totals.merge(deepcopy(self.to_dict()))
+            for path, text in [
+                (state, json.dumps(totals.to_dict())),
+                (metrics_dir / "jayporeci.prom", totals.render()),
+            ]:
+                tmp = Path(f"{path}.tmp")
+                tmp.write_text(text, encoding="utf-8")
+                os.replace(tmp, path)
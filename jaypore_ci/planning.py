@@ -0,0 +1,227 @@
+"""
+Plan a pipeline without running it.
+
+Set `JAYPORECI_PLAN=1` (or pass `plan=True` to the pipeline) and the pipeline
+is built as usual but none of it's jobs are run. No docker containers or
+networks are created and nothing is published. Instead the pipeline is
+checked for mistakes and a report is printed with when each job is expected to
+start and finish, the critical path, the total time and how many jobs run at
+the same time at most.
+
+Job durations are taken from, in order:
+
+1. The `expected_duration` (in seconds) given to the job, stage or pipeline.
+2. The median of the recorded durations in the run history, see
+   :mod:`~jaypore_ci.history`.
+3. :data:`DEFAULT_DURATION`. Services default to 0 since jobs only wait till
+   they are ready.
+"""
+import sqlite3
+import statistics
+from typing import Dict, List, NamedTuple, Set, Tuple
+
+from jaypore_ci.interfaces import Executor
+from jaypore_ci.logging import logger
+
+DEFAULT_DURATION = 60.0
+
+
+class DryRun(Executor):
+    """
+    Stands in for the pipeline's executor while planning. It never runs
+    anything.
+    """
+
+    def logging(self):
+        return logger.bind(pipe_id=self.pipe_id, planning=True)
+
+
+class Plan(NamedTuple):
+    errors: List[str]
+    start: Dict[str, float]
+    finish: Dict[str, float]
+    guessed: Set[str]
+    critical_path: List[str]
+    makespan: float
+    peak_parallelism: int
+
+
+def validate(pipeline: "Pipeline") -> Tuple[List[str], Set[str]]:
+    """
+    Check the jobs of a pipeline for unknown parents, cycles and jobs that
+    can never run. Returns the errors and the names of the jobs that can
+    never run.
+    """
+    jobs = pipeline.jobs
+    errors, broken = [], set()
+    for job in jobs.values():
+        if job.stage not in pipeline.stages:
+            errors.append(f"{job.name} is in unknown stage {job.stage}")
+            broken.add(job.name)
+        for parent in job.parents:
+            if parent not in jobs:
+                errors.append(f"{job.name} depends on unknown job {parent}")
+                broken.add(job.name)
+            elif jobs[parent].stage != job.stage:
+                errors.append(f"{job.name} depends on {parent} from another stage")
+                broken.add(job.name)
+    # --- cycles
+    state = {}
+
+    def visit(name, path):
+        state[name] = "visiting"
+        for parent in jobs[name].parents:
+            if parent not in jobs:
+                continue
+            if state.get(parent) == "visiting":
+                cycle = path[path.index(parent) :] + [parent]
+                errors.append(f"Cycle: {' -> '.join(cycle)}")
+                broken.update(cycle)
+            elif parent not in state:
+                visit(parent, path + [parent])
+        state[name] = "done"
+
+    for name in jobs:
+        if name not in state:
+            visit(name, [name])
+    # --- jobs that wait on broken jobs never run either
+    unreachable = set()
+    changed = True
+    while changed:
+        changed = False
+        for job in jobs.values():
+            if job.name in broken or job.name in unreachable:
+                continue
+            if any(p in broken or p in unreachable for p in job.parents):
+                unreachable.add(job.name)
+                changed = True
+    errors += [f"{name} can never run" for name in sorted(unreachable)]
+    return errors, broken | unreachable
+
+
+def recorded_duration(pipeline: "Pipeline", name: str) -> float:
+    """
+    The median duration of the job's recent passing runs in this repo,
+    preferring runs on the current branch. Returns `None` if there are none.
+    """
+    if pipeline.history is None:
+        return None
+    repo = pipeline.repo.remote
+    try:
+        durations = pipeline.history.durations(
+            name, repo=repo, branch=pipeline.repo.branch
+        ) or pipeline.history.durations(name, repo=repo)
+    except (sqlite3.Error, OSError):
+        return None
+    return statistics.median(durations) if durations else None
+
+
+def make_plan(pipeline: "Pipeline") -> Plan:
+    """
+    Validate the pipeline and estimate when each of it's jobs will run,
+    assuming that every job starts as soon as it's parents have passed.
+    """
+    errors, broken = validate(pipeline)
+    start, finish, guessed, previous = {}, {}, set(), {}
+    stage_start, last = 0.0, None
+    for stage in pipeline.stages:
+        jobs = [
+            job
+            for job in pipeline.jobs.values()
+            if job.stage == stage and job.name not in broken
+        ]
+        pending = {job.name: job for job in jobs}
+        while pending:
+            ready = [
+                job
+                for job in pending.values()
+                if not any(p in pending for p in job.parents)
+            ]
+            for job in ready:
+                duration = job.expected_duration
+                if duration is None:
+                    duration = recorded_duration(pipeline, job.name)
+                if duration is None:
+                    duration = 0.0 if job.is_service else DEFAULT_DURATION
+                    guessed.add(job.name)
+                parents = sorted(job.parents, key=lambda p: finish[p])
+                previous[job.name] = parents[-1] if parents else last
+                start[job.name] = finish[parents[-1]] if parents else stage_start
+                finish[job.name] = start[job.name] + duration
+                del pending[job.name]
+        if jobs:
+            last = max((job.name for job in jobs), key=lambda n: finish[n])
+            stage_start = finish[last]
+    critical_path = []
+    while last is not None:
+        critical_path.insert(0, last)
+        last = previous[last]
+    # Services keep running till the pipeline finishes
+    ends = {
+        name: stage_start if pipeline.jobs[name].is_service else at
+        for name, at in finish.items()
+    }
+    events = sorted(
+        [(at, 1) for at in start.values()] + [(at, -1) for at in ends.values()]
+    )
+    running = peak = 0
+    for _, change in events:
+        running += change
+        peak = max(peak, running)
+    return Plan(
+        errors=errors,
+        start=start,
+        finish=finish,
+        guessed=guessed,
+        critical_path=critical_path,
+        makespan=stage_start,
+        peak_parallelism=peak,
+    )
+
+
+def __fmt__(seconds: float) -> str:
+    seconds = int(round(seconds))
+    return f"{seconds // 60:>3}:{seconds % 60:02}"
+
+
+def render(pipeline: "Pipeline", plan: Plan) -> str:
+    """
+    The text report of a pipeline, with the expected start and finish of each
+    job instead of it's status. Jobs on the critical path are marked with
+    `★` and durations that are a guess with `?`.
+    """
+    max_name = max([len("jayporeci")] + [len(name) for name in pipeline.jobs])
+    name = ("JayporeCI" + " " * max_name)[:max_name]
+    graph = [
+        "",
+        "```jayporeci",
+        f"╔ 📋 : {name} [sha {pipeline.remote.sha[:10]}] plan",
+    ]
+    critical = set(plan.critical_path)
+    for stage in pipeline.stages:
+        jobs = [job for job in pipeline.jobs.values() if job.stage == stage]
+        if not jobs:
+            continue
+        graph += [f"┏━ {stage}", "┃"]
+        for job in sorted(
+            jobs, key=lambda j: (plan.start.get(j.name, float("inf")), j.name)
+        ):
+            mark = "★" if job.name in critical else " "
+            name = (job.name + " " * max_name)[:max_name]
+            if job.name in plan.start:
+                eta = f"{__fmt__(plan.start[job.name])} → {__fmt__(plan.finish[job.name])}"
+                eta += "?" if job.name in plan.guessed else " "
+            else:
+                eta = "  never run    "
+            graph += [f"┃ {mark} : {name} {eta}"]
+            if job.parents:
+                graph[-1] += f" ❮-- {job.parents}"
+        graph += ["┗" + "━" * (max_name + 24) + "┛"]
+    graph += [
+        f"Estimated time   : {__fmt__(plan.makespan).strip()}",
+        f"Most jobs at once: {plan.peak_parallelism}",
+        f"Critical path    : {' → '.join(plan.critical_path)}",
+    ]
+    graph += [f"Error: {error}" for error in plan.errors]
+    graph += ["```"]
+    return "\n".join(graph)
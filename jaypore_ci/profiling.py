@@ -0,0 +1,69 @@
+"""
+Profiling for the pipeline runner itself.
+
+Set `JAYPORECI_PROFILE=1` to profile the runner with `cProfile` from the moment
+the pipeline is created until it exits. This covers imports done after that,
+repo discovery, cleaning up old containers, network creation, scheduling and
+publishing. The raw profile is saved at `/jaypore_ci/run/jaypore_ci.prof` and a
+summary of the slowest functions at `/jaypore_ci/run/jaypore_ci.prof.txt`.
+
+Set `JAYPORECI_PROFILE=report` to also add the summary to the published report.
+"""
+import io
+import os
+import pstats
+import cProfile
+
+PROFILE_PATH = "/jaypore_ci/run/jaypore_ci.prof"
+
+
+class Profiler:
+    """
+    :param in_report: Add the summary to the rendered report.
+    :param top:       Number of functions to show in the summary.
+    """
+
+    def __init__(self, *, in_report: bool = False, top: int = 25):
+        self.in_report = in_report
+        self.top = top
+        self.summary = None
+        self.profile = cProfile.Profile()
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        """
+        Create a profiler if `JAYPORECI_PROFILE` is set, otherwise return `None`.
+        """
+        mode = os.environ.get("JAYPORECI_PROFILE", "").strip().lower()
+        if mode in ("", "0", "false", "no"):
+            return None
+        return cls(in_report=mode == "report")
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def summarize(self) -> str:
+        """
+        Update and return the summary of the slowest functions so far, sorted
+        by cumulative time.
+        """
+        self.stop()
+        out = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        self.summary = out.getvalue().strip()
+        self.start()
+        return self.summary
+
+    def save(self, path: str = PROFILE_PATH):
+        """
+        Stop profiling and write the profile along with it's summary.
+        """
+        self.summarize()
+        self.stop()
+        self.profile.dump_stats(path)
+        with open(f"{path}.txt", "w", encoding="utf-8") as fl:
+            fl.write(self.summary)
@@ -0,0 +1,111 @@
+"""
+Runs python callables as jobs.
+
+Callables are submitted to a `concurrent.futures` executor (a thread pool by
+default) and their futures are translated into
+:class:`~jaypore_ci.interfaces.JobStatus` so that they can be treated like any
+other job.
+"""
+import io
+import sys
+import threading
+import traceback
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable
+
+import pendulum
+
+from jaypore_ci.interfaces import JobStatus
+
+
+class ThreadStream:
+    """
+    Wraps a stream like `sys.stdout` so that writes coming from a thread that
+    is running a callable job go to that job's buffer. All other writes go to
+    the original stream.
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer if buffer is not None else self.original).write(text)
+
+    def flush(self):
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer if buffer is not None else self.original).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)
+
+
+@contextmanager
+def capture(buffer: io.StringIO):
+    """
+    Capture stdout and stderr of the current thread into the given buffer.
+    """
+    for name in ("stdout", "stderr"):
+        if not isinstance(getattr(sys, name), ThreadStream):
+            setattr(sys, name, ThreadStream(getattr(sys, name)))
+    sys.stdout.local.buffer = sys.stderr.local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        sys.stdout.local.buffer = sys.stderr.local.buffer = None
+
+
+def call(fn: Callable):
+    """
+    Call the given function and return a tuple of `(exit_code, logs,
+    started_at, finished_at)`.
+
+    The function is called without any arguments. If it raises an exception
+    the exit code is 1 and the traceback is added to the logs. If it returns
+    an integer that is used as the exit code, `False` is treated as 1 and
+    anything else is treated as a success.
+    """
+    started_at = pendulum.now()
+    with capture(io.StringIO()) as out:
+        try:
+            result = fn()
+            if isinstance(result, bool):
+                exit_code = 0 if result else 1
+            elif isinstance(result, int):
+                exit_code = result
+            else:
+                exit_code = 0
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc(file=out)
+            exit_code = 1
+    return exit_code, out.getvalue(), started_at, pendulum.now()
+
+
+def get_status(future: Future, started_at) -> JobStatus:
+    """
+    Translate a future obtained by submitting :func:`call` into a
+    :class:`~jaypore_ci.interfaces.JobStatus`.
+    """
+    if not future.done():
+        return JobStatus(
+            is_running=True,
+            exit_code=0,
+            logs="",
+            started_at=started_at,
+            finished_at=None,
+        )
+    try:
+        exit_code, logs, started_at, finished_at = future.result()
+    except Exception as e:  # pylint: disable=broad-except
+        # The pool itself failed, for example when the callable could not be
+        # pickled for a process pool.
+        exit_code, logs, finished_at = 1, repr(e), pendulum.now()
+    return JobStatus(
+        is_running=False,
+        exit_code=exit_code,
+        logs=logs,
+        started_at=started_at,
+        finished_at=finished_at,
+    )
@@ -0,0 +1,35 @@
+"""
+A pytest plugin that only runs the tests listed in a file, used by the shards
+of :meth:`~jaypore_ci.jci.Pipeline.sharded_job`.
+
+.. code-block:: console
+
+    $ python -m pytest -p jaypore_ci.pytest_shard --jayporeci-shard=ids.txt
+
+The file has one test id per line, as printed by `pytest --collect-only -q`.
+All other collected tests are deselected, so paths given on the command line
+still work.
+"""
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--jayporeci-shard",
+        metavar="PATH",
+        default=None,
+        help="Only run the test ids listed in this file, one per line.",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    path = config.getoption("jayporeci_shard")
+    if path is None:
+        return
+    with open(path, encoding="utf-8") as ids:
+        wanted = {line.strip() for line in ids if line.strip()}
+    selected, deselected = [], []
+    for item in items:
+        (selected if item.nodeid in wanted else deselected).append(item)
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
@@ -1,5 +1,17 @@
-from .mock import Mock
-from .git import GitRemote
-from .gitea import Gitea
-from .github import Github
-from .email import Email
+"""
+Remotes are where the status of a pipeline is published. Each one is imported
+when first used.
+"""
+from jaypore_ci._lazy import module_getattr
+
+__all__ = ["Mock", "GitRemote", "Gitea", "Github", "Email"]
+__getattr__, __dir__ = module_getattr(
+    __name__,
+    {
+        "Mock": "mock",
+        "GitRemote": "git",
+        "Gitea": "gitea",
+        "Github": "github",
+        "Email": "email",
+    },
+)
@@ -1,3 +1,10 @@
-from .common import clean_logs
-from .markdown import Markdown
-from .text import Text
+"""
+Reporters render the status of a pipeline. Each one is imported when first
+used.
+"""
+from jaypore_ci._lazy import module_getattr
+
+__all__ = ["clean_logs", "Markdown", "Text"]
+__getattr__, __dir__ = module_getattr(
+    __name__, {"clean_logs": "common", "Markdown": "markdown", "Text": "text"}
+)
@@ -66,8 +66,9 @@ flowchart {self.graph_direction}
                     continue
                 arrow = "." * ((i % mod) + 1)
                 arrow = f"-{arrow}->"
+                label = f"{n.name} ↻ {n.attempt}" if n.attempts else n.name
                 mermaid += f"""
-                s_{stage}(( )) {arrow} {ref[n.name]}({n.name}):::{st_map[n.status]}"""
+                s_{stage}(( )) {arrow} {ref[n.name]}({label}):::{st_map[n.status]}"""
             mod = __node_mod__([n for n in nodes if pipeline.jobs[n].parents])
             for i, (a, b) in enumerate(edges):
                 a, b = pipeline.jobs[a], pipeline.jobs[b]
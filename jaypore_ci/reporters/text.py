@@ -72,6 +72,8 @@ class Text(Reporter):
                 except FileNotFoundError:
                     report = " " * max_report
                 graph[-1] += f" {report}"
+                if n.attempts:
+                    graph[-1] += f" ↻ {n.attempt}/{n.retries + 1}"
                 if n.parents:
                     graph[-1] += f" ❮-- {n.parents}"
             graph += [closer]
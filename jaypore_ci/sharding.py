@@ -0,0 +1,129 @@
+"""
+Splitting a pytest job into shards of about equal duration, used by
+:meth:`~jaypore_ci.jci.Pipeline.sharded_job`.
+
+Test ids are collected inside the job's image. They are then packed into
+shards, longest first, using the durations recorded in the junit XML of the
+last run that passed. Tests that have not been seen before are assumed to take
+the median duration. Each shard gets a file with it's test ids, which the
+:mod:`~jaypore_ci.pytest_shard` plugin reads to select them.
+"""
+import os
+import heapq
+import shlex
+import statistics
+from typing import Dict, List
+from xml.etree import ElementTree
+
+JUNIT_DIR = "/jaypore_ci/state/junit"
+SHARD_DIR = ".jayporeci/junit"
+
+
+def collected_ids(logs: str) -> List[str]:
+    """
+    Test ids printed by `pytest --collect-only -q`.
+    """
+    ids = []
+    for line in logs.splitlines():
+        head, sep, _ = line.partition("::")
+        if sep and head and not head[0].isspace() and " " not in head:
+            ids.append(line.strip())
+    return ids
+
+
+def junit_key(test_id: str) -> tuple:
+    """
+    The `(classname, name)` that pytest writes in junit XML for a test id.
+    """
+    path, bracket, params = test_id.partition("[")
+    names = path.split("::")
+    names[0] = names[0].replace("/", ".")
+    if names[0].endswith(".py"):
+        names[0] = names[0][: -len(".py")]
+    names[-1] += bracket + params
+    return ".".join(names[:-1]), names[-1]
+
+
+def durations(path: str) -> Dict[tuple, float]:
+    """
+    Duration in seconds of every test in a junit XML file, keyed by
+    :func:`junit_key`. Returns an empty dict if the file cannot be read.
+    """
+    try:
+        tree = ElementTree.parse(path)
+    except (OSError, ElementTree.ParseError):
+        return {}
+    return {
+        (case.get("classname", ""), case.get("name", "")): float(case.get("time", 0))
+        for case in tree.iter("testcase")
+    }
+
+
+def pack(ids: List[str], known: Dict[tuple, float], count: int) -> List[List[str]]:
+    """
+    Split test ids into `count` shards with about the same total duration.
+    Each shard keeps the tests in the order in which they were collected.
+    """
+    default = statistics.median(known.values()) if known else 1.0
+    order = {test_id: i for i, test_id in enumerate(ids)}
+    cost = {test_id: known.get(junit_key(test_id), default) for test_id in ids}
+    loads = [(0.0, i) for i in range(count)]
+    shards = [[] for _ in range(count)]
+    for test_id in sorted(ids, key=lambda x: (-cost[x], order[x])):
+        load, i = heapq.heappop(loads)
+        shards[i].append(test_id)
+        heapq.heappush(loads, (load + cost[test_id], i))
+    return [sorted(shard, key=order.get) for shard in shards]
+
+
+def shard_command(
+    command: str, ids: List[str], ids_file: str, junit: str, run_dir: str = "."
+) -> str:
+    """
+    Write the given test ids to `ids_file` and return the command that runs
+    only those tests, using the :mod:`~jaypore_ci.pytest_shard` plugin.
+    Relative paths are resolved against the `run_dir` of the shard. Shards
+    without any tests do nothing.
+    """
+    if not ids:
+        return "true"
+    path = os.path.join(run_dir, ids_file)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(f"{test_id}\n" for test_id in ids)
+    return " ".join(
+        [
+            command,
+            "-p jaypore_ci.pytest_shard",
+            f"--jayporeci-shard={shlex.quote(ids_file)}",
+            f"--junitxml={junit}",
+        ]
+    )
+
+
+def merge(paths: List[str], out: str) -> dict:
+    """
+    Merge the junit XML of all shards into a single test suite written to
+    `out`, and return the totals.
+    """
+    suite = ElementTree.Element("testsuite", name="pytest")
+    totals = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0, "time": 0.0}
+    for path in paths:
+        for part in ElementTree.parse(path).iter("testsuite"):
+            for key in totals:
+                totals[key] += type(totals[key])(part.get(key, 0))
+            suite.extend(part.iter("testcase"))
+    for key, value in totals.items():
+        suite.set(key, f"{value:.3f}" if key == "time" else str(value))
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    tree = ElementTree.ElementTree(ElementTree.Element("testsuites"))
+    tree.getroot().append(suite)
+    tree.write(out, encoding="utf-8", xml_declaration=True)
+    return totals
+
+
+def shard_paths(name: str, count: int) -> List[str]:
+    """
+    Where each shard of a job writes it's junit XML, relative to the repo.
+    """
+    return [os.path.join(SHARD_DIR, f"{name}-{i}.xml") for i in range(1, count + 1)]
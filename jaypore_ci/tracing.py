@@ -0,0 +1,105 @@
+"""
+Records where the time in a pipeline goes.
+
+Events are stored in the `Chrome trace event format
+<https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU>`_
+so that the saved file can be opened in `Perfetto <https://ui.perfetto.dev>`_ or
+`chrome://tracing`. Each job gets it's own track.
+"""
+import os
+import json
+import time
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Union
+
+Timestamp = Union[float, datetime]
+
+
+def to_us(at: Timestamp) -> int:
+    """
+    Convert a unix timestamp or a datetime to microseconds.
+    """
+    if isinstance(at, datetime):
+        at = at.timestamp()
+    return int(at * 1_000_000)
+
+
+class Tracer:
+    """
+    Collects trace events for a pipeline.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.events = []
+        self.tracks = {}
+
+    def track(self, name: str) -> int:
+        """
+        Return the thread id used for the given track, creating it if needed.
+        """
+        if name not in self.tracks:
+            self.tracks[name] = len(self.tracks) + 1
+            self.events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": 1,
+                    "tid": self.tracks[name],
+                    "args": {"name": name},
+                }
+            )
+        return self.tracks[name]
+
+    def complete(self, name: str, track: str, start: Timestamp, end: Timestamp, **args):
+        """
+        Record a span that has already finished.
+        """
+        self.events.append(
+            {
+                "name": name,
+                "ph": "X",
+                "pid": 1,
+                "tid": self.track(track),
+                "ts": to_us(start),
+                "dur": max(to_us(end) - to_us(start), 0),
+                "args": args,
+            }
+        )
+
+    def instant(self, name: str, track: str, at: Timestamp = None, **args):
+        """
+        Record something that happened at a single point in time.
+        """
+        self.events.append(
+            {
+                "name": name,
+                "ph": "i",
+                "s": "t",
+                "pid": 1,
+                "tid": self.track(track),
+                "ts": to_us(at if at is not None else time.time()),
+                "args": args,
+            }
+        )
+
+    @contextmanager
+    def span(self, name: str, track: str, **args):
+        """
+        Record the time spent inside this context as a span.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.complete(name, track, start, time.time(), **args)
+
+    def save(self, path: str):
+        """
+        Write all events to the given path as a JSON trace.
+        """
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fl:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, fl)
+        os.replace(tmp, path)
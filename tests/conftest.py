@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-import unittest
+import unittest.mock
 
 import pytest
 import tests.subprocess_mock  # pylint: disable=unused-import
@@ -11,6 +11,87 @@ import tests.jayporeci_patch  # pylint: disable=unused-import
 from jaypore_ci import jci, executors, remotes, reporters, repos
 
 
+BENCHMARKS = pytest.StashKey[list]()
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        default=False,
+        help="Run the benchmarks in tests/test_benchmark.py",
+    )
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: slow, only run with --benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmark"):
+        return
+    skip = pytest.mark.skip(reason="Needs --benchmark to run")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.stash.get(BENCHMARKS, [])
+    if not results:
+        return
+    terminalreporter.section("benchmarks")
+    tables = {}
+    for row in results:
+        tables.setdefault(tuple(row.keys()), []).append(row)
+    for keys, rows in tables.items():
+        terminalreporter.write_line("  ".join(f"{key:>14}" for key in keys))
+        for row in rows:
+            terminalreporter.write_line(
+                "  ".join(
+                    f"{value:>14.4f}" if isinstance(value, float) else f"{value:>14}"
+                    for value in row.values()
+                )
+            )
+        terminalreporter.write_line("")
+
+
+@pytest.fixture
+def benchmark_results(request):
+    if BENCHMARKS not in request.config.stash:
+        request.config.stash[BENCHMARKS] = []
+    return request.config.stash[BENCHMARKS]
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(monkeypatch, tmp_path):
+    "Keep tests from reading or adding to the host's run history and state"
+    defaults = jci.Pipeline.__init__.__kwdefaults__
+    monkeypatch.setitem(defaults, "history_path", None)
+    monkeypatch.setitem(defaults, "metrics_dir", None)
+    defaults = executors.Docker.__init__.__kwdefaults__
+    monkeypatch.setitem(defaults, "superseded_dir", str(tmp_path / "superseded"))
+
+
+@pytest.fixture
+def mock_pipeline():
+    "Returns a function that builds a pipeline which publishes to a mock remote"
+
+    def build(**kwargs):
+        repo = repos.Git.from_env()
+        kwargs["executor"] = kwargs.get("executor", executors.Docker())
+        kwargs["history_path"] = kwargs.get("history_path")
+        kwargs["metrics_dir"] = kwargs.get("metrics_dir")
+        return jci.Pipeline(
+            poll_interval=0,
+            repo=repo,
+            remote=remotes.Mock.from_env(repo=repo),
+            **kwargs,
+        )
+
+    return build
+
+
 def idfn(x):
     name = []
     for _, item in sorted(x.items()):
@@ -1,10 +1,13 @@
 import random
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 
 import pendulum
 import docker
 
 
+ExecResult = namedtuple("ExecResult", "exit_code output")
+
+
 def cid(short=False):
     n_chars = 12 if short else 64
     return "".join(random.sample("0123456789abcdef" * 10, n_chars))
@@ -13,16 +16,51 @@ def cid(short=False):
 class Network:
     def __init__(self, **kwargs):
         self.__dict__.update(kwargs)
+        self.attrs = {
+            "Labels": kwargs.get("labels", {}),
+            "Created": str(pendulum.now()),
+        }
+        # Containers that are not known to the mock, like the runner
+        self.endpoints = set()
 
     def remove(self, **_):
-        pass
+        active = self.endpoints | {
+            c.id
+            for c in Containers.boxes.values()
+            if c.status == "running"
+            and self.name in c.attrs["NetworkSettings"]["Networks"]
+        }
+        if active:
+            raise docker.errors.APIError(f"network {self.name} has active endpoints")
+        Networks.nets.pop(self.name, None)
+
+    def connect(self, container, **_):
+        if container in Containers.boxes or isinstance(container, Container):
+            container = Containers.boxes.get(container, container)
+            container.attrs["NetworkSettings"]["Networks"][self.name] = {}
+        else:
+            self.endpoints.add(container)
+
+    def disconnect(self, container, **_):
+        if container in self.endpoints:
+            self.endpoints.discard(container)
+            return
+        container = Containers.boxes.get(container, container)
+        container.attrs["NetworkSettings"]["Networks"].pop(self.name, None)
 
 
 class Networks:
     nets = {}
 
-    def list(self, names):
-        return list(filter(None, [self.nets.get(name) for name in names]))
+    def list(self, names=None, filters=None):
+        nets = self.nets.values() if names is None else map(self.nets.get, names)
+        label = (filters or {}).get("label", "=").split("=", 1)
+        return [
+            net
+            for net in nets
+            if net is not None
+            and (not label[0] or net.attrs["Labels"].get(label[0]) == label[1])
+        ]
 
     def create(self, **kwargs):
         name = kwargs.get("name")
@@ -30,26 +68,44 @@ class Networks:
         return name
 
     def get(self, name):
+        if name not in self.nets:
+            raise docker.errors.NotFound(name)
         return self.nets[name]
 
 
 class Container:
     def __init__(self, **kwargs):
         self.id = cid()
+        self.labels = {}
         self.__dict__.update(kwargs)
         self.FinishedAt = "0001-01-01T00:00:00Z"
         self.ExitCode = 0
+        self.status = "running"
         self.attrs = {
             "State": {
                 "StartedAt": getattr(self, "StartedAt", None),
                 "FinishedAt": getattr(self, "FinishedAt", None),
-            }
+                "ExitCode": 0,
+            },
+            "NetworkSettings": {"Networks": {}},
         }
+        if getattr(self, "network", None) is not None:
+            self.attrs["NetworkSettings"]["Networks"][self.network] = {}
 
     def logs(self):
         return b""
 
+    def exec_run(self, cmd, **_):
+        return ExecResult(exit_code=0, output=b"")
+
+    def rename(self, name):
+        self.name = name
+
+    def reload(self):
+        pass
+
     def stop(self, **_):
+        self.status = "exited"
         self.FinishedAt = str(pendulum.now())
         self.attrs["State"]["FinishedAt"] = self.FinishedAt
         self.ExitCode = 0
@@ -62,7 +118,12 @@ class Containers:
     boxes = {}
 
     def get(self, container_id):
-        return self.boxes[container_id]
+        if container_id in self.boxes:
+            return self.boxes[container_id]
+        for container in self.boxes.values():
+            if getattr(container, "name", None) == container_id:
+                return container
+        raise docker.errors.NotFound(container_id)
 
     def run(self, **kwargs):
         kwargs["StartedAt"] = str(pendulum.now())
@@ -70,18 +131,56 @@ class Containers:
         self.boxes[c.id] = c
         return c
 
-    def list(self, **_):
-        return list(Containers.boxes.values())
+    def list(self, filters=None, **_):
+        filters = filters or {}
+        label = filters.get("label", "=").split("=", 1)
+        return [
+            c
+            for c in Containers.boxes.values()
+            if filters.get("name", "") in c.name
+            and filters.get("status", c.status) == c.status
+            and (not label[0] or c.labels.get(label[0]) == label[1])
+            and filters.get("network", getattr(c, "network", None))
+            == getattr(c, "network", None)
+        ]
+
+
+class Image:
+    def __init__(self, tag, size, created):
+        self.tags = [tag]
+        self.attrs = {"Size": size, "Created": created}
+
+
+class Images:
+    images = {}
+
+    def list(self):
+        return list(self.images.values())
+
+    def remove(self, image, **_):
+        if any(getattr(c, "image", None) == image for c in Containers.boxes.values()):
+            raise docker.errors.APIError(f"image {image} is being used")
+        self.images.pop(image, None)
 
 
 class Docker:
     networks = Networks()
     containers = Containers()
+    images = Images()
 
 
 class APIClient:
     max_running = {}
     reported_running = defaultdict(int)
+    images = {}
+
+    def build(self, **kwargs):
+        yield {"stream": "Step 1/2 : FROM python:3.11\n"}
+        yield {"stream": "Step 2/2 : RUN pip install poetry\n"}
+        self.images[kwargs["tag"]] = kwargs
+
+    def tag(self, image, repository, **_):
+        self.images[repository] = self.images[image]
 
     def inspect_container(self, container_id):
         if container_id not in self.max_running:
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from jaypore_ci import artifacts
+
+
+def test_identical_files_are_stored_once(tmp_path):
+    store = artifacts.Store(root=tmp_path / "store", host_root="/host/store")
+    (tmp_path / "a.txt").write_text("same")
+    (tmp_path / "b.txt").write_text("same")
+    manifest = store.snapshot(tmp_path, ["*.txt"])
+    assert manifest["a.txt"] == manifest["b.txt"]
+    assert len([p for p in (tmp_path / "store").rglob("*") if p.is_file()]) == 1
+
+
+def test_views_link_to_stored_files(tmp_path):
+    store = artifacts.Store(root=tmp_path / "store", host_root="/host/store")
+    (tmp_path / "out").mkdir()
+    (tmp_path / "out" / "report.xml").write_text("<ok/>")
+    manifest = store.snapshot(tmp_path, ["out"])
+    view = store.view("pipe/Test", {"Build": manifest})
+    linked = view / "Build" / "out" / "report.xml"
+    assert linked.read_text() == "<ok/>"
+    assert os.stat(linked).st_nlink == 2
+    assert str(store.host_path(view)) == "/host/store/views/pipe/Test"
+    store.release("pipe")
+    assert not view.exists()
+
+
+def test_missing_outputs_are_reported(tmp_path):
+    store = artifacts.Store(root=tmp_path / "store")
+    with pytest.raises(artifacts.MissingOutput):
+        store.snapshot(tmp_path, ["nothing-here"])
@@ -0,0 +1,176 @@
+"""
+Benchmarks for the scheduler and reporters. They are skipped unless pytest is
+run with `--benchmark`:
+
+    python -m pytest tests/test_benchmark.py --benchmark
+
+Pipelines of different shapes are run against the docker mock with
+`poll_interval=0` and the numbers are printed at the end of the run. The 1000
+job pipelines take several minutes each.
+"""
+import sys
+import time
+import random
+import statistics
+import subprocess
+import tracemalloc
+from collections import Counter
+
+import pytest
+
+from tests import docker_mock
+from jaypore_ci import jci, executors, remotes, reporters, repos
+
+
+def wide(p, n):
+    for i in range(n):
+        p.job(f"Job{i}", "x")
+
+
+def chain(p, n):
+    p.job("Job0", "x")
+    for i in range(1, n):
+        p.job(f"Job{i}", "x", depends_on=[f"Job{i-1}"])
+
+
+def diamond(p, n):
+    p.job("Root", "x")
+    for i in range(n - 2):
+        p.job(f"Job{i}", "x", depends_on=["Root"])
+    p.job("Sink", "x", depends_on=[f"Job{i}" for i in range(n - 2)])
+
+
+def counted(calls, name, fn):
+    def wrapper(*args, **kwargs):
+        calls[name] += 1
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+
+@pytest.fixture
+def docker_calls(monkeypatch):
+    calls = Counter()
+    for cls, name in [
+        (docker_mock.APIClient, "inspect_container"),
+        (docker_mock.Containers, "get"),
+        (docker_mock.Containers, "run"),
+        (docker_mock.Containers, "list"),
+    ]:
+        monkeypatch.setattr(cls, name, counted(calls, name, getattr(cls, name)))
+    return calls
+
+
+@pytest.fixture
+def ticks(monkeypatch):
+    calls = Counter()
+    monkeypatch.setattr(jci.time, "sleep", counted(calls, "sleep", lambda _: None))
+    return calls
+
+
+def run_pipeline(shape, n_jobs):
+    random.seed(0)
+    repo = repos.Git.from_env()
+    pipeline = jci.Pipeline(
+        poll_interval=0,
+        repo=repo,
+        remote=remotes.Mock.from_env(repo=repo),
+        executor=executors.Docker(),
+    )
+    with pipeline as p:
+        shape(p, n_jobs)
+    return pipeline
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize(
+    "shape,n_jobs",
+    [
+        (shape, n_jobs)
+        for shape in (wide, chain, diamond)
+        for n_jobs in (10, 100, 1000)
+        # A chain of 1000 jobs needs several thousand ticks which takes hours
+        # against the mock.
+        if not (shape is chain and n_jobs == 1000)
+    ],
+    ids=lambda x: getattr(x, "__name__", str(x)),
+)
+def test_scheduler(shape, n_jobs, docker_calls, ticks, benchmark_results):
+    start = time.perf_counter()
+    pipeline = run_pipeline(shape, n_jobs)
+    elapsed = time.perf_counter() - start
+    n_ticks = max(ticks["sleep"], 1)
+    n_docker_calls = sum(docker_calls.values())
+    # Memory is measured in a separate run since tracing slows everything down
+    tracemalloc.start()
+    run_pipeline(shape, n_jobs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    render = {}
+    for reporter in (reporters.Text(), reporters.Markdown()):
+        pipeline.reporter = reporter
+        start = time.perf_counter()
+        reporter.render(pipeline)
+        render[type(reporter).__name__] = time.perf_counter() - start
+    benchmark_results.append(
+        {
+            "shape": shape.__name__,
+            "jobs": n_jobs,
+            "ticks": n_ticks,
+            "ms/tick": elapsed * 1000 / n_ticks,
+            "docker/tick": n_docker_calls / n_ticks,
+            "text ms": render["Text"] * 1000,
+            "markdown ms": render["Markdown"] * 1000,
+            "peak MiB": peak / 2**20,
+        }
+    )
+    assert all(job.is_complete() for job in pipeline.jobs.values())
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("module", ["jaypore_ci.jci", "jaypore_ci.executors.docker"])
+def test_import_time(module, benchmark_results):
+    timings = []
+    for _ in range(5):
+        start = time.perf_counter()
+        with subprocess.Popen([sys.executable, "-c", f"import {module}"]) as proc:
+            proc.wait()
+        timings.append(time.perf_counter() - start)
+    benchmark_results.append(
+        {"import": module, "median ms": statistics.median(timings) * 1000}
+    )
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("shape", [wide, chain, diamond], ids=lambda x: x.__name__)
+@pytest.mark.parametrize("n_jobs", [1000, 10000])
+def test_construction(shape, n_jobs, benchmark_results):
+    repo = repos.Git.from_env()
+    remote = remotes.Mock.from_env(repo=repo)
+
+    def build():
+        pipeline = jci.Pipeline(
+            repo=repo, remote=remote, executor=executors.Docker(), env={"A": "1"}
+        )
+        with pipeline.stage("Checks", env={"B": "2"}):
+            shape(pipeline, n_jobs)
+        for job in pipeline.jobs.values():
+            job.get_env()
+        return pipeline
+
+    start = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    pipeline = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    benchmark_results.append(
+        {
+            "build": shape.__name__,
+            "jobs": n_jobs,
+            "ms": elapsed * 1000,
+            "bytes/job": size / n_jobs,
+        }
+    )
+    assert len(pipeline.jobs) == n_jobs
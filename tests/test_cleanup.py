@@ -0,0 +1,72 @@
+import os
+
+import docker
+
+from jaypore_ci import artifacts, cleanup
+from tests.docker_mock import Image, Images
+
+
+def make_src(root, sha, size, last_used):
+    path = root / f"jayporeci__src__{sha}"
+    path.mkdir()
+    (path / "file").write_bytes(b"x" * size)
+    os.utime(path, (last_used, last_used))
+    return path
+
+
+def test_parse_size():
+    assert cleanup.parse_size("512") == 512
+    assert cleanup.parse_size("2K") == 2048
+    assert cleanup.parse_size("1.5G") == int(1.5 * 1024**3)
+    assert cleanup.parse_size("20gb") == 20 * 1024**3
+
+
+def test_least_recently_used_sources_are_evicted_first(tmp_path):
+    oldest = make_src(tmp_path, "a", 100, 1000)
+    old = make_src(tmp_path, "b", 100, 2000)
+    current = make_src(tmp_path, "c", 100, 500)
+    newest = make_src(tmp_path, "d", 100, 4000)
+    evicted = cleanup.collect(tmp_path, 250, keep=["c"])
+    assert evicted == ["a", "b"]
+    assert not oldest.exists() and not old.exists()
+    assert current.exists() and newest.exists()
+
+
+def test_nothing_is_evicted_within_budget(tmp_path):
+    make_src(tmp_path, "a", 100, 1000)
+    assert not cleanup.collect(tmp_path, 1000)
+
+
+def test_only_removed_images_count_as_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(Images, "images", {})
+    client = docker.from_env()
+    for sha, created in [("a", "2020-01-01"), ("b", "2020-01-02")]:
+        tag = f"im_jayporeci__pipe__{sha}"
+        client.images.images[tag] = Image(tag, 100, created)
+    # The runner of an old pipeline is still around
+    runner = client.containers.run(
+        name="jayporeci__pipe__a", image="im_jayporeci__pipe__a"
+    )
+    runner.stop()
+    # Something else is still using this image
+    user = client.containers.run(name="other", image="im_jayporeci__pipe__b")
+    try:
+        assert cleanup.collect(tmp_path, 0, client=client) == ["a"]
+        assert list(client.images.images) == ["im_jayporeci__pipe__b"]
+    finally:
+        user.remove()
+
+
+def test_stored_outputs_count_towards_the_budget(tmp_path):
+    store = artifacts.Store(root=tmp_path / "store", host_root=None)
+    (tmp_path / "old.txt").write_bytes(b"o" * 100)
+    (tmp_path / "used.txt").write_bytes(b"u" * 100)
+    old, used = store.put(tmp_path / "old.txt"), store.put(tmp_path / "used.txt")
+    os.utime(store.object_path(old), (1000, 1000))
+    os.utime(store.object_path(used), (1000, 1000))
+    # A running pipeline has a view of this one
+    store.view("pipe", {"job": {"used.txt": used}})
+    make_src(tmp_path, "a", 100, 2000)
+    assert cleanup.collect(tmp_path, 150, store=tmp_path / "store") == ["a"]
+    assert not store.object_path(old).exists()
+    assert store.object_path(used).exists()
@@ -0,0 +1,73 @@
+import time
+import threading
+
+from jaypore_ci import daemon, executors, remotes, repos, jci
+from jaypore_ci.interfaces import Status
+
+
+def test_main_branch_gets_a_bigger_share():
+    scheduler = daemon.Scheduler(2)
+    features = [scheduler.submit("repo", "feature", f"f{i}") for i in range(3)]
+    main = scheduler.submit("repo", "main", "m")
+    assert [t.granted for t in features] == [True, True, False]
+    assert not main.granted
+    scheduler.release(features[0])
+    assert main.granted and not features[2].granted
+
+
+def test_branches_take_turns():
+    scheduler = daemon.Scheduler(1)
+    a = [scheduler.submit("repo", "a", f"a{i}") for i in range(3)]
+    b = scheduler.submit("other-repo", "b", "b")
+    granted = []
+    for _ in range(4):
+        ticket = next(iter(scheduler.running))
+        granted.append(ticket.name)
+        scheduler.release(ticket)
+    assert granted == ["a0", "a1", "b", "a2"]
+    assert not scheduler.running and a[2].granted and b.granted
+
+
+def test_jobs_wait_for_a_slot(tmp_path):
+    path = str(tmp_path / "d.sock")
+    server = daemon.Daemon(path, daemon.Scheduler(1))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    repo = repos.Git.from_env()
+    pipeline = jci.Pipeline(
+        poll_interval=0,
+        repo=repo,
+        remote=remotes.Mock.from_env(repo=repo),
+        executor=executors.Subprocess(working_dir=tmp_path, log_dir=tmp_path),
+        daemon_client=daemon.Client(path),
+    )
+    try:
+        with pipeline as p:
+            p.job("first", "sleep 0.2")
+            p.job("second", "sleep 0.2")
+        # Slots are freed once the runner hangs up
+        for _ in range(50):
+            if not daemon.status(path)["running"]:
+                break
+            time.sleep(0.05)
+        assert daemon.status(path) == {"budget": 1, "running": [], "queued": []}
+    finally:
+        server.shutdown()
+        server.server_close()
+    first, second = sorted(
+        (job.run_state for job in pipeline.jobs.values()), key=lambda s: s.started_at
+    )
+    assert second.started_at >= first.finished_at
+
+
+def test_jobs_run_without_a_daemon(tmp_path):
+    repo = repos.Git.from_env()
+    pipeline = jci.Pipeline(
+        poll_interval=0,
+        repo=repo,
+        remote=remotes.Mock.from_env(repo=repo),
+        executor=executors.Subprocess(working_dir=tmp_path, log_dir=tmp_path),
+        daemon_client=daemon.Client(str(tmp_path / "missing.sock")),
+    )
+    with pipeline as p:
+        p.job("only", "true")
+    assert pipeline.jobs["only"].status == Status.PASSED
@@ -0,0 +1,32 @@
+from jaypore_ci import history
+
+
+def test_runs_and_jobs_are_recorded(tmp_path, mock_pipeline):
+    path = tmp_path / "history.sqlite"
+    for _ in range(2):
+        with mock_pipeline(history_path=path) as p:
+            p.job("lint", "python -m pylint .")
+            p.job("test", "python -m pytest", depends_on=["lint"])
+    store = history.History(path)
+    records = store.jobs(name="lint")
+    assert len(records) == 2
+    assert {r.command_hash for r in records} == {
+        history.command_hash("python -m pylint .")
+    }
+    assert records[0].branch == p.repo.branch
+    assert records[0].repo == p.repo.remote
+    assert store.jobs(repo="https://example.com/other.git") == []
+    assert len(store.jobs()) == 4
+    assert len(store.jobs(limit=1)) == 1
+    assert store.jobs(branch="some-other-branch") == []
+    for record in store.jobs(status="PASSED"):
+        assert record.duration >= 0
+    assert (store.db.execute("select count(*) from runs").fetchone()) == (2,)
+
+
+def test_callables_are_hashed_by_name():
+    def build():
+        pass
+
+    assert history.command_hash(build) == history.command_hash(build)
+    assert history.command_hash(build) != history.command_hash("build")
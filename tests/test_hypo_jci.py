@@ -1,4 +1,4 @@
-from hypothesis import given, strategies as st, settings, HealthCheck
+from hypothesis import given, assume, strategies as st, settings, HealthCheck
 
 from jaypore_ci.clean import allowed_alphabet
 
@@ -6,6 +6,8 @@ from jaypore_ci.clean import allowed_alphabet
 @given(st.text(alphabet=allowed_alphabet, min_size=1))
 @settings(suppress_health_check=[HealthCheck.function_scoped_fixture], deadline=500)
 def test_hypo_jobs(pipeline, name):
+    # "Pipeline" is the name of the default stage and is rejected as a job name.
+    assume(name != "Pipeline")
     pipeline = pipeline()
     with pipeline as p:
         p.job(name, name)
@@ -1,6 +1,19 @@
+import sys
+import time
+import subprocess
+import json
+import asyncio
+
+import docker
+import pendulum
 import pytest
+import tests.docker_mock
+import structlog
+from jaypore_ci import jci, executors, remotes, repos, artifacts, profiling
 from jaypore_ci.changelog import version_map
 from jaypore_ci.config import const
+from jaypore_ci.interfaces import Status, AsyncExecutor, AsyncRemote, JobStatus, Probe
+from jaypore_ci.logging import logger
 
 
 def test_sanity():
@@ -100,3 +113,522 @@ def test_env_matrix_is_easy_to_make(pipeline):
         for i, env in enumerate(p.env_matrix(A=[1, 2, 3], B=[5, 6, 7])):
             p.job(f"job{i}", "fake command", env=env)
     assert len(pipeline.jobs) == 9
+
+
+def test_jobs_share_defaults(monkeypatch, mock_pipeline):
+    monkeypatch.setenv("JAYPORE_SHARED", "yes")
+    pipeline = mock_pipeline(env={"A": "1"})
+    with pipeline.stage("Checks", env={"B": "2"}):
+        first = pipeline.job("first", "x")
+        second = pipeline.job("second", "x", depends_on=["first"], env={"C": "3"})
+        third = pipeline.job("third", "x")
+    assert not hasattr(first, "__dict__")
+    assert first.env is third.env
+    assert first.outputs is second.outputs
+    assert second.parents[0] is first.name
+    assert {"SHARED": "yes", "A": "1", "C": "3"}.items() <= second.get_env().items()
+    assert {"SHARED": "yes", "A": "1", "B": "2"}.items() <= first.get_env().items()
+    assert "B" not in second.get_env()
+
+
+def test_subprocess_executor_runs_jobs_on_host(tmp_path, mock_pipeline):
+    pipeline = mock_pipeline(
+        executor=executors.Subprocess(working_dir=tmp_path, log_dir=tmp_path)
+    )
+    with pipeline as p:
+        p.job("first", "echo hello > out.txt")
+        p.job("second", "cat out.txt", depends_on=["first"])
+        p.job("broken", "exit 3")
+        p.job("never", "echo never", depends_on=["broken"])
+    order = pipeline.executor.get_execution_order()
+    assert order["first"] < order["second"]
+    assert "never" not in order
+    assert pipeline.jobs["second"].status == Status.PASSED
+    assert "hello" in pipeline.jobs["second"].logs["stdout"]
+    assert pipeline.jobs["broken"].run_state.exit_code == 3
+    assert pipeline.jobs["never"].status == Status.SKIPPED
+
+
+def test_subprocess_executor_kills_jobs_on_timeout(tmp_path, mock_pipeline):
+    pipeline = mock_pipeline(
+        executor=executors.Subprocess(working_dir=tmp_path, log_dir=tmp_path)
+    )
+    with pipeline as p:
+        p.job("sleepy", "sleep 30", timeout=0)
+    assert pipeline.jobs["sleepy"].status == Status.FAILED
+
+
+def test_failed_jobs_are_retried(tmp_path, monkeypatch, mock_pipeline):
+    monkeypatch.setattr(jci, "RETRY_DELAY", 0)
+    flaky = "test -f {0} || (touch {0} && echo Connection refused && exit 3)"
+    pipeline = mock_pipeline(
+        executor=executors.Subprocess(working_dir=tmp_path, log_dir=tmp_path),
+        history_path=tmp_path / "history.sqlite",
+    )
+    with pipeline as p:
+        p.job("flaky", flaky.format("a"), retries=2)
+        p.job("after", "echo after", depends_on=["flaky"])
+        p.job("by-log", flaky.format("b"), retries=1, retry_on=["refused"])
+        p.job("by-code", flaky.format("c"), retries=1, retry_on=[3])
+        p.job("other-code", flaky.format("d"), retries=1, retry_on=[4])
+        p.job("broken", "exit 3", retries=2)
+    for name in ("flaky", "after", "by-log", "by-code"):
+        assert pipeline.jobs[name].status == Status.PASSED
+    assert pipeline.jobs["flaky"].attempt == 2
+    assert pipeline.jobs["flaky"].attempts[0].exit_code == 3
+    assert "Connection refused" in pipeline.jobs["flaky"].attempts[0].logs
+    assert pipeline.jobs["other-code"].status == Status.FAILED
+    assert pipeline.jobs["other-code"].attempt == 1
+    assert pipeline.jobs["broken"].status == Status.FAILED
+    assert pipeline.jobs["broken"].attempt == 3
+    with open("/jaypore_ci/run/jaypore_ci.status.txt", "r", encoding="utf-8") as fl:
+        assert "↻ 3/3" in fl.read()
+    records = pipeline.history.jobs(name="flaky")
+    assert [(r.attempt, r.status) for r in records] == [(2, "PASSED"), (1, "FAILED")]
+
+
+@pytest.mark.parametrize("pipeline_class", [jci.Pipeline, jci.AsyncPipeline])
+def test_fail_fast_cancels_the_stage(tmp_path, pipeline_class):
+    repo = repos.Git.from_env()
+    pipeline = pipeline_class(
+        poll_interval=0,
+        repo=repo,
+        remote=remotes.Mock.from_env(repo=repo),
+        executor=executors.Subprocess(working_dir=tmp_path, log_dir=tmp_path),
+    )
+    started = time.time()
+    with pipeline as p:
+        with p.stage("Checks", fail_fast=True):
+            p.job("broken", "exit 3")
+            p.job("slow", "sleep 30")
+            p.job("after", "echo after", depends_on=["slow"])
+        with p.stage("Deploy"):
+            p.job("deploy", "echo deploy")
+    assert time.time() - started < 10
+    assert pipeline.jobs["broken"].status == Status.FAILED
+    for name in ("slow", "after", "deploy"):
+        assert pipeline.jobs[name].status in (Status.SKIPPED, Status.PENDING)
+    assert pipeline.jobs["slow"].cancelled
+    assert pipeline.jobs["after"].run_id is None
+
+
+def test_outputs_are_passed_to_inputs(tmp_path, mock_pipeline):
+    # Outputs are found in the directory the job ran in, not the current one
+    store = artifacts.Store(root=tmp_path / "store", host_root=None)
+    pipeline = mock_pipeline(
+        executor=executors.Subprocess(working_dir=tmp_path, log_dir=tmp_path / "logs"),
+        artifact_store=store,
+    )
+    with pipeline as p:
+        p.job("build", "mkdir -p dist && echo wheel > dist/a.whl", outputs=["dist"])
+        p.job("test", "cat $JAYPORE_INPUTS/build/dist/a.whl", inputs=["build"])
+        p.job("lost", "echo", outputs=["missing.txt"])
+        p.job("never", "echo", inputs=["lost"])
+        with p.stage("Publish"):
+            p.job("upload", "cat $JAYPORE_INPUTS/build/dist/a.whl", inputs=["build"])
+    assert pipeline.jobs["test"].parents == ["build"]
+    assert pipeline.jobs["test"].status == Status.PASSED
+    assert "wheel" in pipeline.jobs["test"].logs["stdout"]
+    # Inputs from earlier stages are not dependencies
+    assert pipeline.jobs["upload"].parents == []
+    assert pipeline.jobs["lost"].status == Status.FAILED
+    assert pipeline.jobs["never"].status == Status.SKIPPED
+    assert not (tmp_path / "store" / "views" / pipeline.pipe_id).exists()
+
+
+def test_pipeline_trace_is_saved(mock_pipeline):
+    pipeline = mock_pipeline()
+    with pipeline as p:
+        p.job("lint", "x")
+        p.job("test", "x", depends_on=["lint"])
+    with open(jci.TRACE_PATH, "r", encoding="utf-8") as fl:
+        events = json.load(fl)["traceEvents"]
+    tracks = {e["args"]["name"]: e["tid"] for e in events if e["ph"] == "M"}
+    assert {"lint", "test", "Pipeline"} <= set(tracks)
+    spans = {(e["tid"], e["name"]) for e in events if e["ph"] == "X"}
+    for name in ("wait", "trigger", "run"):
+        assert (tracks["test"], name) in spans
+    assert (tracks["Pipeline"], "publish") in spans
+    lint_run, test_wait = [
+        e
+        for e in events
+        if (e["tid"], e["name"]) in [(tracks["lint"], "run"), (tracks["test"], "wait")]
+    ]
+    assert test_wait["ts"] >= lint_run["ts"] + lint_run["dur"]
+
+
+def test_profile_is_added_to_report(monkeypatch, mock_pipeline):
+    monkeypatch.setenv("JAYPORECI_PROFILE", "report")
+    pipeline = mock_pipeline()
+    with pipeline as p:
+        p.job("lint", "x")
+    with open("/jaypore_ci/run/jaypore_ci.status.txt", "r", encoding="utf-8") as fl:
+        assert "function calls" in fl.read()
+    with open(f"{profiling.PROFILE_PATH}.txt", "r", encoding="utf-8") as fl:
+        assert "jci.py" in fl.read()
+
+
+def test_backends_are_imported_lazily():
+    code = "import sys, jaypore_ci.jci; print(' '.join(sys.modules))"
+    with subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE) as proc:
+        modules = set(proc.communicate()[0].decode().split())
+    for module in ["docker", "requests", "tqdm", "smtplib", "jaypore_ci.remotes.gitea"]:
+        assert module not in modules
+    # Only needed once a pipeline is made, or for some of it's features
+    for name in [
+        "artifacts",
+        "daemon",
+        "history",
+        "matrix",
+        "metrics",
+        "planning",
+        "profiling",
+        "sharding",
+        "tracing",
+    ]:
+        assert f"jaypore_ci.{name}" not in modules
+    for module in ["sqlite3", "socketserver", "cProfile"]:
+        assert module not in modules
+    assert executors.Docker is executors.docker.Docker
+    assert "Gitea" in dir(remotes)
+
+
+def test_callable_jobs_run_in_python_pool(mock_pipeline):
+    def parse_commit():
+        print("parsed commit")
+
+    def validate_config():
+        raise ValueError("bad config")
+
+    pipeline = mock_pipeline()
+    with pipeline as p:
+        p.job("parse", parse_commit)
+        p.job("lint", "x", depends_on=["parse"])
+        p.job("validate", validate_config)
+        p.job("deploy", "x", depends_on=["validate"])
+    assert pipeline.jobs["parse"].status == Status.PASSED
+    assert "parsed commit" in pipeline.jobs["parse"].logs["stdout"]
+    assert pipeline.jobs["lint"].status == Status.PASSED
+    assert pipeline.jobs["validate"].status == Status.FAILED
+    assert any("bad config" in l for l in pipeline.jobs["validate"].logs["stdout"])
+    assert pipeline.jobs["deploy"].status == Status.SKIPPED
+
+
+def test_async_pipeline_follows_call_chain():
+    repo = repos.Git.from_env()
+    pipeline = jci.AsyncPipeline(
+        poll_interval=0,
+        repo=repo,
+        remote=remotes.Mock.from_env(repo=repo),
+        executor=executors.Docker(),
+    )
+    with pipeline as p:
+        p.job("x", "x")
+        p.job("y", "y", depends_on=["x"])
+        p.job("z", "z", depends_on=["y"])
+        p.job("parse", lambda: print("parsed"))
+    order = pipeline.executor.get_execution_order()
+    assert order["x"] < order["y"] < order["z"]
+    assert pipeline.get_status() == Status.PASSED
+
+
+def test_async_pipeline_works_inside_event_loop():
+    class Immediate(AsyncExecutor):
+        def logging(self):
+            return logger
+
+        async def run(self, job):
+            return job.name
+
+        async def get_status(self, run_id):
+            return JobStatus(False, 1 if run_id == "bad" else 0, "", None, None)
+
+    async def main():
+        repo = repos.Git.from_env()
+        async with jci.AsyncPipeline(
+            poll_interval=0,
+            repo=repo,
+            remote=remotes.Mock.from_env(repo=repo),
+            executor=Immediate(),
+        ) as p:
+            p.job("good", "x")
+            p.job("bad", "x")
+            p.job("afterbad", "x", depends_on=["bad"])
+        return p
+
+    pipeline = asyncio.run(main())
+    assert pipeline.jobs["good"].status == Status.PASSED
+    assert pipeline.jobs["bad"].status == Status.FAILED
+    assert pipeline.jobs["afterbad"].status == Status.SKIPPED
+
+
+def test_async_pipeline_runs_on_a_single_loop():
+    class Immediate(AsyncExecutor):
+        async def run(self, job):
+            return job.name
+
+        async def get_status(self, run_id):
+            return JobStatus(False, 0, "", None, None)
+
+    class Recorder(AsyncRemote):
+        loops = set()
+        published = []
+
+        async def setup(self):
+            self.loops.add(asyncio.get_running_loop())
+
+        async def publish(self, report, status):
+            self.loops.add(asyncio.get_running_loop())
+            await asyncio.sleep(0)
+            self.published.append(status)
+
+        async def teardown(self):
+            self.pipeline.publish("report", "final")
+
+    repo = repos.Git.from_env()
+    remote = Recorder(sha=repo.sha, branch=repo.branch)
+    pipeline = jci.AsyncPipeline(
+        poll_interval=0, repo=repo, remote=remote, executor=Immediate()
+    )
+    remote.pipeline = pipeline
+    with pipeline as p:
+        p.job("x", "x")
+    assert len(Recorder.loops) == 1
+    assert Recorder.published[-1] == "final"
+    assert "pipe_id" in structlog.get_context(pipeline.logging())
+
+
+def test_services_pass_once_probe_succeeds(tmp_path, mock_pipeline):
+    pipeline = mock_pipeline(
+        executor=executors.Subprocess(working_dir=tmp_path, log_dir=tmp_path)
+    )
+    with pipeline as p:
+        p.job(
+            "db",
+            "sleep 1 && touch ready.txt && sleep 30",
+            is_service=True,
+            probe=Probe.command("test -f ready.txt", initial_delay=0.1),
+        )
+        p.job("migrate", "cat ready.txt", depends_on=["db"])
+    assert pipeline.jobs["db"].ready
+    assert pipeline.jobs["migrate"].status == Status.PASSED
+
+
+def test_services_time_out_if_never_ready(tmp_path, mock_pipeline):
+    pipeline = mock_pipeline(
+        executor=executors.Subprocess(working_dir=tmp_path, log_dir=tmp_path)
+    )
+    with pipeline as p:
+        p.job(
+            "db", "sleep 30", is_service=True, probe=Probe.command("false", timeout=0)
+        )
+        p.job("migrate", "true", depends_on=["db"])
+    assert pipeline.jobs["db"].status == Status.TIMEOUT
+    assert pipeline.jobs["migrate"].status == Status.SKIPPED
+
+
+def test_docker_services_are_probed_inside_container(mock_pipeline):
+    pipeline = mock_pipeline()
+    with pipeline as p:
+        p.job("db", None, is_service=True, probe=Probe.command("pg_isready"))
+        p.job("migrate", "x", depends_on=["db"])
+    assert pipeline.jobs["db"].ready
+    order = pipeline.executor.get_execution_order()
+    assert order["db"] < order["migrate"]
+
+
+def test_docker_teardown_removes_the_network(monkeypatch, mock_pipeline):
+    pipeline = mock_pipeline()
+    with pipeline as p:
+        p.job("x", "x")
+        p.executor.join_network()
+    networks = pipeline.executor.docker.networks
+    assert not networks.list(names=[pipeline.executor.get_net()])
+    # Something else is still connected to the network
+    monkeypatch.setattr(time, "sleep", lambda _: None)
+    pipeline = mock_pipeline()
+    with pytest.raises(docker.errors.APIError):
+        with pipeline as p:
+            p.job("x", "x")
+            networks.get(p.executor.get_net()).connect("someone_else")
+    networks.get(pipeline.executor.get_net()).disconnect("someone_else")
+    pipeline.executor.delete_network()
+
+
+def test_shared_services_are_reused_across_pipelines(mock_pipeline):
+    run_ids = []
+    for _ in range(2):
+        pipeline = mock_pipeline()
+        with pipeline as p:
+            p.job("db", None, image="postgres", is_service=True, reuse="v1")
+            p.job("test", "x", depends_on=["db"])
+        run_ids.append(pipeline.jobs["db"].run_id)
+        container = pipeline.executor.docker.containers.get(run_ids[-1])
+        assert container.status == "running"
+        assert "__idle__" in container.name
+        # It would keep the first pipeline's checkout
+        assert not any("jayporeci__src__" in v for v in container.volumes)
+    assert run_ids[0] == run_ids[1]
+    assert any(
+        "jayporeci__src__" in v
+        for v in pipeline.executor.docker.containers.get(
+            pipeline.jobs["test"].run_id
+        ).volumes
+    )
+    pipeline.executor.service_idle_timeout = -1
+    # A pipeline that has connected to it but not renamed it yet
+    container.attrs["NetworkSettings"]["Networks"]["jayporeci__net__other"] = {}
+    pipeline.executor.delete_idle_services()
+    assert container.status == "running"
+    del container.attrs["NetworkSettings"]["Networks"]["jayporeci__net__other"]
+    pipeline.executor.delete_idle_services()
+    assert container.status == "exited"
+
+
+def test_build_jobs_use_docker_build_api(mock_pipeline):
+    pipeline = mock_pipeline()
+    with pipeline as p:
+        p.build("Image", tag="jcienv:abc", target="jcienv")
+        p.job("Lint", "x", image="jcienv:abc", depends_on=["Image"])
+    order = pipeline.executor.get_execution_order()
+    assert order["Image"] < order["Lint"]
+    assert pipeline.jobs["Image"].status == Status.PASSED
+    assert "Step 2/2 : RUN pip install poetry" in pipeline.jobs["Image"].logs["stdout"]
+    assert "--target jcienv" in pipeline.jobs["Image"].command
+    cache = pipeline.executor.get_cache_image(pipeline.jobs["Image"])
+    assert pipeline.executor.client.images[cache]["target"] == "jcienv"
+
+
+def test_builds_can_be_cancelled(monkeypatch, mock_pipeline):
+    def endless_build(self, **kwargs):
+        while True:
+            time.sleep(0.01)
+            yield {"stream": "still building\n"}
+
+    monkeypatch.setattr(tests.docker_mock.APIClient, "build", endless_build)
+    pipeline = mock_pipeline()
+    job = pipeline.build("Image", tag="x", context="docker", dockerfile="Dev")
+    assert "-f docker/Dev" in job.command
+    run_id = pipeline.executor.run(job)
+    assert pipeline.executor.get_status(run_id).is_running
+    pipeline.executor.stop(run_id)
+    for _ in range(100):
+        status = pipeline.executor.get_status(run_id)
+        if not status.is_running:
+            break
+        time.sleep(0.01)
+    assert not status.is_running and status.exit_code == 1
+    assert "Build cancelled" in status.logs
+
+
+def test_docker_resumes_jobs_of_a_crashed_runner(monkeypatch, mock_pipeline):
+    def define(p):
+        p.job("lint", "x lint")
+        p.job("test", "x test")
+        p.job("killed", "x killed")
+        p.job("changed", "x changed")
+        p.job("build", "x build", depends_on=["lint", "test"])
+
+    # A runner that dies after starting some of the jobs
+    monkeypatch.setattr(jci.Pipeline, "__get_pipe_id__", lambda self: "crashed")
+    crashed = mock_pipeline(executor=executors.Docker(resume=True))
+    define(crashed)
+    crashed.jobs["changed"].command = "x old"
+    containers = crashed.executor.docker.containers
+    run_ids = {
+        name: crashed.executor.run(crashed.jobs[name])
+        for name in ("lint", "test", "killed", "changed")
+    }
+    containers.get(run_ids["test"]).stop()
+    containers.get(run_ids["killed"]).stop()
+    containers.get(run_ids["killed"]).attrs["State"]["ExitCode"] = 137
+    # The next push of the same commit
+    monkeypatch.setattr(jci.Pipeline, "__get_pipe_id__", lambda self: "resumed")
+    with mock_pipeline(executor=executors.Docker(resume=True)) as p:
+        define(p)
+    for name in ("lint", "test"):
+        assert p.jobs[name].run_id == run_ids[name]
+        assert p.jobs[name].status == Status.PASSED
+    for name in ("killed", "changed"):
+        assert p.jobs[name].run_id != run_ids[name]
+    kinds = {name: kind for name, _, kind in p.executor.__execution_order__}
+    assert kinds == {
+        "lint": "Resume",
+        "test": "Resume",
+        "killed": "Run",
+        "changed": "Run",
+        "build": "Run",
+    }
+    # Once the resumed pipeline finishes, there is nothing left to resume
+    monkeypatch.setattr(jci.Pipeline, "__get_pipe_id__", lambda self: "again")
+    with mock_pipeline(executor=executors.Docker(resume=True)) as p:
+        define(p)
+    assert p.jobs["lint"].run_id != run_ids["lint"]
+    # Jobs of a pipeline whose runner is still running are left alone
+    runner = containers.run(name=f"jayporeci__pipe__{p.repo.sha}")
+    monkeypatch.setattr(jci.Pipeline, "__get_pipe_id__", lambda self: runner.id)
+    alive = mock_pipeline(executor=executors.Docker(resume=True))
+    define(alive)
+    alive_id = alive.executor.run(alive.jobs["lint"])
+    monkeypatch.setattr(jci.Pipeline, "__get_pipe_id__", lambda self: "other")
+    with mock_pipeline(executor=executors.Docker(resume=True)) as p:
+        define(p)
+    assert p.jobs["lint"].run_id != alive_id
+    runner.stop()
+    containers.get(alive_id).stop()
+    alive.executor.teardown()
+
+
+def test_superseded_pipelines_are_cancelled(monkeypatch, tmp_path, mock_pipeline):
+    containers = tests.docker_mock.Containers()
+
+    def other_pipeline(sha, runner):
+        monkeypatch.setattr(jci.Pipeline, "__get_pipe_id__", lambda self: runner)
+        repo = repos.Git.from_env()
+        repo.sha = sha
+        pipeline = jci.Pipeline(
+            poll_interval=0,
+            repo=repo,
+            remote=remotes.Mock.from_env(repo=repo),
+            executor=executors.Docker(),
+        )
+        pipeline.job("slow", "x")
+        pipeline.job("later", "x", depends_on=["slow"])
+        pipeline.jobs["slow"].trigger()
+        return pipeline, containers.get(pipeline.jobs["slow"].run_id)
+
+    # A pipeline for an older commit on the same branch is still running
+    old, container = other_pipeline(
+        "0ld0ld0ld0ld", containers.run(name="jayporeci__pipe__0ld0ld0ld0ld").id
+    )
+    # This one's runner died, it is left for resuming
+    dead, dead_container = other_pipeline("dead0dead0dead", "dead_runner")
+    # This one was started after the newer commit was pushed
+    newer, newer_container = other_pipeline(
+        "n3w3rn3w3r", containers.run(name="jayporeci__pipe__n3w3rn3w3r").id
+    )
+    newer_net = newer.executor.docker.networks.get(newer.executor.get_net())
+    newer_net.attrs["Created"] = str(pendulum.now().add(minutes=1))
+    # The newer commit is pushed
+    monkeypatch.setattr(jci.Pipeline, "__get_pipe_id__", lambda self: "new_runner")
+    with mock_pipeline() as p:
+        p.job("x", "x")
+    assert container.status == "exited"
+    assert old.executor.superseded_by() == p.repo.sha
+    assert (tmp_path / "superseded" / old.pipe_id).exists()
+    for pipeline, job in [(dead, dead_container), (newer, newer_container)]:
+        assert job.status == "running"
+        assert pipeline.executor.superseded_by() is None
+    # The older pipeline notices on it's next poll
+    old.run()
+    old.executor.teardown()
+    assert old.get_status() == Status.SKIPPED
+    assert old.jobs["later"].status == Status.SKIPPED
+    with open("/jaypore_ci/run/jaypore_ci.status.txt", "r", encoding="utf-8") as fl:
+        assert f"Superseded by {p.repo.sha[:10]}" in fl.read()
+    assert old.executor.superseded_by() is None
+    assert not old.executor.docker.networks.list(names=[old.executor.get_net()])
+    for pipeline in (dead, newer):
+        pipeline.executor.teardown()
+    for name in ("0ld0ld0ld0ld", "n3w3rn3w3r"):
+        containers.get(f"jayporeci__pipe__{name}").remove()
@@ -0,0 +1,47 @@
+import os
+import sys
+import subprocess
+import threading
+from collections import deque
+
+from jaypore_ci.logging import logger, jaypore_logs, sink, LogSink
+
+
+def test_only_recent_logs_are_kept():
+    for i in range(1200):
+        logger.info("Recent log", i=i)
+    sink.flush()
+    assert len(jaypore_logs) == jaypore_logs.maxlen
+    assert "i=1199" in jaypore_logs[-1]
+
+
+def test_debug_logs_are_dropped_by_default():
+    logger.info("Before debug")
+    logger.debug("Hidden debug")
+    sink.flush()
+    assert "Before debug" in jaypore_logs[-1]
+    assert not any("Hidden debug" in line for line in jaypore_logs)
+
+
+def test_events_are_dropped_when_the_queue_is_full():
+    logs = deque(maxlen=10)
+    small = LogSink(logs, maxsize=2)
+    small.thread = threading.current_thread()  # Nothing is writing yet
+    for i in range(5):
+        small.put(f"event {i}")
+    assert small.dropped == 3
+    small.thread = threading.Thread(target=small.run, daemon=True)
+    small.thread.start()
+    small.flush()
+    assert list(logs) == ["3 log events dropped, queue was full", "event 0", "event 1"]
+
+
+def test_unknown_log_level_falls_back_to_info():
+    env = {**os.environ, "JAYPORECI_LOG_LEVEL": "chatty"}
+    code = "from jaypore_ci.logging import logger; logger.info('Still logging')"
+    with subprocess.Popen(
+        [sys.executable, "-c", code], env=env, stdout=subprocess.PIPE
+    ) as proc:
+        out = proc.communicate()[0].decode()
+    assert "Unknown JAYPORECI_LOG_LEVEL" in out
+    assert "Still logging" in out
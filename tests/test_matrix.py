@@ -0,0 +1,86 @@
+from itertools import combinations
+
+import pytest
+
+from jaypore_ci import jci, matrix
+from jaypore_ci.exceptions import BadConfig
+
+AXES = {
+    "OS": ["linux", "mac", "windows"],
+    "PY": ["3.8", "3.9", "3.10"],
+    "DB": ["pg", "sqlite"],
+}
+
+
+def test_env_matrix_excludes_partial_combinations():
+    envs = list(jci.Pipeline.env_matrix(exclude=[{"OS": "mac", "PY": "3.8"}], **AXES))
+    assert len(envs) == 18 - 2
+    assert not any(env["OS"] == "mac" and env["PY"] == "3.8" for env in envs)
+
+
+def test_env_matrix_includes_extra_combinations():
+    envs = list(jci.Pipeline.env_matrix(include=[{"OS": "bsd"}], A=[1, 2]))
+    assert envs == [{"A": 1}, {"A": 2}, {"OS": "bsd"}]
+
+
+def test_pairwise_covers_all_pairs():
+    axes = {key: [1, 2, 3] for key in "ABCD"}
+    exclude = [{"A": 1, "B": 2}]
+    envs = list(jci.Pipeline.env_matrix(mode="pairwise", exclude=exclude, **axes))
+    assert len(envs) < 3**4
+    assert not any(env["A"] == 1 and env["B"] == 2 for env in envs)
+    for a, b in combinations(sorted(axes), 2):
+        for va in axes[a]:
+            for vb in axes[b]:
+                if (a, va, b, vb) == ("A", 1, "B", 2):
+                    continue
+                assert any(env[a] == va and env[b] == vb for env in envs)
+
+
+def test_pairwise_covers_pairs_when_greedy_choice_dead_ends():
+    axes = {"A": [0, 1, 2], "B": [0, 1], "C": [0, 1, 2], "D": [0, 1]}
+    exclude = [
+        {"C": 1, "A": 1},
+        {"D": 1, "B": 1},
+        {"B": 0, "D": 1, "A": 1},
+        {"A": 0, "B": 1, "D": 0},
+    ]
+    envs = list(jci.Pipeline.env_matrix(mode="pairwise", exclude=exclude, **axes))
+    assert not any(matrix.is_excluded(env, exclude) for env in envs)
+    assert any(env["B"] == 1 and env["C"] == 0 for env in envs)
+    everything = list(jci.Pipeline.env_matrix(exclude=exclude, **axes))
+    for a, b in combinations(sorted(axes), 2):
+        for va in axes[a]:
+            for vb in axes[b]:
+                if any(env[a] == va and env[b] == vb for env in everything):
+                    assert any(env[a] == va and env[b] == vb for env in envs)
+
+
+def test_shards_partition_the_matrix():
+    everything = list(jci.Pipeline.env_matrix(**AXES))
+    shards = [list(jci.Pipeline.env_matrix(shard=(i, 4), **AXES)) for i in range(4)]
+    assert sorted(map(repr, sum(shards, []))) == sorted(map(repr, everything))
+
+
+def test_samples_are_repeatable():
+    first = list(jci.Pipeline.env_matrix(sample=5, seed=42, **AXES))
+    again = list(jci.Pipeline.env_matrix(sample=5, seed=42, **AXES))
+    assert len(first) == 5
+    assert first == again
+
+
+def test_unknown_mode_is_an_error():
+    with pytest.raises(ValueError):
+        list(jci.Pipeline.env_matrix(mode="random", **AXES))
+
+
+def test_keys_named_like_options():
+    axes = {"mode": ["fast", "safe"], "seed": [1, 2]}
+    envs = list(jci.Pipeline.env_matrix(axes, mode="pairwise", A=[0]))
+    assert len(envs) == 4
+    assert {(env["mode"], env["seed"], env["A"]) for env in envs} == {
+        (m, s, 0) for m in ["fast", "safe"] for s in [1, 2]
+    }
+    for option in ["include", "exclude", "mode", "shard", "sample", "seed"]:
+        with pytest.raises(BadConfig, match=option):
+            list(jci.Pipeline.env_matrix(A=[1, 2], **{option: [1, 2]}))
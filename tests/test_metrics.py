@@ -0,0 +1,36 @@
+import pytest
+
+from jaypore_ci import metrics
+
+
+def test_render_in_prometheus_text_format():
+    m = metrics.Metrics()
+    m.inc("jayporeci_jobs_total", status="PASSED")
+    m.observe("jayporeci_queue_depth", 3, buckets=(1, 5))
+    text = m.render()
+    assert "# TYPE jayporeci_jobs_total counter" in text
+    assert 'jayporeci_jobs_total{status="PASSED"} 1' in text
+    assert 'jayporeci_queue_depth_bucket{le="1"} 0' in text
+    assert 'jayporeci_queue_depth_bucket{le="5"} 1' in text
+    assert 'jayporeci_queue_depth_bucket{le="+Inf"} 1' in text
+    assert "jayporeci_queue_depth_sum 3" in text
+
+
+def test_timer_counts_failures():
+    m = metrics.Metrics()
+    with pytest.raises(ValueError):
+        with m.timer("call_seconds", failures="call_failures_total", method="run"):
+            raise ValueError()
+    assert m.histograms["call_seconds"]['[["method", "run"]]']["count"] == 1
+    assert m.counters["call_failures_total"]['[["method", "run"]]'] == 1
+
+
+def test_save_adds_to_totals(tmp_path):
+    for _ in range(2):
+        m = metrics.Metrics()
+        m.inc("jayporeci_jobs_total", status="FAILED")
+        m.observe("jayporeci_render_seconds", 0.2, reporter="Text")
+        m.save(tmp_path)
+    text = (tmp_path / "jayporeci.prom").read_text()
+    assert 'jayporeci_jobs_total{status="FAILED"} 2' in text
+    assert 'jayporeci_render_seconds_count{reporter="Text"} 2' in text
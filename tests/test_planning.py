@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from jaypore_ci import jci, planning
+from jaypore_ci.exceptions import BadConfig
+
+
+def test_plan_estimates_without_running(tmp_path, capsys, mock_pipeline):
+    pipeline = mock_pipeline(plan=True, history_path=tmp_path / "history.sqlite")
+    with pipeline as p:
+        p.job("lint", "x", expected_duration=30)
+        p.job("unit", "x", expected_duration=120)
+        p.job("integration", "x", expected_duration=60, depends_on=["lint"])
+        p.job("db", "x", is_service=True)
+        with p.stage("Deploy", expected_duration=10):
+            p.job("deploy", "x")
+            p.job("guess", "x", expected_duration=None)
+    assert isinstance(pipeline.executor, planning.DryRun)
+    assert all(job.run_id is None for job in pipeline.jobs.values())
+    plan = pipeline.get_plan()
+    assert plan.errors == []
+    assert plan.critical_path == ["unit", "guess"]
+    assert plan.start["deploy"] == 120
+    assert plan.makespan == 120 + planning.DEFAULT_DURATION
+    assert plan.peak_parallelism == 3
+    assert plan.guessed == {"db", "guess"}
+    out = capsys.readouterr().out
+    assert "Estimated time   : 3:00" in out
+    assert "★ : unit" in out
+
+
+def test_plan_uses_recorded_durations(tmp_path, mock_pipeline):
+    path = tmp_path / "history.sqlite"
+    with mock_pipeline(history_path=path) as p:
+        p.job("lint", "x")
+    with mock_pipeline(plan=True, history_path=path) as p:
+        p.job("lint", "x")
+    assert p.get_plan().guessed == set()
+
+
+def test_plan_finds_broken_dags(monkeypatch):
+    monkeypatch.setenv("JAYPORECI_PLAN", "1")
+    pipeline = jci.Pipeline(remote=None, history_path=None)
+    a = pipeline.job("a", "x")
+    b = pipeline.job("b", "x", depends_on=["a"])
+    pipeline.job("c", "x", depends_on=["b"])
+    pipeline.job("d", "x")
+    a.parents = ["b"]
+    pipeline.jobs["d"].parents = ["missing"]
+    errors = pipeline.get_plan().errors
+    assert "Cycle: a -> b -> a" in errors or "Cycle: b -> a -> b" in errors
+    assert "d depends on unknown job missing" in errors
+    assert "c can never run" in errors
+    with pytest.raises(BadConfig):
+        pipeline.print_plan()
+
+
+def test_plan_is_not_printed_when_the_pipeline_raises(capsys):
+    pipeline = jci.Pipeline(plan=True, remote=None, history_path=None)
+    with pytest.raises(ValueError):
+        with pipeline as p:
+            p.job("a", "x")
+            raise ValueError("bad config")
+    assert "Estimated time" not in capsys.readouterr().out
+
+
+def test_async_plan_is_not_printed_when_the_pipeline_raises(capsys):
+    async def main():
+        async with jci.AsyncPipeline(plan=True, remote=None, history_path=None) as p:
+            p.job("a", "x")
+            raise ValueError("bad config")
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+    assert "Estimated time" not in capsys.readouterr().out
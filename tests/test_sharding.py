@@ -0,0 +1,83 @@
+import os
+import sys
+
+from jaypore_ci import executors, sharding
+from jaypore_ci.interfaces import Status
+
+# The shards load the jaypore_ci pytest plugin
+ENV = {"PYTHONPATH": os.path.dirname(os.path.dirname(sharding.__file__))}
+
+SUITE = """
+import time
+import pytest
+
+
+def test_slow():
+    time.sleep(0.3)
+
+
+@pytest.mark.parametrize("n", range(4))
+def test_fast(n):
+    pass
+
+
+class TestGroup:
+    def test_one(self):
+        pass
+"""
+
+
+def test_tests_are_packed_by_duration():
+    ids = ["t.py::a", "t.py::b", "t.py::c", "t.py::d", "t.py::new"]
+    known = {("t", "a"): 10, ("t", "b"): 6, ("t", "c"): 4, ("t", "d"): 1}
+    shards = sharding.pack(ids, known, 2)
+    assert shards == [["t.py::a", "t.py::c"], ["t.py::b", "t.py::d", "t.py::new"]]
+    assert sorted(sum(sharding.pack(ids, {}, 3), [])) == sorted(ids)
+
+
+def test_junit_keys_match_pytest():
+    assert sharding.junit_key("tests/test_a.py::TestX::test_b[1-a/b]") == (
+        "tests.test_a.TestX",
+        "test_b[1-a/b]",
+    )
+
+
+def test_sharded_job_runs_all_tests_once(tmp_path, mock_pipeline):
+    (tmp_path / "test_suite.py").write_text(SUITE)
+    command = f"{sys.executable} -m pytest -p no:cacheprovider test_suite.py"
+    for _ in range(2):
+        pipeline = mock_pipeline(
+            executor=executors.Subprocess(working_dir=tmp_path, log_dir=tmp_path),
+            history_path=None,
+        )
+        with pipeline as p:
+            p.sharded_job(
+                "tests", command, shards=3, junit_dir=tmp_path / "junit", env=ENV
+            )
+            p.job("after", "echo after", depends_on=["tests"])
+        assert pipeline.jobs["after"].status == Status.PASSED
+    merged = sharding.durations(tmp_path / "junit" / "tests.xml")
+    assert len(merged) == 6
+    commands = [pipeline.jobs[f"tests-{i}"].command for i in range(1, 4)]
+    # The slow test gets a shard of it's own once it's duration is known
+    selected = [
+        (tmp_path / sharding.SHARD_DIR / f"tests-{i}.txt").read_text().split()
+        for i in range(1, 4)
+    ]
+    assert len(set(sum(selected, []))) == sum(len(ids) for ids in selected) == 6
+    assert ["test_suite.py::test_slow"] in selected
+    assert all("--deselect" not in c for c in commands)
+    assert "tests: 6" in pipeline.jobs["tests"].run_state.logs
+
+
+def test_plan_fails_without_collected_ids(tmp_path, mock_pipeline):
+    (tmp_path / "test_suite.py").write_text(SUITE)
+    command = f"{sys.executable} -m pytest -p no:cacheprovider -q test_suite.py"
+    pipeline = mock_pipeline(
+        executor=executors.Subprocess(working_dir=tmp_path, log_dir=tmp_path),
+    )
+    with pipeline as p:
+        p.sharded_job("tests", command, shards=2, junit_dir=tmp_path / "junit")
+    assert pipeline.jobs["tests-collect"].status == Status.PASSED
+    assert pipeline.jobs["tests-plan"].status == Status.FAILED
+    assert pipeline.jobs["tests-1"].status != Status.PASSED